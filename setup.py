@@ -16,6 +16,7 @@ import adl2pydm as package
 __entry_points__  = {
     'console_scripts': [
         'adl2pydm = adl2pydm.cli:main',
+        'adl2pydm-rules = adl2pydm.rule_benchmark:main',
         ],
     #'gui_scripts': [],
 }
@@ -31,27 +31,123 @@ Other blocks are used to provide configuration for their
 parent GUI widget.
 """
 
+import array
 from collections import namedtuple, OrderedDict
+import hashlib
+import itertools
 import logging
+import mmap
+import operator
 import os
+import re
+import sys
+import types
 
 from . import symbols
 
 
 logger = logging.getLogger(__name__)
 
-"""a color used in MEDM"""
-Color = namedtuple('Color', 'r g b')
+class Color(namedtuple('Color', 'r g b')):
+    """a color used in MEDM"""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # unpickled colors are shared, too
+        return (sharedColor, tuple(self))
+
 
 """MEDM's object block contains the widget geometry"""
 Geometry = namedtuple('Geometry', 'x y width height')
 
-"""MEDM's points item: points = [Point]"""
+"""MEDM's points item: points = PointList of Point"""
 Point = namedtuple('Point', 'x y')
 
 # Internally the angles are specified in integer 1/64-degree units.
 MEDM_DEGREE_UNITS = 64.0
 
+ADL_FILE_ENCODING = "utf-8"
+
+# assignment values up to this length (numbers, enumerations, ...)
+# are interned, longer values (such as PV names) are not
+INTERN_VALUE_LENGTH = 16
+
+# version of the parsed structures (such as cached screens),
+# increase when they change
+PARSER_VERSION = 7
+
+# parallel parsing: fewest lines of widget blocks given to each worker
+PARALLEL_CHUNK_LINES = 5000
+
+# the coordinates in a MEDM points block: (x,y)
+POINT_COORDINATE_PATTERN = re.compile(r"-?\d+")
+
+# entry point group for packages that provide MEDM widget parsers
+MEDM_WIDGET_ENTRY_POINTS = "adl2pydm.medm_widgets"
+
+# blocks within a widget that are tokenized by the lazy parser,
+# any other blocks are decoded on first access to the widget contents
+LAZY_WIDGET_BLOCKS = ("object", "children")
+
+# blocks that describe the screen (not widgets)
+SCREEN_HEADER_BLOCKS = ("file", "color map", "display")
+
+# sub-blocks (symbol or start of symbol) decoded by the widget parsers,
+# the structured parser does not stash them in the widget contents
+DECODED_SUB_BLOCKS = (
+    "basic attribute", "children", "command[", "control", "display[",
+    "dynamic attribute", "limits", "monitor", "object", "param",
+    "pen[", "plotcom", "points", "trace[", "x_axis", "y1_axis", "y2_axis",
+    )
+
+# one line of a byte buffer, the last group matched identifies its type:
+#   1: start of block (symbol), 2: end of block,
+#   3 & 4: assignment (key, value), 5: value
+_WS = rb"[ \t\r\f\v]*"
+ADL_LINE_PATTERN = re.compile(
+    rb"^" + _WS + rb"(?:"
+    rb"(.*?) \{" + _WS + rb"$"
+    rb"|(.*\})" + _WS + rb"$"
+    rb"|([^=\n]*?)" + _WS + rb"=" + _WS + rb"(.*?)" + _WS + rb"$"
+    rb"|(.*?)" + _WS + rb"$"
+    rb")",
+    re.M)
+
+# brace that ends a line: start (``symbol {``) or end of a block
+ADL_BLOCK_EDGE_PATTERN = re.compile(rb"[{}]" + _WS + rb"$", re.M)
+
+
+_shared_colors = {}         # (r, g, b): Color
+_shared_color_tables = {}   # fingerprint: tuple of Color
+
+
+def sharedColor(r, g, b):
+    """the (process-wide) shared Color with these values"""
+    key = (r, g, b)
+    color = _shared_colors.get(key)
+    if color is None:
+        color = _shared_colors.setdefault(key, Color(r, g, b))
+    return color
+
+
+def sharedColorTable(hexcolors):
+    """
+    the (process-wide) shared color table for a list of ``RRGGBB`` hex strings
+
+    Returns a tuple of shared ``Color``.  Identical tables (most
+    screens use the same color map) are recognized by their hex text.
+    """
+    fingerprint = " ".join(hexcolors).lower()
+    clut = _shared_color_tables.get(fingerprint)
+    if clut is None:
+        clut = tuple(
+            sharedColor(int(rgb[:2], 16), int(rgb[2:4], 16), int(rgb[4:6], 16))
+            for rgb in hexcolors
+        )
+        clut = _shared_color_tables.setdefault(fingerprint, clut)
+    return clut
+
 
 def deg_to_adl(deg):
     """
@@ -93,55 +189,626 @@ def adl_to_deg(deg):
     return float(deg) / MEDM_DEGREE_UNITS
 
 
+class WidgetNode(namedtuple('WidgetNode', 'depth parent widget geometry')):
+    """
+    one widget of the widget tree, from :func:`walkWidgets`
+
+    depth : int
+        0 for the widgets at the top of the walk
+    parent : obj
+        widget that contains this one (such as a composite) or None
+    widget : obj
+        the widget
+    geometry : Geometry
+        absolute geometry of the widget (as in MEDM)
+    """
+
+    __slots__ = ()
+
+    def relativeGeometry(self):
+        """geometry relative to the parent widget (as in PyDM)"""
+        parent = self.parent
+        if parent is None or isinstance(parent, MedmMainWidget) or self.geometry is None:
+            return self.geometry
+        return self.geometry._replace(
+            x=self.geometry.x - parent.geometry.x,
+            y=self.geometry.y - parent.geometry.y)
+
+
+class PointList(object):
+    """
+    sequence of Point, kept as a packed integer array
+
+    The coordinates are stored in ``xy`` as ``array('i')``:
+    x0, y0, x1, y1, ...  Items are created as ``Point`` when
+    accessed.  Use the bulk operations (``translated()``,
+    ``strings()``) rather than a loop over the points.
+    """
+
+    __slots__ = ("xy",)
+
+    def __init__(self, xy=()):
+        if not isinstance(xy, array.array):
+            xy = array.array("i", xy)
+        if len(xy) % 2 != 0:
+            raise ValueError(f"odd number of point coordinates: {len(xy)}")
+        self.xy = xy
+
+    @classmethod
+    def fromText(cls, text):
+        """points from text such as ``(1,2) (3,4)``"""
+        return cls(map(int, POINT_COORDINATE_PATTERN.findall(text)))
+
+    @property
+    def xs(self):
+        """array of the x coordinates"""
+        return self.xy[0::2]
+
+    @property
+    def ys(self):
+        """array of the y coordinates"""
+        return self.xy[1::2]
+
+    def __len__(self):
+        return len(self.xy) // 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return PointList(self.xy[2*start:2*max(start, stop)])
+            return PointList([c for i in range(start, stop, step) for c in self[i]])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PointList index out of range")
+        return Point(self.xy[2*index], self.xy[2*index+1])
+
+    def __iter__(self):
+        return map(Point, self.xs, self.ys)
+
+    def __eq__(self, other):
+        if isinstance(other, PointList):
+            return self.xy == other.xy
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"PointList({list(self)})"
+
+    def translated(self, dx, dy):
+        """new PointList with all points moved by (dx, dy)"""
+        offsets = itertools.cycle((dx, dy))
+        return PointList(array.array("i", map(operator.add, self.xy, offsets)))
+
+    def strings(self, fmt="%d, %d"):
+        """list of the points, each formatted (as ``fmt % (x, y)``)"""
+        if len(self) == 0 or "\n" in fmt:
+            return list(map(fmt.__mod__, zip(self.xs, self.ys)))
+        # format all the points at once
+        text = ((fmt + "\n") * len(self)) % tuple(self.xy)
+        return text.split("\n")[:-1]
+
+
 class Block(object):
     """ADL file block structure"""
+
+    __slots__ = (
+        "start", "end", "level", "symbol",
+        "assignments", "blocks", "values", "index",
+        "buf", "base", "span",
+        )
     
     def __init__(self, start, end, level, symbol):
         self.start = start
         self.end = end
         self.level = level
         self.symbol = symbol
+        self.assignments = {}
+        self.blocks = []        # nested blocks, in order of appearance
+        self.values = []        # lines that are neither block nor assignment
+        self.index = {}         # symbol -> [nested blocks with that symbol]
+        self.buf = None         # buffer from which this block was parsed
+        self.base = 0           # line number of buf[0]
+        self.span = None        # byte offsets of the contents (byte buffers only)
     
     def __str__(self):
         fmt = "Block: %d:%d:%d %s"
         return fmt % (self.level, self.start, self.end, str(self.symbol))
 
+    def addBlock(self, block):
+        """append a nested block and index it by symbol"""
+        self.blocks.append(block)
+        self.index.setdefault(block.symbol, []).append(block)
+
+    def getNamedBlock(self, symbol):
+        """return the first nested block with this symbol (or None)"""
+        blocks = self.index.get(symbol)
+        if blocks is not None:
+            return blocks[0]
+
+    def getNamedBlocks(self, symbol):
+        """return all nested blocks with this symbol"""
+        return self.index.get(symbol, [])
+
+    def getText(self):
+        """raw text of the block contents (between the braces)"""
+        if self.span is None:
+            return "".join(self.buf[self.start+1-self.base:self.end-self.base])
+        text = str(self.buf[self.span[0]:self.span[1]], ADL_FILE_ENCODING)
+        return text.replace("\r\n", "\n")
+
+
+def blockData(block):
+    """
+    decoded contents of a block (no raw text)
+
+    The values (list) of a block of values, such as ``points``,
+    otherwise a dictionary of the assignments and (by symbol)
+    the data of the nested blocks.
+    """
+    if len(block.values) > 0 and len(block.assignments) == 0 and len(block.blocks) == 0:
+        return list(block.values)
+    data = dict(block.assignments)
+    for b in block.blocks:
+        data[b.symbol] = blockData(b)
+    return data
+
+
+def _isTokenizedLazily(parent, symbol):
+    """is this block (within ``parent``) tokenized by the lazy tokenizers?"""
+    return parent not in symbols.adl_widgets or symbol in LAZY_WIDGET_BLOCKS
+
+
+def parseBlockTree(buf, lazy=False, select=None):
+    """
+    read the buffer (list of text lines) ONCE into a tree of blocks
+
+    Each line is one of:
+
+    * start of a block: ``symbol {``
+    * end of a block: ``}``
+    * an assignment: ``symbol=value``
+    * a value (such as a point or a list of colors)
+
+    Returns the root block (level -1) which contains
+    the blocks found at the top level of the buffer.
+    Line numbers (``start`` & ``end``) are indices into ``buf``.
+
+    With ``lazy=True``, the blocks nested in a widget block are
+    skipped, except those in ``LAZY_WIDGET_BLOCKS``.
+    Otherwise, only blocks for which ``select(parent, symbol)``
+    is true are tokenized (if ``select`` is given).  ``parent``
+    is the symbol of the enclosing block (None at the top level).
+    Lines of skipped blocks are only scanned for their end.
+    """
+    if lazy:
+        select = _isTokenizedLazily
+    root = Block(-1, len(buf), -1, None)
+    root.buf = buf
+    stack = [root]
+    node = root
+    skip = 0        # nesting level within a skipped block
+    for line, text in enumerate(buf):
+        stripped = text.rstrip()
+        if skip > 0:
+            if stripped.endswith(" {"):
+                skip += 1
+            elif stripped.endswith("}"):
+                skip -= 1
+            continue
+        if stripped.endswith(" {"):
+            symbol = sys.intern(text.strip()[:-2].strip('"'))
+            if select is not None and not select(node.symbol, symbol):
+                skip = 1
+                continue
+            block = Block(line, None, len(stack)-1, symbol)
+            block.buf = buf
+            node.addBlock(block)
+            stack.append(block)
+            node = block
+        elif stripped.endswith("}"):
+            if node is root:
+                logger.warning("line %d: unexpected '}'" % (line+1))
+                continue
+            node.end = line
+            stack.pop()
+            node = stack[-1]
+        else:
+            p = text.find("=")
+            if p > 0:
+                key = sys.intern(text[:p].strip().strip('"'))
+                value = text[p+1:].strip().strip('"')
+                if len(value) <= INTERN_VALUE_LENGTH:
+                    value = sys.intern(value)
+                # TODO: look for parentheses
+                node.assignments[key] = value
+            elif len(stripped) > 0:
+                node.values.append(stripped.strip())
+    if node is not root:
+        logger.warning("block '%s' (line %d) is not closed" % (node.symbol, node.start+1))
+    return root
+
+
+def iterBlockTree(lines, lazy=False, select=None):
+    """
+    read lines and yield each top-level block as soon as it is closed
+
+    Same tree as :func:`parseBlockTree` but ``lines`` may be any
+    iterable of text lines (such as an open file) and only the lines
+    of the current top-level block are kept in memory.
+    Line numbers (``start`` & ``end``) are 0-based, counted from the first line.
+    ``lazy`` and ``select`` are as in :func:`parseBlockTree`.
+    """
+    if lazy:
+        select = _isTokenizedLazily
+    chunk = []      # lines of the current top-level block
+    base = 0        # line number of chunk[0]
+    stack = []
+    node = None
+    skip = 0        # nesting level within a skipped block
+    for line, text in enumerate(lines):
+        if node is not None:
+            chunk.append(text)
+        stripped = text.rstrip()
+        if skip > 0:
+            if stripped.endswith(" {"):
+                skip += 1
+            elif stripped.endswith("}"):
+                skip -= 1
+            continue
+        if stripped.endswith(" {"):
+            symbol = sys.intern(text.strip()[:-2].strip('"'))
+            parent = None if node is None else node.symbol
+            if select is not None and not select(parent, symbol):
+                skip = 1
+                continue
+            block = Block(line, None, len(stack), symbol)
+            if node is None:
+                chunk = [text]
+                base = line
+            else:
+                node.addBlock(block)
+            block.buf = chunk
+            block.base = base
+            stack.append(block)
+            node = block
+        elif stripped.endswith("}"):
+            if node is None:
+                logger.warning("line %d: unexpected '}'" % (line+1))
+                continue
+            node.end = line
+            stack.pop()
+            if len(stack) == 0:
+                yield node
+                node = None
+                chunk = []
+            else:
+                node = stack[-1]
+        elif node is None:
+            if len(stripped) > 0:
+                logger.debug("line %d: ignored outside of any block" % (line+1))
+        else:
+            p = text.find("=")
+            if p > 0:
+                key = sys.intern(text[:p].strip().strip('"'))
+                value = text[p+1:].strip().strip('"')
+                if len(value) <= INTERN_VALUE_LENGTH:
+                    value = sys.intern(value)
+                node.assignments[key] = value
+            elif len(stripped) > 0:
+                node.values.append(stripped.strip())
+    if node is not None:
+        logger.warning("block '%s' (line %d) is not closed" % (node.symbol, node.start+1))
+
+
+def parseBlockTreeBytes(data, lazy=False, select=None):
+    """
+    read a byte buffer (bytes or mmap) ONCE into a tree of blocks
+
+    Same as :func:`parseBlockTree` but the lines are never copied
+    out of the buffer.  Lines are located (by byte offsets) with
+    ``ADL_LINE_PATTERN`` over a ``memoryview`` of the buffer and
+    only the symbols and values kept in the tree are decoded.
+    Line numbers (``start`` & ``end``) are 0-based, ``lazy``
+    and ``select`` are as in :func:`parseBlockTree`.
+    """
+    if lazy:
+        select = _isTokenizedLazily
+    mv = data if isinstance(data, memoryview) else memoryview(data)
+    root = Block(-1, None, -1, None)
+    root.buf = mv
+    stack = [root]
+    node = root
+    line = -1
+    skip = 0        # nesting level within a skipped block
+    for line, match in enumerate(ADL_LINE_PATTERN.finditer(mv)):
+        kind = match.lastindex
+        if skip > 0:
+            if kind == 1:
+                skip += 1
+            elif kind == 2:
+                skip -= 1
+            continue
+        if kind == 1:
+            symbol = sys.intern(str(match.group(1), ADL_FILE_ENCODING).strip('"'))
+            if select is not None and not select(node.symbol, symbol):
+                skip = 1
+                continue
+            block = Block(line, None, len(stack)-1, symbol)
+            block.buf = mv
+            block.span = [match.end()+1, None]
+            node.addBlock(block)
+            stack.append(block)
+            node = block
+        elif kind == 2:
+            if node is root:
+                logger.warning("line %d: unexpected '}'" % (line+1))
+                continue
+            node.end = line
+            node.span[1] = match.start()
+            stack.pop()
+            node = stack[-1]
+        elif kind == 4:
+            key = sys.intern(str(match.group(3), ADL_FILE_ENCODING).strip('"'))
+            value = str(match.group(4), ADL_FILE_ENCODING).strip('"')
+            if len(value) <= INTERN_VALUE_LENGTH:
+                value = sys.intern(value)
+            node.assignments[key] = value
+        elif match.end(5) > match.start(5):
+            node.values.append(str(match.group(5), ADL_FILE_ENCODING))
+    root.end = line + 1
+    if node is not root:
+        logger.warning("block '%s' (line %d) is not closed" % (node.symbol, node.start+1))
+    return root
+
+
+def _deferredAttribute(name):
+    """
+    widget attribute decoded from the widget's block on first access
+
+    The value is kept in the slot ``_<name>``.  Until the
+    block deferred by the lazy parser has been parsed,
+    getting or setting the attribute parses it first.
+    """
+    slot = "_" + name
+
+    def fget(self):
+        if self._pending is not None:
+            self.parsePendingBlock()
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            msg = f"'{self.__class__.__name__}' object has no attribute '{name}'"
+            raise AttributeError(msg) from None
+
+    def fset(self, value):
+        if self._pending is not None:
+            self.parsePendingBlock()
+        setattr(self, slot, value)
+
+    return property(fget, fset)
+
+
+def locateTopLevelBlocks(buf):
+    """
+    find the top-level blocks in the buffer (list of text lines)
+
+    Returns a list of (symbol, start, end) line numbers (indices
+    into ``buf``).  Nothing within the blocks is parsed.
+    """
+    ranges = []
+    depth = 0
+    symbol = start = None
+    for line, text in enumerate(buf):
+        stripped = text.rstrip()
+        if stripped.endswith(" {"):
+            if depth == 0:
+                symbol = text.strip()[:-2].strip('"')
+                start = line
+            depth += 1
+        elif stripped.endswith("}") and depth > 0:
+            depth -= 1
+            if depth == 0:
+                ranges.append((symbol, start, line))
+    if depth > 0:
+        ranges.append((symbol, start, len(buf)-1))     # not closed
+    return ranges
+
+
+def _typeName(kind):
+    """describe a type of ``symbols.adl_attribute_types``"""
+    if isinstance(kind, tuple):
+        return "one of: " + ", ".join(kind)
+    return kind.__name__
+
+
+BlockFingerprint = namedtuple('BlockFingerprint', 'symbol digest start end line')
+"""
+top-level block of a .adl file: symbol, hash of the block,
+range of bytes ``[start, end)`` and line (0-based) of the block start
+"""
+
+
+def fingerprintTopLevelBlocks(data):
+    """
+    list of the ``BlockFingerprint`` of each top-level block in ``data`` (bytes)
+
+    Nothing within the blocks is parsed.
+    """
+    fingerprints = []
+    depth = 0
+    line = pos = 0
+    symbol = start = None
+
+    def fingerprint(end):
+        digest = hashlib.blake2b(memoryview(data)[start:end], digest_size=16)
+        return BlockFingerprint(symbol, digest.digest(), start, end, line)
+
+    for match in ADL_BLOCK_EDGE_PATTERN.finditer(data):
+        brace = match.start()
+        if data[brace] == 0x7b:     # "{"
+            if data[brace-1:brace] != b" ":
+                continue        # not the start of a block
+            if depth == 0:
+                start = data.rfind(b"\n", 0, brace) + 1
+                line += data.count(b"\n", pos, start)
+                pos = start
+                text = str(data[start:brace], ADL_FILE_ENCODING)
+                symbol = sys.intern(text.strip().strip('"'))
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                fingerprints.append(fingerprint(match.end()))
+    if depth > 0:
+        fingerprints.append(fingerprint(len(data)))     # not closed
+    return fingerprints
+
+
+SelectedBlocks = namedtuple('SelectedBlocks', 'headers widgets')
+"""blocks found by selectAdlBlocks()"""
+
+
+def blockSelector(widgets=None, blocks=None, headers=SCREEN_HEADER_BLOCKS):
+    """
+    ``select`` function of the tokenizers, see :func:`selectAdlBlocks`
+
+    Composites (and their children) are always tokenized
+    to find the widgets of interest within them.
+    """
+    if blocks is not None:
+        blocks = tuple(blocks)
+
+    def select(parent, symbol):
+        if parent is None or parent == "children":
+            if symbol in symbols.adl_widgets:
+                return widgets is None or symbol in widgets or symbol == "composite"
+            return parent is None and symbol in headers
+        if parent in symbols.adl_widgets:
+            if parent == "composite" and symbol == "children":
+                return True
+            if widgets is not None and parent not in widgets:
+                return False
+            return blocks is None or symbol.startswith(blocks)
+        return True     # within a selected block
+
+    return select
+
+
+def selectAdlBlocks(buf, widgets=None, blocks=None, headers=SCREEN_HEADER_BLOCKS):
+    """
+    tokenize only the blocks of interest, no widgets are created
+
+    PARAMETERS
+
+    buf
+        *[str]* or *bytes* :
+        text lines or byte buffer of a .adl file
+        (any iterable of text lines, such as an open file,
+        if no widgets are of interest)
+    widgets
+        *[str]* :
+        symbols of the widgets of interest (default: all)
+    blocks
+        *[str]* :
+        symbols (or the start of symbols, such as ``"display["``)
+        of the sub-blocks of interest in these widgets
+        (default: all)
+    headers
+        *[str]* :
+        symbols of the screen blocks of interest
+        (default: ``SCREEN_HEADER_BLOCKS``)
+
+    All other blocks are skipped by the tokenizer.
+    The assignments of a widget are always kept.
+
+    Returns ``SelectedBlocks``: ``headers`` is a dictionary of the
+    screen blocks (by symbol) and ``widgets`` is a list of the
+    ``(line, block)`` of the widgets of interest, in the order of the
+    file and including those within composites.  ``line`` is the
+    line number (starting at 1) of the widget in the file.
+    """
+    select = blockSelector(widgets, blocks, headers)
+    found = {}
+    if isinstance(buf, (bytes, bytearray, memoryview, mmap.mmap)):
+        root = parseBlockTreeBytes(buf, select=select)
+    elif widgets is not None and len(widgets) == 0:
+        # only the screen blocks: stop reading after the last one
+        for block in iterBlockTree(buf, select=select):
+            found.setdefault(block.symbol, block)
+            if len(found) == len(set(headers)):
+                break
+        return SelectedBlocks(found, [])
+    else:
+        root = parseBlockTree(buf, select=select)
+
+    for block in root.blocks:
+        if block.symbol in headers:
+            found.setdefault(block.symbol, block)
+
+    selected = []
+    stack = [iter(root.blocks)]
+    while len(stack) > 0:
+        block = next(stack[-1], None)
+        if block is None:
+            stack.pop()
+            continue
+        if block.symbol not in symbols.adl_widgets:
+            continue
+        if widgets is None or block.symbol in widgets:
+            selected.append((block.start + 1, block))
+        children = block.getNamedBlock("children")
+        if children is not None:
+            stack.append(iter(children.blocks))
+    return SelectedBlocks(found, selected)
+
 
 class MedmBaseWidget(object):
+    """
+    base class of the MEDM widgets
+
+    Widgets use ``__slots__`` (no per-instance ``__dict__``) since
+    a screen may have thousands of them.  Subclasses that add
+    attributes list them in their own ``__slots__``.
+    Optional attributes (``contents``, ``points``) are
+    only set when parsed, test for them with ``hasattr()``.
+
+    A lazy parser (``MedmMainWidget(lazy=True)``) only records the
+    ``geometry`` (and the children of a composite) of each widget.
+    The other attributes are decoded on first access.
+
+    By default, the raw text of sub-blocks not otherwise decoded
+    is kept in ``contents``.  A structured parser
+    (``MedmMainWidget(structured=True)``) keeps no raw text:
+    such sub-blocks are kept as decoded data (see :func:`blockData`).
+    """
+
+    __slots__ = (
+        "_background_color", "_color", "geometry", "line_offset",
+        "symbol", "_title", "main", "_contents", "_points", "_pending",
+        )
+
+    background_color = _deferredAttribute("background_color")
+    color = _deferredAttribute("color")
+    contents = _deferredAttribute("contents")
+    points = _deferredAttribute("points")
+    title = _deferredAttribute("title")
+
+    lazy = False    # parse widget blocks on first access?
+    structured = False  # sub-blocks as decoded data (no raw text)?
     
     def __init__(self):
+        self._pending = None    # widget block, not parsed yet
         self.background_color = None
         self.color = None
         self.geometry = None
         self.line_offset = 0
         self.symbol = None
         self.title = None
-        self.medm_widget_handlers = {
-            "arc" : MedmArcWidget,
-            "bar" : MedmBarWidget,
-            "byte" : MedmByteWidget,
-            "cartesian plot" : MedmCartesianPlotWidget,
-            "choice button" : MedmChoiceButtonWidget,
-            "composite" : MedmCompositeWidget,
-            "embedded display" : MedmEmbeddedDisplayWidget,
-            "image" : MedmImageWidget,
-            "indicator" : MedmIndicatorWidget,
-            "menu" : MedmMenuWidget,
-            "message button" : MedmMessageButtonWidget,
-            "meter" : MedmMeterWidget,
-            "oval" : MedmOvalWidget,
-            "polygon" : MedmPolygonWidget,
-            "polyline" : MedmPolylineWidget,
-            "rectangle" : MedmRectangleWidget,
-            "related display" : MedmRelatedDisplayWidget,
-            "shell command" : MedmShellCommandWidget,
-            "strip chart" : MedmStripChartWidget,
-            "text" : MedmTextWidget,
-            "text entry" : MedmTextEntryWidget,
-            "text update" : MedmTextUpdateWidget,
-            "valuator" : MedmValuatorWidget,
-            "wheel switch" : MedmWheelSwitchWidget,
-            }
     
     def __str__(self):
         fmt = "Widget(%s)"
@@ -153,13 +820,6 @@ class MedmBaseWidget(object):
         args.append("line=%d" % self.line_offset)
         return fmt % ", ".join(args)
     
-    def getNamedBlock(self, block_name, blocks):
-        """
-        """
-        block = [b for b in blocks if b.symbol == block_name]
-        if len(block) > 0:
-            return block[0]
-
     def locateAssignments(self, buf):
         """
         identify and record the line number of all assignments in the buffer at this nesting level
@@ -180,44 +840,64 @@ class MedmBaseWidget(object):
                 assignments[key] = value
         return assignments
     
-    def locateBlocks(self, buf):
+    def parseAdlBuffer(self, buf):
         """
-        identify and record the start and end of all blocks at this nesting level in the buffer
+        parse the buffer in a single pass
+
+        The buffer is either a list of text lines or a byte buffer
+        (bytes, bytearray, memoryview, or mmap).
         """
-        blocks = []
-        level = 0
-        nesting = level
-        for line, text in enumerate(buf):
-            if text.rstrip().endswith(" {"):
-                if nesting == level:
-                    symbol = text.strip()[:-2]
-                    block = Block(line, None, nesting, symbol.strip('"'))
-                nesting += 1
-            elif text.rstrip().endswith("}"):
-                nesting -= 1
-                if nesting == level:
-                    block.end = line
-                    blocks.append(block)
-        return blocks
-    
-    def parseAdlBuffer(self, buf):              # lgtm [py/similar-function]
+        if isinstance(buf, (bytes, bytearray, memoryview, mmap.mmap)):
+            if self.lazy:
+                # deferred blocks refer to the buffer until parsed
+                return self.parseAdlBlock(parseBlockTreeBytes(buf, lazy=True))
+            with memoryview(buf) as mv:
+                return self.parseAdlBlock(parseBlockTreeBytes(mv))
+        return self.parseAdlBlock(parseBlockTree(buf, lazy=self.lazy))
+
+    def deferAdlBlock(self, block):
+        """
+        record the geometry now, parse the rest of the block on first access
+
+        ``block`` was read by a lazy tokenizer.
+        """
+        obj = block.getNamedBlock("object")
+        if obj is not None:
+            self.geometry = self.parseObjectAssignments(obj.assignments)
+        self._pending = block
+
+    def parsePendingBlock(self):
+        """parse the block deferred by ``deferAdlBlock()`` (if any)"""
+        block, self._pending = self._pending, None
+        if block is not None:
+            self.parseAdlBlock(self.retokenizeBlock(block))
+
+    def retokenizeBlock(self, block):
+        """
+        tokenize all the contents of a block read by a lazy tokenizer
+
+        Returns a block (level -1) with these contents.
+        """
+        if block.span is None:
+            return parseBlockTree(block.buf[block.start+1-block.base:block.end-block.base])
+        return parseBlockTreeBytes(block.buf[block.span[0]:block.span[1]])
+
+    def parseAdlBlock(self, block):              # lgtm [py/similar-function]
         """generic handling, override as needed"""
-        assignments = self.locateAssignments(buf)
-        blocks = self.locateBlocks(buf)
+        assignments = dict(block.assignments)
+        blocks = list(block.blocks)
 
         # assign certain items in named attributes
         assignments = self.parseColorAssignments(assignments)
+        assignments = self.decodeAssignments(assignments, self.symbol)
             
         # all widget blocks have an "object"
-        block = self.getNamedBlock("object", blocks)
-        if block is not None:
-            self.geometry = self.parseObjectBlock(buf[block.start+1:block.end])
+        obj = block.getNamedBlock("object")
+        if obj is not None:
+            self.geometry = self.parseObjectAssignments(obj.assignments)
             
             # remove that block
-            for i, b in enumerate(blocks):
-                if b.symbol == "object":
-                    break
-            del blocks[i]
+            blocks.remove(obj)
         
         reservedLabels = "channel limits outline none".split()
         reservedLabels.append("no decorations")
@@ -227,49 +907,74 @@ class MedmBaseWidget(object):
             logger.debug(f"label={label}")
 
         # stash remaining contents
-        contents = dict(**assignments)
-        for block in blocks:            # TODO: improve
-            contents[block.symbol] = "".join(buf[block.start+1:block.end])
-        self.contents = contents
+        contents = dict(assignments)
+        if self.main.structured:
+            for b in blocks:
+                if not b.symbol.startswith(DECODED_SUB_BLOCKS):
+                    contents[b.symbol] = blockData(b)
+            self.contents = contents
+
+            b = block.getNamedBlock("limits")
+            if b is not None:
+                aa = self.decodeAssignments(dict(b.assignments), "limits")
+                self.contents.update(aa)
+        else:
+            for b in blocks:            # TODO: improve
+                contents[b.symbol] = b.getText()
+            self.contents = contents
 
         limits = self.contents.get("limits", "").strip()
         if len(limits) > 0:
+            aa = {}
             for line in self.contents.pop("limits").splitlines():
                 k, v = line.strip().split("=")
-                self.contents[k] = v.strip('"')
+                aa[k] = v.strip('"')
+            self.contents.update(self.decodeAssignments(aa, "limits"))
 
         for symbol in ("basic attribute", "dynamic attribute", "control", "monitor", "param"):
-            block = self.getNamedBlock(symbol, blocks)
-            if block is not None:
-                aa = self.locateAssignments(buf[block.start+1:block.end])
-                aa = self.parseColorAssignments(aa)
-                self.contents[symbol] = aa
+            b = block.getNamedBlock(symbol)
+            if b is not None:
+                aa = self.parseColorAssignments(dict(b.assignments))
+                self.contents[symbol] = self.decodeAssignments(aa, symbol)
 
         for angle_name in "begin path".split():
             if angle_name in self.contents:
                 angle = self.contents.pop(angle_name)
                 self.contents[angle_name + "Angle"] = adl_to_deg(angle)
 
-        block = self.getNamedBlock("points", blocks)
-        if block is not None:
-            points = []
-            for pair in buf[block.start+1:block.end]:
-                x, y = map(int, pair.replace("(", "").replace(")", "").split(","))
-                points.append(Point(x, y))
-            self.points = points
-            if "points" in self.contents:
-                del self.contents["points"]
+        b = block.getNamedBlock("points")
+        if b is not None:
+            self.points = PointList.fromText(" ".join(b.values))
+            self.contents.pop("points", None)
 
         return assignments, blocks
     
-    def parseChildren(self, main, blocks, buf):
+    def iterWidgets(self, select=None, prune=None):
+        """walk the widgets contained by this one, see :func:`walkWidgets`"""
+        return walkWidgets(getattr(self, "widgets", []), self, select, prune)
+
+    def parseChildren(self, main, blocks, first_line=0):
+        """
+        create the widgets described by the blocks
+
+        ``first_line`` is the index of the first line of the buffer
+        (in the tree) to which line numbers of these blocks are relative
+        """
         for block in blocks:
             if block.symbol in symbols.adl_widgets:
-                logger.debug("(#%d) %s" % (self.line_offset+block.start, block.symbol))
-                handler = self.medm_widget_handlers.get(block.symbol, MedmGenericWidget)
-                widget = handler(self.line_offset+block.start, main, block.symbol)
-                widget.parseAdlBuffer(buf[block.start+1:block.end])
-                self.widgets.append(widget)
+                line = self.line_offset + block.start - first_line
+                self.widgets.append(self.parseWidgetBlock(main, block, line))
+
+    def parseWidgetBlock(self, main, block, line):
+        """create the widget described by the block"""
+        logger.debug("(#%d) %s" % (line, block.symbol))
+        handler = getMedmWidgetHandler(block.symbol) or MedmGenericWidget
+        widget = handler(line, main, block.symbol)
+        if main.lazy:
+            widget.deferAdlBlock(block)
+        else:
+            widget.parseAdlBlock(block)
+        return widget
     
     def parseColorAssignments(self, assignments):
         # assign certain items in named attributes
@@ -289,21 +994,54 @@ class MedmBaseWidget(object):
                 del assignments[k]
         return assignments
     
+    def decodeAssignments(self, assignments, symbol):
+        """
+        decode the values of typed attributes (in place)
+
+        ``symbol`` names the block with these assignments,
+        the types are in ``symbols.adl_attribute_types``.
+        Values that do not decode are reported and removed.
+        """
+        types = symbols.adl_attribute_types.get(symbol)
+        if types is None:
+            return assignments
+        for k, kind in types.items():
+            value = assignments.get(k)
+            if value is None:
+                continue
+            if isinstance(kind, tuple):
+                ok = value in kind
+            else:
+                try:
+                    value = kind(value)
+                    ok = True
+                except ValueError:
+                    ok = False
+            if ok:
+                assignments[k] = value
+            else:
+                logger.warning(
+                    f"{self.main.given_filename}:{self.line_offset}:"
+                    f" {self.symbol} widget: ignoring {symbol}"
+                    f" {k}=\"{value}\" (expected {_typeName(kind)})"
+                )
+                del assignments[k]
+        return assignments
+
     def parseObjectBlock(self, buf):
         """MEDM "object" block defines a Geometry for its parent"""
-        a = self.locateAssignments(buf)
+        return self.parseObjectAssignments(self.locateAssignments(buf))
+
+    def parseObjectAssignments(self, a):
+        """Geometry from the assignments of a MEDM "object" block"""
         arr = map(int, (a["x"], a["y"], a["width"], a["height"]))   # convert to int
         return Geometry(*list(arr))
 
-    def parsePlotcomBlock(self, buf, blocks):
-        block = self.getNamedBlock("plotcom", blocks)
-        if block is not None:
-            self.parseColorAssignments(
-                self.locateAssignments(
-                    buf[block.start+1:block.end]
-                    )
-                )
-            aa = self.locateAssignments(buf[block.start+1:block.end])
+    def parsePlotcomBlock(self, block):
+        plotcom = block.getNamedBlock("plotcom")
+        if plotcom is not None:
+            self.parseColorAssignments(dict(plotcom.assignments))
+            aa = dict(plotcom.assignments)
             for symbol in "clr bclr".split():
                 if symbol in aa:
                     del aa[symbol]
@@ -315,15 +1053,42 @@ class MedmBaseWidget(object):
             if "plotcom" in self.contents:
                 del self.contents["plotcom"]
 
+    def parseIndexedBlocks(self, blocks, prefix):
+        """
+        assignments of blocks such as ``display[n]``, ordered by n
+
+        Removes each of these blocks from ``self.contents``.
+        """
+        rows = {}
+        for block in blocks:
+            if not block.symbol.startswith(prefix):
+                continue
+            self.contents.pop(block.symbol, None)
+            row = block.symbol.replace("[", " ").replace("]", "").split()[-1]
+            rows[row] = dict(block.assignments)
+        
+        def sorter(value):
+            return int(value)
+        return [rows[k] for k in sorted(rows.keys(), key=sorter)]
+
 
 class MedmMainWidget(MedmBaseWidget):
+    """
+    the MEDM screen
+
+    Keeps a ``__dict__`` (no ``__slots__``): the display block
+    assignments are set as attributes of the same name.
+    """
     
-    def __init__(self, given_filename=None):
+    def __init__(self, given_filename=None, lazy=False, structured=False):
         MedmBaseWidget.__init__(self)
+        self.lazy = lazy        # parse widget blocks on first access?
+        self.structured = structured    # sub-blocks as decoded data?
+        self.block_fingerprints = None  # of the top-level blocks, see parseAdlBufferIncrementally()
         self.given_filename = given_filename    # file name as provided
         self.adl_filename = "unknown"   # file name given in the file
         self.adl_version = "unknown"    # file version given in the file
-        self.color_table = []           # TODO: supply a default color table
+        self.color_table = ()           # TODO: supply a default color table
         self.widgets = []
         self.line_offset = 1            # line numbers start at 1
     
@@ -333,95 +1098,342 @@ class MedmMainWidget(MedmBaseWidget):
             msg = "Could not find file: " + fname
             raise ValueError(msg)
         self.given_filename = fname
-        with open(fname, "r") as fp:
+        with open(fname, "r", encoding=ADL_FILE_ENCODING) as fp:
             return fp.readlines()
 
-    def parseAdlBuffer(self, buf):              # lgtm [py/similar-function]
+    def parseAdlFile(self, fname=None, use_mmap=False, executor=None):
+        """
+        read and parse the .adl file
+
+        With ``use_mmap=True``, the file is memory-mapped and parsed
+        directly from the byte buffer (no list of lines is created).
+        A lazy parser keeps the file mapped until the widgets
+        that refer to it are discarded.
+
+        With an ``executor``, the widget blocks are parsed
+        in parallel (see ``parseAdlBufferInParallel()``).
+        The parallel parser works on a list of lines, it cannot
+        be combined with ``use_mmap``.
+        """
+        if use_mmap and executor is not None:
+            raise ValueError("use_mmap and executor cannot be combined")
+        if executor is not None and not self.lazy:
+            return self.parseAdlBufferInParallel(self.getAdlLines(fname), executor)
+        if not use_mmap:
+            return self.parseAdlBuffer(self.getAdlLines(fname))
+
+        fname = fname or self.given_filename
+        if not os.path.exists(fname):
+            msg = "Could not find file: " + fname
+            raise ValueError(msg)
+        self.given_filename = fname
+        with open(fname, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return self.parseAdlBuffer(b"")     # cannot mmap an empty file
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.lazy:
+                return self.parseAdlBuffer(mm)
+            with mm:
+                return self.parseAdlBuffer(mm)
+
+    def iterAdlWidgets(self, source=None):
+        """
+        parse the .adl file, yield each top-level widget when its block is closed
+
+        ``source`` is a file name (default: ``self.given_filename``)
+        or an iterable of text lines (such as an open file).
+        Only the block being parsed is kept in memory.  The widgets
+        yielded are not added to ``self.widgets``.  The file,
+        color map, and display blocks are parsed before the first
+        widget is yielded: widget blocks found before all of them
+        are kept until they are parsed (or the file ends).
+        """
+        if source is None or isinstance(source, str):
+            fname = source or self.given_filename
+            if not os.path.exists(fname):
+                msg = "Could not find file: " + fname
+                raise ValueError(msg)
+            self.given_filename = fname
+            with open(fname, "r", encoding=ADL_FILE_ENCODING) as fp:
+                yield from self.iterAdlWidgets(fp)
+            return
+
         logger.debug("\n"*2)
         logger.debug(self.given_filename)
-        blocks = self.locateBlocks(buf)
-        for block in blocks:
+        xref = self.headerBlockHandlers()
+        headers = {}
+        parsed = []
+
+        def parse_headers(final):
+            for symbol, handler in xref.items():
+                if symbol in parsed or symbol not in headers:
+                    continue
+                if symbol == "display" and "color map" not in parsed and not final:
+                    continue    # colors in the display refer to the color map
+                logger.debug("Processing %s block" % symbol)
+                handler(headers[symbol])
+                parsed.append(symbol)
+
+        def parse_widgets():
+            parse_headers(True)
+            for block in pending:
+                line = self.line_offset + block.start
+                yield self.parseWidgetBlock(self, block, line)
+            pending.clear()
+
+        pending = []    # widget blocks found before all header blocks
+        for block in iterBlockTree(source, lazy=self.lazy):
             logger.debug(str(block))
-        
-        xref = OrderedDict([
+            if block.symbol in xref:
+                headers[block.symbol] = headers.get(block.symbol, block)
+                parse_headers(False)
+            elif block.symbol in symbols.adl_widgets:
+                pending.append(block)
+                if len(headers) == len(xref):
+                    yield from parse_widgets()
+
+        yield from parse_widgets()
+        for symbol in xref.keys():
+            if symbol not in headers:
+                logger.warning("Did not find %s block" % symbol)
+
+    def parseAdlBufferInParallel(self, buf, executor, chunk_lines=PARALLEL_CHUNK_LINES):
+        """
+        parse the buffer (list of text lines), widget blocks in parallel
+
+        The top-level widget blocks are parsed independently (given
+        the color table) in consecutive chunks of at least
+        ``chunk_lines`` lines.  Each chunk is parsed by ``executor``
+        (such as a ``concurrent.futures.ProcessPoolExecutor``).
+        The widgets are added in order, as by ``parseAdlBuffer()``.
+
+        Widget handlers registered at run time are not known to
+        worker processes that are not forked from this one.
+        """
+        logger.debug("\n"*2)
+        logger.debug(self.given_filename)
+        ranges = locateTopLevelBlocks(buf)
+
+        xref = self.headerBlockHandlers()
+        for symbol, handler in xref.items():
+            found = [(start, end) for sym, start, end in ranges if sym == symbol]
+            if len(found) == 0:
+                logger.warning("Did not find %s block" % symbol)
+            else:
+                logger.debug("Processing %s block" % symbol)
+                start, end = found[0]
+                handler(parseBlockTree(buf[start:end+1]).blocks[0])
+
+        chunks = []     # [start, end] lines of consecutive widget blocks
+        for symbol, start, end in ranges:
+            if symbol not in symbols.adl_widgets:
+                continue
+            if len(chunks) == 0 or chunks[-1][1] - chunks[-1][0] >= chunk_lines:
+                chunks.append([start, end])
+            else:
+                chunks[-1][1] = end
+
+        if len(chunks) < 2:
+            for start, end in chunks:
+                self.widgets += _parseWidgetChunk(self, buf[start:end+1], start)
+        else:
+            args = [
+                (self.given_filename, self.structured, self.color_table, buf[start:end+1], start)
+                for start, end in chunks
+            ]
+            for widgets in executor.map(_parseWidgetChunkInWorker, *zip(*args)):
+                _setMainWidget(widgets, self)
+                self.widgets += widgets
+
+    def headerBlockHandlers(self):
+        """handlers of the blocks that describe the screen, in order of parsing"""
+        return OrderedDict([
             ("file", self.parseFileBlock),
             ("color map", self.parseColorMapBlock), # must BEFORE display
             ("display", self.parseDisplayBlock),
         ])
-        for symbol, handler in xref.items():
-            block = self.getNamedBlock(symbol, blocks)
-            if block is None:
-                logger.warn("Did not find %s block" % symbol)
-            else:
-                logger.debug("Processing %s block" % symbol)
-                handler(buf[block.start+1:block.end])
+
+    def parseAdlBlock(self, root):              # lgtm [py/similar-function]
+        logger.debug("\n"*2)
+        logger.debug(self.given_filename)
+        for block in root.blocks:
+            logger.debug(str(block))
+        
+        self.parseHeaderBlocks(root)
          
         # sift out the three block types already handled
         blocks = [
             block 
-            for block in blocks 
+            for block in root.blocks 
             if block.symbol in symbols.adl_widgets
             ]
-        self.parseChildren(self, blocks, buf)
+        self.parseChildren(self, blocks)
     
-    def parseFileBlock(self, buf):
-        # TODO: keep original line numbers for debug purposes
+    def parseHeaderBlocks(self, root):
+        """parse the blocks (within ``root``) that describe the screen"""
+        xref = self.headerBlockHandlers()
+        for symbol, handler in xref.items():
+            block = root.getNamedBlock(symbol)
+            if block is None:
+                logger.warning("Did not find %s block" % symbol)
+            else:
+                logger.debug("Processing %s block" % symbol)
+                handler(block)
+
+    def parseAdlBufferIncrementally(self, data):
+        """
+        parse ``data`` (bytes), only the blocks changed since the last call
+
+        Each top-level block is fingerprinted (see
+        :func:`fingerprintTopLevelBlocks`).  A widget block with the
+        same fingerprint as in the previous call keeps its widget
+        (the same object, its line numbers moved as needed).
+        Other widget blocks are parsed.  If any other
+        block (such as the color map) changed, all blocks are parsed.
+
+        Returns the number of widget blocks parsed.
+        """
+        fingerprints = fingerprintTopLevelBlocks(data)
+
+        def headers(fingerprints):
+            return [
+                (fp.symbol, fp.digest)
+                for fp in fingerprints
+                if fp.symbol not in symbols.adl_widgets
+            ]
+
+        reusable = {}   # digest: [(fingerprint, widget)]
+        previous = self.block_fingerprints
+        if previous is not None and headers(previous) == headers(fingerprints):
+            old = [fp for fp in previous if fp.symbol in symbols.adl_widgets]
+            for fp, widget in zip(old, self.widgets):
+                reusable.setdefault(fp.digest, []).append((fp, widget))
+        else:
+            select = blockSelector(widgets=())
+            self.parseHeaderBlocks(parseBlockTreeBytes(data, select=select))
+
+        widgets = []
+        parsed = 0
+        for fp in fingerprints:
+            if fp.symbol not in symbols.adl_widgets:
+                continue
+            if len(reusable.get(fp.digest, [])) > 0:
+                old_fp, widget = reusable[fp.digest].pop(0)
+                if fp.line != old_fp.line:
+                    for node in walkWidgets([widget]):
+                        node.widget.line_offset += fp.line - old_fp.line
+            else:
+                block = parseBlockTreeBytes(data[fp.start:fp.end], lazy=self.lazy).blocks[0]
+                widget = self.parseWidgetBlock(self, block, self.line_offset + fp.line)
+                parsed += 1
+            widgets.append(widget)
+
+        self.widgets = widgets
+        self.block_fingerprints = fingerprints
+        return parsed
+
+    def parseFileBlock(self, block):
         xref = dict(name="adl_filename", version="adl_version")
-        assignments = self.locateAssignments(buf)
         for k, sk in xref.items():
-            value = assignments.get(k)
+            value = block.assignments.get(k)
             if value is not None:
                 self.__setattr__(sk, value)
     
-    def parseColorMapBlock(self, buf):
+    def parseColorMapBlock(self, block):
         """read the color_table (clut) from the "color map"""
-        # TODO: keep original line numbers for debug purposes
-        # assignments = self.locateAssignments(buf)   # ignore ncolors=
-        blocks = self.locateBlocks(buf)
-
-        block = self.getNamedBlock("colors", blocks)
-        if block is not None:
+        # ignore ncolors=
+        colors = block.getNamedBlock("colors")
+        if colors is not None:
             # list of RGB 2-digit hex strings: RRGGBB
-            def _parse_colors_(rgbhex):
-                r = int(rgbhex[:2], 16)
-                g = int(rgbhex[2:4], 16)
-                b = int(rgbhex[4:6], 16)
-                return Color(r, g, b)
-
-            text = "".join(buf[block.start+1:block.end])
-            clut = map(_parse_colors_, text.replace(",", " ").split())
-            self.color_table = list(clut)
-        else:
+            text = " ".join(colors.values)
+            self.color_table = sharedColorTable(text.replace(",", " ").split())
+        elif block.getNamedBlock("dl_color") is not None:
             # dl_color blocks  contain assignments: r, g, b inten
-            block = self.getNamedBlock("dl_color", blocks)
-            if block is not None:
-                clut = []
-                for block in blocks:
-                    a = self.locateAssignments(buf[block.start+1:block.end])
-                    arr = map(int, (a["r"], a["g"], a["b"]))
-                    color = Color(*list(arr))   # ignore inten (default = 255)
-                    clut.append(color)
-                self.color_table = clut
+            hexcolors = []
+            for b in block.blocks:
+                a = b.assignments
+                arr = map(int, (a["r"], a["g"], a["b"]))
+                hexcolors.append("%02x%02x%02x" % tuple(arr))   # ignore inten (default = 255)
+            self.color_table = sharedColorTable(hexcolors)
     
-    def parseDisplayBlock(self, buf):
-        # TODO: keep original line numbers for debug purposes
-        assignments = self.locateAssignments(buf)
-        blocks = self.locateBlocks(buf)
-
+    def parseDisplayBlock(self, block):
         # assign certain items in named attributes
-        assignments = self.parseColorAssignments(assignments)
+        assignments = self.parseColorAssignments(dict(block.assignments))
 
         # assign remaining attributes
         for k, value in assignments.items():
             self.__setattr__(k, value)
 
-        block = self.getNamedBlock("object", blocks)
-        if block is not None:
-            self.geometry = self.parseObjectBlock(buf[block.start+1:block.end])
+        obj = block.getNamedBlock("object")
+        if obj is not None:
+            self.geometry = self.parseObjectAssignments(obj.assignments)
         # ignore any other blocks
 
 
+def walkWidgets(widgets, parent=None, select=None, prune=None):
+    """
+    walk the widget tree, yield a WidgetNode for each widget
+
+    ``widgets`` is any iterable of widgets (such as ``screen.widgets``
+    or ``screen.iterAdlWidgets()``), contained by ``parent``.  The
+    tree is walked depth-first, each widget before its children.
+    The walk is iterative, it does not recurse for nested composites.
+
+    select : collection
+        Only yield widgets with these MEDM symbols (str) or
+        instances of these classes.  Children are walked, either way.
+    prune : callable
+        ``prune(node)`` returns True to skip the children of node.widget.
+    """
+    symbol_names = {k for k in select or [] if isinstance(k, str)}
+    classes = tuple(k for k in select or [] if isinstance(k, type))
+    stack = [(0, parent, iter(widgets))]
+    while len(stack) > 0:
+        depth, parent, children = stack[-1]
+        widget = next(children, None)
+        if widget is None:
+            stack.pop()
+            continue
+        node = WidgetNode(depth, parent, widget, widget.geometry)
+        if (
+            select is None 
+            or widget.symbol in symbol_names 
+            or isinstance(widget, classes)
+        ):
+            yield node
+        children = getattr(widget, "widgets", None)
+        if children and (prune is None or not prune(node)):
+            stack.append((depth + 1, widget, iter(children)))
+
+
+def _parseWidgetChunk(main, lines, base):
+    """widgets of the top-level blocks in lines (line number of lines[0] is base)"""
+    widgets = []
+    for block in parseBlockTree(lines).blocks:
+        if block.symbol in symbols.adl_widgets:
+            line = main.line_offset + base + block.start
+            widgets.append(main.parseWidgetBlock(main, block, line))
+    return widgets
+
+
+def _parseWidgetChunkInWorker(given_filename, structured, color_table, lines, base):
+    """parse a chunk of widget blocks in a worker of parseAdlBufferInParallel()"""
+    main = MedmMainWidget(given_filename, structured=structured)
+    main.color_table = color_table
+    widgets = _parseWidgetChunk(main, lines, base)
+    _setMainWidget(widgets, None)   # reattached by the caller
+    return widgets
+
+
+def _setMainWidget(widgets, main):
+    """set the main widget of these widgets and of their children"""
+    for node in walkWidgets(widgets):
+        node.widget.main = main
+
+
 class MedmGenericWidget(MedmBaseWidget):
+
+    __slots__ = ()
     
     debug = False
     
@@ -431,55 +1443,50 @@ class MedmGenericWidget(MedmBaseWidget):
         self.main = main
         self.symbol = symbol
 
-    def parseAdlBuffer(self, buf):              # lgtm [py/similar-function]
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)  # lgtm [py/unused-local-variable]
+    def parseAdlBlock(self, block):              # lgtm [py/similar-function]
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)  # lgtm [py/unused-local-variable]
         if self.debug:
             _debug = self.debug  # lgtm [py/unused-local-variable]
 
 
-class MedmArcWidget(MedmGenericWidget): pass
-class MedmBarWidget(MedmGenericWidget): pass
-class MedmByteWidget(MedmGenericWidget): pass
+class MedmArcWidget(MedmGenericWidget): __slots__ = ()
+class MedmBarWidget(MedmGenericWidget): __slots__ = ()
+class MedmByteWidget(MedmGenericWidget): __slots__ = ()
 
 
 class MedmCartesianPlotWidget(MedmGenericWidget):
+
+    __slots__ = ()
     
     def __init__(self, line, main, symbol):
         MedmGenericWidget.__init__(self, line, main, symbol)
 
-    def parseAdlBuffer(self, buf):          # lgtm [py/similar-function] 
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
+    def parseAdlBlock(self, block):          # lgtm [py/similar-function] 
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
 
-        self.parsePlotcomBlock(buf, blocks)
+        self.parsePlotcomBlock(block)
 
         for symbol in ("x_axis", "y1_axis", "y2_axis"):
-            block = self.getNamedBlock(symbol, blocks)
-            if block is not None:
-                aa = self.locateAssignments(buf[block.start+1:block.end])
-                self.contents[symbol] = aa
+            b = block.getNamedBlock(symbol)
+            if b is not None:
+                self.contents[symbol] = self.decodeAssignments(dict(b.assignments), symbol)
 
-        traces = {}
-        for block in blocks:
-            if block.symbol.startswith("trace["):
-                del self.contents[block.symbol]
-                aa = self.locateAssignments(buf[block.start+1:block.end])
-                clr = aa.get("data_clr")
-                if clr is not None:
-                    del aa["data_clr"]
-                    aa["color"] = self.main.color_table[int(clr)]
-                row = block.symbol.replace("[", " ").replace("]", "").split()[-1]
-                traces[row] = aa
-        
-        def sorter(value):
-            return int(value)
-        self.contents["traces"] = [traces[k] for k in sorted(traces.keys(), key=sorter)]
+        traces = self.parseIndexedBlocks(blocks, "trace[")
+        for aa in traces:
+            clr = aa.get("data_clr")
+            if clr is not None:
+                del aa["data_clr"]
+                aa["color"] = self.main.color_table[int(clr)]
+        self.contents["traces"] = traces
 
 
-class MedmChoiceButtonWidget(MedmGenericWidget): pass
+class MedmChoiceButtonWidget(MedmGenericWidget): __slots__ = ()
 
 
 class MedmCompositeWidget(MedmBaseWidget):
     """contains other widgets or an entire .adl screen"""
+
+    __slots__ = ("widgets",)
     
     def __init__(self, line, main, symbol):
         MedmBaseWidget.__init__(self)
@@ -488,17 +1495,30 @@ class MedmCompositeWidget(MedmBaseWidget):
         self.symbol = symbol        # "composite"
         self.widgets = []
 
-    def parseAdlBuffer(self, buf):              # lgtm [py/similar-function]
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
+    def parseAdlBlock(self, block):              # lgtm [py/similar-function]
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
         
-        block = self.getNamedBlock("children", blocks)
+        children = block.getNamedBlock("children")
+        if children is not None:
+            self.parseChildren(self.main, children.blocks, children.start+1)
+
+    def deferAdlBlock(self, block):
+        MedmBaseWidget.deferAdlBlock(self, block)
+
+        # the children are needed to walk the widget tree
+        children = block.getNamedBlock("children")
+        if children is not None:
+            self.parseChildren(self.main, children.blocks, children.start+1)
+
+    def parsePendingBlock(self):
+        block, self._pending = self._pending, None
         if block is not None:
-            # aa = self.locateAssignments(buf[block.start+1:block.end])
-            bb = self.locateBlocks(buf[block.start+1:block.end])
-            self.parseChildren(self.main, bb, buf[block.start+1:block.end])
+            # children were parsed by deferAdlBlock()
+            MedmBaseWidget.parseAdlBlock(self, self.retokenizeBlock(block))
 
 
 class MedmEmbeddedDisplayWidget(MedmGenericWidget): 
+    __slots__ = ()
     debug = True # TODO: need example in .adl file!
 
     def __init__(self, line, main, symbol):
@@ -517,104 +1537,173 @@ class MedmEmbeddedDisplayWidget(MedmGenericWidget):
         """ % (main.given_filename, line)
         raise NotImplementedError(emsg)
 
-class MedmImageWidget(MedmGenericWidget): pass
-class MedmIndicatorWidget(MedmGenericWidget): pass
-class MedmMenuWidget(MedmGenericWidget): pass
-class MedmMessageButtonWidget(MedmGenericWidget): pass
-class MedmMeterWidget(MedmGenericWidget): pass
-class MedmOvalWidget(MedmGenericWidget): pass
-class MedmPolygonWidget(MedmGenericWidget): pass
-class MedmPolylineWidget(MedmGenericWidget): pass
-class MedmRectangleWidget(MedmGenericWidget): pass
+class MedmImageWidget(MedmGenericWidget): __slots__ = ()
+class MedmIndicatorWidget(MedmGenericWidget): __slots__ = ()
+class MedmMenuWidget(MedmGenericWidget): __slots__ = ()
+class MedmMessageButtonWidget(MedmGenericWidget): __slots__ = ()
+class MedmMeterWidget(MedmGenericWidget): __slots__ = ()
+class MedmOvalWidget(MedmGenericWidget): __slots__ = ()
+class MedmPolygonWidget(MedmGenericWidget): __slots__ = ()
+class MedmPolylineWidget(MedmGenericWidget): __slots__ = ()
+class MedmRectangleWidget(MedmGenericWidget): __slots__ = ()
 
 
 class MedmRelatedDisplayWidget(MedmGenericWidget):
+
+    __slots__ = ("_displays",)
+
+    displays = _deferredAttribute("displays")
     
     def __init__(self, line, main, symbol):
         MedmGenericWidget.__init__(self, line, main, symbol)
         self.displays = []
 
-    def parseAdlBuffer(self, buf):          # lgtm [py/similar-function] 
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
-
-        displays = {}
-        for block in blocks:
-            if not block.symbol.startswith("display["):
-                continue
-            del self.contents[block.symbol]
-            aa = self.locateAssignments(buf[block.start+1:block.end])
-            row = block.symbol.replace("[", " ").replace("]", "").split()[-1]
-            displays[row] = aa
-        
-        def sorter(value):
-            return int(value)
-        self.displays = [displays[k] for k in sorted(displays.keys(), key=sorter)]
+    def parseAdlBlock(self, block):          # lgtm [py/similar-function] 
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
+        self.displays = self.parseIndexedBlocks(blocks, "display[")
 
 
 class MedmShellCommandWidget(MedmGenericWidget):
+
+    __slots__ = ("_commands",)
+
+    commands = _deferredAttribute("commands")
     
     def __init__(self, line, main, symbol):
         MedmGenericWidget.__init__(self, line, main, symbol)
         self.commands = []
 
-    def parseAdlBuffer(self, buf):          # lgtm [py/similar-function] 
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
-
-        commands = {}
-        for block in blocks:
-            if not block.symbol.startswith("command["):
-                continue
-            del self.contents[block.symbol]
-            aa = self.locateAssignments(buf[block.start+1:block.end])
-            row = block.symbol.replace("[", " ").replace("]", "").split()[-1]
-            commands[row] = aa
-        
-        def sorter(value):
-            return int(value)
-        self.commands = [commands[k] for k in sorted(commands.keys(), key=sorter)]
+    def parseAdlBlock(self, block):          # lgtm [py/similar-function] 
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
+        self.commands = self.parseIndexedBlocks(blocks, "command[")
 
 
 class MedmStripChartWidget(MedmGenericWidget):
+
+    __slots__ = ()
     
     def __init__(self, line, main, symbol):
         MedmGenericWidget.__init__(self, line, main, symbol)
 
-    def parseAdlBuffer(self, buf):          # lgtm [py/similar-function] 
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
+    def parseAdlBlock(self, block):          # lgtm [py/similar-function] 
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
 
-        pens = {}
-        for block in blocks:
-            if block.symbol.startswith("pen["):
-                del self.contents[block.symbol]
-                aa = self.locateAssignments(buf[block.start+1:block.end])
-                clr = aa.get("clr")
-                if clr is not None:
-                    del aa["clr"]
-                    aa["color"] = self.main.color_table[int(clr)]
-                row = block.symbol.replace("[", " ").replace("]", "").split()[-1]
-                pens[row] = aa
-            elif block.symbol == "plotcom":
-                self.parsePlotcomBlock(buf, blocks)
-            # elif block.symbol == "symbol":
-            #     raise ValueError(block.symbol + " not handled yet")
-            else:
-                raise ValueError(block.symbol + " not expected here")
-        
-        def sorter(value):
-            return int(value)
-        self.contents["pens"] = [pens[k] for k in sorted(pens.keys(), key=sorter)]
+        for b in blocks:
+            if b.symbol == "plotcom":
+                self.parsePlotcomBlock(block)
+            # elif b.symbol == "symbol":
+            #     raise ValueError(b.symbol + " not handled yet")
+            elif not b.symbol.startswith("pen["):
+                raise ValueError(b.symbol + " not expected here")
+
+        pens = self.parseIndexedBlocks(blocks, "pen[")
+        for aa in pens:
+            clr = aa.get("clr")
+            if clr is not None:
+                del aa["clr"]
+                aa["color"] = self.main.color_table[int(clr)]
+        self.contents["pens"] = pens
 
 
 class MedmTextWidget(MedmGenericWidget):
 
-    def parseAdlBuffer(self, buf):              # lgtm [py/similar-function]
-        assignments, blocks = MedmBaseWidget.parseAdlBuffer(self, buf)
+    __slots__ = ()
+
+    def parseAdlBlock(self, block):              # lgtm [py/similar-function]
+        assignments, blocks = MedmBaseWidget.parseAdlBlock(self, block)
         if "textix" in assignments:
             self.title = assignments["textix"]
             del self.contents["textix"], assignments["textix"]
 
 
-class MedmTextEntryWidget(MedmGenericWidget): pass
-class MedmTextUpdateWidget(MedmGenericWidget): pass
-class MedmValuatorWidget(MedmGenericWidget): pass
-class MedmWheelSwitchWidget(MedmGenericWidget): pass
+class MedmTextEntryWidget(MedmGenericWidget): __slots__ = ()
+class MedmTextUpdateWidget(MedmGenericWidget): __slots__ = ()
+class MedmValuatorWidget(MedmGenericWidget): __slots__ = ()
+class MedmWheelSwitchWidget(MedmGenericWidget): __slots__ = ()
+
+
+_medm_widget_handlers = {
+    "arc" : MedmArcWidget,
+    "bar" : MedmBarWidget,
+    "byte" : MedmByteWidget,
+    "cartesian plot" : MedmCartesianPlotWidget,
+    "choice button" : MedmChoiceButtonWidget,
+    "composite" : MedmCompositeWidget,
+    "embedded display" : MedmEmbeddedDisplayWidget,
+    "image" : MedmImageWidget,
+    "indicator" : MedmIndicatorWidget,
+    "menu" : MedmMenuWidget,
+    "message button" : MedmMessageButtonWidget,
+    "meter" : MedmMeterWidget,
+    "oval" : MedmOvalWidget,
+    "polygon" : MedmPolygonWidget,
+    "polyline" : MedmPolylineWidget,
+    "rectangle" : MedmRectangleWidget,
+    "related display" : MedmRelatedDisplayWidget,
+    "shell command" : MedmShellCommandWidget,
+    "strip chart" : MedmStripChartWidget,
+    "text" : MedmTextWidget,
+    "text entry" : MedmTextEntryWidget,
+    "text update" : MedmTextUpdateWidget,
+    "valuator" : MedmValuatorWidget,
+    "wheel switch" : MedmWheelSwitchWidget,
+    }
+_medm_widget_plugins_loaded = False
+
+"""MEDM widget symbol: class that parses the widget (read-only)"""
+medm_widget_handlers = types.MappingProxyType(_medm_widget_handlers)
+
+
+def loadEntryPoints(group):
+    """
+    load the objects that installed packages provide for an entry point group
+
+    Returns a list of (name, object).
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:     # Python < 3.8
+        return []
+    try:
+        eps = entry_points(group=group)         # Python 3.10+
+    except TypeError:
+        eps = entry_points().get(group, [])
+    results = []
+    for ep in eps:
+        try:
+            results.append((ep.name, ep.load()))
+        except Exception as exc:
+            logger.error(f"could not load {group} entry point '{ep.name}': {exc}")
+    return results
+
+
+def _loadMedmWidgetPlugins():
+    global _medm_widget_plugins_loaded
+    if not _medm_widget_plugins_loaded:
+        _medm_widget_plugins_loaded = True
+        for symbol, handler in loadEntryPoints(MEDM_WIDGET_ENTRY_POINTS):
+            logger.debug(f"MEDM widget '{symbol}' parsed by {handler}")
+            _medm_widget_handlers[symbol] = handler
+
+
+def getMedmWidgetHandler(symbol):
+    """return the class that parses the MEDM widget (or None)"""
+    _loadMedmWidgetPlugins()
+    return _medm_widget_handlers.get(symbol)
+
+
+def registerMedmWidgetHandler(symbol, handler):
+    """
+    register the class that parses the MEDM widget ``symbol``
+
+    The class is called as ``handler(line, main, symbol)`` and
+    must provide ``parseAdlBlock(block)``, such as a subclass of
+    ``MedmGenericWidget``.  Only symbols described in
+    ``symbols.adl_widgets`` are parsed as widgets.
+
+    Packages can also register classes with an entry point
+    in the ``adl2pydm.medm_widgets`` group, named for the symbol.
+    These are loaded when the first widget is parsed.
+    """
+    _loadMedmWidgetPlugins()     # explicit registration has the last word
+    _medm_widget_handlers[symbol] = handler
@@ -7,11 +7,509 @@ see: https://epics.anl.gov/EpicsDocumentation/ExtensionsManuals/MEDM/MEDM.html#C
 see: https://slaclab.github.io/pydm/widgets/widget_rules/index.html
 """
 
-import io
+from collections import namedtuple
+import ast
+import functools
 import logging
-import tokenize
+import operator
+import re
+import sys
 
-logger = logging.getLogger(__file__)
+logger = logging.getLogger(__name__)
+
+# number of converted expressions remembered
+CALC_CACHE_SIZE = 1024
+
+# MEDM calc variables, in order of the PyDM rule channels: ch[0] ...
+CALC_VARIABLES = "ABCD"
+
+# other MEDM calc variables, not available to a PyDM rule
+CALC_SPECIAL_VARIABLES = {
+    "E": "reserved",
+    "F": "reserved",
+    "G": "number of elements of channel A",
+    "H": "HOPR of channel A",
+    "I": "status of channel A",
+    "J": "severity of channel A",
+    "K": "precision of channel A",
+    "L": "LOPR of channel A",
+}
+
+# one token of a MEDM calc expression (white space is skipped)
+CALC_TOKEN_PATTERN = re.compile(
+    r"(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    r"|(?P<name>[A-Za-z_]\w*)"
+    r"|(?P<op>==|!=|<=|>=|&&|\|\||\*\*|<<|>>|\S)"
+)
+
+# name of the PyDM rule channel list in a rule expression
+RULE_CHANNELS = "ch"
+RULE_CHANNEL_PATTERN = re.compile(r"\b" + RULE_CHANNELS + r"\[(\d+)\]")
+
+# MEDM calc operators that are written differently in Python
+CALC_OPERATORS = {
+    "#": "!=",
+    "=": "==",
+    "!": " not ",
+    "&": " and ",
+    "&&": " and ",
+    "|": " or ",
+    "||": " or ",
+}
+
+
+# operators that may be folded when all operands are constants
+# (not ** and <<, their results may be huge: 9**9**9)
+_FOLDED_OPERATORS = {
+    ast.Add: operator.add,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.Div: operator.truediv,
+    ast.Eq: operator.eq,
+    ast.FloorDiv: operator.floordiv,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Invert: operator.invert,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Mod: operator.mod,
+    ast.Mult: operator.mul,
+    ast.Not: operator.not_,
+    ast.NotEq: operator.ne,
+    ast.RShift: operator.rshift,
+    ast.Sub: operator.sub,
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# Python operator precedence, as used to write the rule expression
+_PRECEDENCE_OR = 1
+_PRECEDENCE_AND = 2
+_PRECEDENCE_NOT = 3
+_PRECEDENCE_COMPARE = 4
+_PRECEDENCE_UNARY = 11
+_PRECEDENCE_POWER = 12
+_PRECEDENCE_ATOM = 13
+_BINARY_OPERATORS = {
+    ast.BitOr: ("|", 5),
+    ast.BitXor: ("^", 6),
+    ast.BitAnd: ("&", 7),
+    ast.LShift: ("<<", 8),
+    ast.RShift: (">>", 8),
+    ast.Add: ("+", 9),
+    ast.Sub: ("-", 9),
+    ast.Mult: ("*", 10),
+    ast.Div: ("/", 10),
+    ast.FloorDiv: ("//", 10),
+    ast.Mod: ("%", 10),
+    ast.Pow: ("**", _PRECEDENCE_POWER),
+}
+_COMPARE_OPERATORS = {
+    ast.Eq: "==",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.NotEq: "!=",
+}
+_UNARY_OPERATORS = {
+    ast.Invert: "~",
+    ast.UAdd: "+",
+    ast.USub: "-",
+}
+
+
+class CalcRule(namedtuple("CalcRule", "expression channels warnings")):
+    """
+    PyDM rule expression converted from a MEDM calc
+
+    ``channels`` is the sorted tuple of the rule channel
+    indices (``ch[0]`` is 0) referenced by the ``expression``.
+    ``warnings`` is the tuple of the conversion warnings (text).
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, expression, channels, warnings=()):
+        return super().__new__(cls, expression, channels, tuple(warnings))
+
+    def unreferencedChannels(self, count):
+        """Return the indices, of the first ``count`` channels, not referenced."""
+        return tuple(i for i in range(count) if i not in self.channels)
+
+    def renumbered(self, mapping):
+        """Return rule with channel indices replaced: ``{old: new}``."""
+        expression = RULE_CHANNEL_PATTERN.sub(
+            lambda match: f"{RULE_CHANNELS}[{mapping[int(match.group(1))]}]",
+            self.expression,
+        )
+        return CalcRule(
+            expression,
+            tuple(sorted(set(map(mapping.get, self.channels)))),
+            self.warnings,
+        )
+
+
+def _isBoolean(node):
+    """Is the value of this expression node always True or False?"""
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, ast.Not)
+    if isinstance(node, ast.BoolOp):
+        return all(map(_isBoolean, node.values))
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, bool)
+    return False
+
+
+def _isConstant(node):
+    """Is this expression node a number (such as ``2`` or ``-0.9``)?"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        node = node.operand     # a signed literal
+    return isinstance(node, ast.Constant) and isinstance(
+        node.value, (bool, int, float))
+
+
+def _constantValue(node):
+    if isinstance(node, ast.UnaryOp):
+        return _FOLDED_OPERATORS[type(node.op)](node.operand.value)
+    return node.value
+
+
+def _boolOpValue(op, *values):
+    """Return value of Python's ``and`` (or ``or``) of these values."""
+    for value in values[:-1]:
+        if bool(value) != isinstance(op, ast.And):
+            return value    # short-circuits here
+    return values[-1]
+
+
+class _ModernNodes(ast.NodeTransformer):
+    """
+    rewrite an expression tree as Python 3.9+ parses it
+
+    Before Python 3.8, literals are ``ast.Num`` (``ast.Str``, ...)
+    and before Python 3.9, a subscript is wrapped in ``ast.Index``.
+    """
+
+    def visit(self, node):
+        node = self.generic_visit(node)
+        kind = type(node).__name__
+        if kind == "Index":
+            return node.value
+        if kind == "Num":
+            return ast.copy_location(ast.Constant(node.n), node)
+        if kind in ("Str", "Bytes"):
+            return ast.copy_location(ast.Constant(node.s), node)
+        if kind == "NameConstant":
+            return ast.copy_location(ast.Constant(node.value), node)
+        return node
+
+
+def parseRuleExpression(pydm_rule):
+    """Return the expression tree (as Python 3.9+ parses it) of a PyDM rule."""
+    tree = ast.parse(pydm_rule, mode="eval")
+    if sys.version_info < (3, 9):
+        tree = _ModernNodes().visit(tree)
+    return tree
+
+
+class RuleSimplifier(ast.NodeTransformer):
+    """
+    simplify the expression tree of a PyDM rule
+
+    * fold operations on constants: ``2*3`` becomes ``6``
+    * remove redundant comparisons of a boolean with 0 or 1:
+      ``(ch[0]!=0)==1`` becomes ``ch[0]!=0``
+    * drop double negations: ``not not ch[0]`` becomes ``ch[0]``
+
+    The rule is evaluated for its truth (such as *Visible*)
+    so the whole expression is simplified in a boolean context.
+    Attribute ``changed`` tells if anything was simplified.
+    """
+
+    def __init__(self):
+        self.changed = False
+        self._truth = False     # only the truth of this node is used?
+
+    def _visitOperand(self, node, truth=False):
+        outer, self._truth = self._truth, truth
+        try:
+            return self.visit(node)
+        finally:
+            self._truth = outer
+
+    def _simplified(self, node):
+        self.changed = True
+        return node
+
+    def _fold(self, node, function, *operands):
+        try:
+            value = function(*map(_constantValue, operands))
+        except (ArithmeticError, TypeError, ValueError):
+            return node     # leave it to PyDM to report
+        return self._simplified(ast.copy_location(ast.Constant(value), node))
+
+    def visit_Expression(self, node):
+        node.body = self._visitOperand(node.body, truth=True)
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self._visitOperand(node.left)
+        node.right = self._visitOperand(node.right)
+        function = _FOLDED_OPERATORS.get(type(node.op))
+        if function and _isConstant(node.left) and _isConstant(node.right):
+            return self._fold(node, function, node.left, node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        truth = self._truth
+        is_not = isinstance(node.op, ast.Not)
+        node.operand = self._visitOperand(node.operand, truth=is_not)
+        operand = node.operand
+        if _isConstant(node):
+            return node     # a signed literal, already simple
+        if _isConstant(operand):
+            return self._fold(node, _FOLDED_OPERATORS[type(node.op)], operand)
+        if (
+            is_not
+            and isinstance(operand, ast.UnaryOp)
+            and isinstance(operand.op, ast.Not)
+            and (truth or _isBoolean(operand.operand))
+        ):
+            return self._simplified(operand.operand)
+        return node
+
+    def visit_BoolOp(self, node):
+        truth = self._truth
+        node.values = [self._visitOperand(v, truth=truth) for v in node.values]
+        if all(map(_isConstant, node.values)):
+            function = functools.partial(_boolOpValue, node.op)
+            return self._fold(node, function, *node.values)
+        if truth:
+            # constants decide (or do not change) the truth of the expression
+            identity = isinstance(node.op, ast.And)
+            values = []
+            for value in node.values:
+                if not _isConstant(value):
+                    values.append(value)
+                elif bool(_constantValue(value)) != identity:
+                    # such as: ch[0] and 0
+                    constant = ast.Constant(not identity)
+                    return self._simplified(ast.copy_location(constant, node))
+            if len(values) != len(node.values):
+                self.changed = True
+                if len(values) == 1:
+                    return values[0]
+                node.values = values
+        return node
+
+    def visit_Compare(self, node):
+        node.left = self._visitOperand(node.left)
+        node.comparators = [self._visitOperand(v) for v in node.comparators]
+        if len(node.ops) != 1:
+            return node
+        op, left, right = node.ops[0], node.left, node.comparators[0]
+        function = _FOLDED_OPERATORS.get(type(op))
+        if function and _isConstant(left) and _isConstant(right):
+            return self._fold(node, function, left, right)
+        if _isConstant(left):
+            left, right = right, left   # such as: 1 == (ch[0]!=0)
+        if (
+            isinstance(op, (ast.Eq, ast.NotEq))
+            and _isBoolean(left)
+            and _isConstant(right)
+            and _constantValue(right) in (0, 1)
+        ):
+            if (_constantValue(right) == 1) == isinstance(op, ast.Eq):
+                return self._simplified(left)
+            return self._simplified(
+                ast.copy_location(ast.UnaryOp(ast.Not(), left), node))
+        return node
+
+    def visit_Call(self, node):
+        node.args = [self._visitOperand(v) for v in node.args]
+        return node
+
+    def visit_Subscript(self, node):
+        return node
+
+
+def formatRuleExpression(node, precedence=0):
+    """
+    write an expression tree as (compact) PyDM rule expression
+
+    Operators are written without surrounding space, as with
+    the MEDM calc, such as: ``ch[0]!=1 or not ch[1]``.
+    """
+    if isinstance(node, ast.Expression):
+        node = node.body
+
+    def wrap(text, own):
+        return f"({text})" if own < precedence else text
+
+    if isinstance(node, ast.Constant):
+        text = repr(node.value)
+        if isinstance(node.value, (int, float)) and node.value < 0:
+            return wrap(text, _PRECEDENCE_UNARY)
+        return text
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Subscript):
+        value = formatRuleExpression(node.value, _PRECEDENCE_ATOM)
+        return f"{value}[{formatRuleExpression(node.slice)}]"
+    if isinstance(node, ast.Call):
+        args = ",".join(formatRuleExpression(v) for v in node.args)
+        return f"{formatRuleExpression(node.func, _PRECEDENCE_ATOM)}({args})"
+    if isinstance(node, ast.BoolOp):
+        own = _PRECEDENCE_AND if isinstance(node.op, ast.And) else _PRECEDENCE_OR
+        joiner = " and " if own == _PRECEDENCE_AND else " or "
+        text = joiner.join(formatRuleExpression(v, own + 1) for v in node.values)
+        return wrap(text, own)
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.Not):
+            # as from the MEDM calc: not (ch[0]==0)
+            operand = formatRuleExpression(node.operand, _PRECEDENCE_UNARY)
+            return wrap(f"not {operand}", _PRECEDENCE_NOT)
+        symbol = _UNARY_OPERATORS[type(node.op)]
+        operand = formatRuleExpression(node.operand, _PRECEDENCE_UNARY)
+        return wrap(f"{symbol}{operand}", _PRECEDENCE_UNARY)
+    if isinstance(node, ast.BinOp):
+        symbol, own = _BINARY_OPERATORS[type(node.op)]
+        if own == _PRECEDENCE_POWER:    # right associative
+            left, right = own + 1, own
+        else:
+            left, right = own, own + 1
+        text = (
+            formatRuleExpression(node.left, left)
+            + symbol
+            + formatRuleExpression(node.right, right)
+        )
+        return wrap(text, own)
+    if isinstance(node, ast.Compare):
+        text = formatRuleExpression(node.left, _PRECEDENCE_COMPARE + 1)
+        for op, v in zip(node.ops, node.comparators):
+            symbol = _COMPARE_OPERATORS[type(op)]
+            text += symbol + formatRuleExpression(v, _PRECEDENCE_COMPARE + 1)
+        return wrap(text, _PRECEDENCE_COMPARE)
+    raise ValueError(f"cannot write rule expression node {ast.dump(node)}")
+
+
+def referencedChannels(tree):
+    """Return sorted tuple of the rule channel indices used in ``tree``."""
+    channels = set()
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == RULE_CHANNELS
+            and isinstance(node.slice, ast.Constant)
+        ):
+            channels.add(node.slice.value)
+    return tuple(sorted(channels))
+
+
+def convertCalcToRule(medm_calc):
+    """
+    convert MEDM calc expression to a simplified PyDM rule
+
+    As ``translateCalc()`` and the warnings are logged (each time).
+
+    Parameters
+    ----------
+    medm_calc : str
+        The expression to convert.
+
+    Returns
+    -------
+    CalcRule
+        The converted PyDM rule expression and its channels.
+    """
+    logger.debug(f"MEDM: {medm_calc}")
+    rule = translateCalc(medm_calc)
+    for warning in rule.warnings:
+        logger.warning(warning)
+    return rule
+
+
+@functools.lru_cache(maxsize=CALC_CACHE_SIZE)
+def translateCalc(medm_calc):
+    """
+    translate MEDM calc expression to a simplified PyDM rule (cached)
+
+    The calc is translated token by token, then parsed into an
+    expression tree which is simplified (see ``RuleSimplifier``).
+    When nothing is simplified, the translated text is kept as-is.
+
+    Only the values of the channels (``A`` .. ``D``) are available
+    to a PyDM rule.  The other MEDM calc variables (such as ``H``,
+    the HOPR of channel A) raise ``ValueError``.
+
+    Parameters
+    ----------
+    medm_calc : str
+        The expression to convert.
+
+    Nothing is logged, the warnings are returned in the rule.
+
+    Returns
+    -------
+    CalcRule
+        The converted PyDM rule expression and its channels.
+    """
+
+    calc = []
+    channels = set()
+    word = False    # was the last token a name or a number?
+    for match in CALC_TOKEN_PATTERN.finditer(medm_calc):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == "op":
+            calc.append(CALC_OPERATORS.get(token, token))
+            word = False
+            continue
+        if word:
+            calc.append(" ")    # such as: NOT A
+        if kind == "name":
+            if len(token) == 1:
+                idx = CALC_VARIABLES.find(token.upper())
+                if idx < 0:
+                    meaning = CALC_SPECIAL_VARIABLES.get(token.upper())
+                    meaning = f" ({meaning})" if meaning else ""
+                    raise ValueError(
+                        f"unhandled complexity in MEDM calc '{medm_calc}'"
+                        f" uses special variable {token}{meaning}"
+                        )
+                token = f"{RULE_CHANNELS}[{idx}]"
+                channels.add(idx)
+            else:
+                # probably a math expression
+                # TODO: need a mapping?
+                # we have these imports available:
+                #     from math import *
+                #     import numpy as np
+                token = token.lower()  # simply
+        calc.append(token)
+        word = True
+
+    pydm_rule = " ".join("".join(calc).split())  # remove interior extra spaces
+    try:
+        tree = parseRuleExpression(pydm_rule)
+    except SyntaxError as exc:
+        warning = f"MEDM calc '{medm_calc}' is not a valid rule expression: {exc.msg}"
+        return CalcRule(pydm_rule, tuple(sorted(channels)), [warning])
+
+    simplifier = RuleSimplifier()
+    tree = simplifier.visit(tree)
+    if simplifier.changed:
+        try:
+            pydm_rule = formatRuleExpression(tree)
+        except ValueError as exc:
+            warning = f"MEDM calc '{medm_calc}' not simplified: {exc}"
+            return CalcRule(pydm_rule, tuple(sorted(channels)), [warning])
+    return CalcRule(pydm_rule, referencedChannels(tree))
 
 
 def convertCalcToRuleExpression(medm_calc):
@@ -28,46 +526,4 @@ def convertCalcToRuleExpression(medm_calc):
     str
         The converted PyDM rule expression.
     """
-    logger.debug(f"MEDM: {medm_calc}")
-
-    medm_calc = medm_calc.replace("#", "!=")
-    medm_calc = medm_calc.replace("&&", "&")
-    medm_calc = medm_calc.replace("||", "|")
-
-    calc = ""
-    with io.StringIO(medm_calc) as f:
-        for tok in tokenize.generate_tokens(f.read):
-            logger.debug(tok)
-            if tok.type == tokenize.NAME:
-                if len(tok.string) == 1:
-                    idx = "ABCDEFGHIJKL".index(tok.string.upper())
-                    if idx > 3:
-                        # TODO: consider handling these less common cases
-                        raise ValueError(
-                            f"unhandled complexity in MEDM calc '{medm_calc}''"
-                            f" uses special variable {tok.string}"
-                            )
-                    calc += f"ch[{idx}]"
-                else:
-                    # probably a math expression
-                    # TODO: need a mapping?
-                    # we have these imports available:
-                    #     from math import *
-                    #     import numpy as np
-                    calc += tok.string.lower()  # simply
-            elif tok.type == tokenize.ERRORTOKEN:
-                op = tok.string
-                if op == "!":
-                    op = " not "
-                calc += op
-            elif tok.type == tokenize.OP:
-                calc += {
-                    "=": "==",
-                    "|": " or ",
-                    "&": " and ",
-                }.get(tok.string, tok.string)
-            elif tok.type not in (tokenize.NEWLINE, tokenize.ENDMARKER):
-                calc += tok.string
-
-    pydm_rule = " ".join(calc.strip().split())  # remove interior extra spaces
-    return pydm_rule
+    return convertCalcToRule(medm_calc).expression
@@ -7,26 +7,143 @@ Only rely on packages in this project or from the standard Python distribution.
 """
 
 import argparse
-# from collections import namedtuple
+import concurrent.futures
+from collections import namedtuple
+import io
 import logging
 import os
+import threading
+from xml.etree import ElementTree
 
 from . import adl_parser
 from . import output_handler
+from . import parse_cache
 
 
 logger = None
 
 
-def processFile(adl_filename, output_path=None):
+def processFile(adl_filename, output_path=None, use_mmap=False, cache=None, executor=None, pretty=True, ui_names=None):
+    """
+    convert the .adl file
+
+    ``cache`` is an optional ``parse_cache.ParseCache`` of parsed screens.
+    ``executor`` (such as ``concurrent.futures.ProcessPoolExecutor``)
+    parses the widgets of large screens in parallel, also those
+    not found in the cache.  ``use_mmap`` cannot be combined
+    with ``cache`` or ``executor``.
+    ``pretty`` writes the .ui file indented, one XML element per line.
+    ``ui_names`` (``output_handler.UiFileNames``) keeps the .ui file
+    names of .adl files converted together apart.
+    """
     output_path = output_path or os.path.dirname(adl_filename)
+    if use_mmap and cache is not None:
+        raise ValueError("use_mmap and cache cannot be combined")
+    if use_mmap and executor is not None:
+        raise ValueError("use_mmap and executor cannot be combined")
 
-    screen = adl_parser.MedmMainWidget(adl_filename)
-    buf = screen.getAdlLines(adl_filename)
-    screen.parseAdlBuffer(buf)
+    if cache is not None:
+        screen = cache.parseAdlFile(adl_filename, executor=executor)
+        widgets = screen.widgets
+    else:
+        # the writer needs no raw text of the widget blocks
+        screen = adl_parser.MedmMainWidget(adl_filename, structured=True)
+        if executor is not None:
+            screen.parseAdlFile(adl_filename, executor=executor)
+            widgets = screen.widgets
+        elif use_mmap:
+            screen.parseAdlFile(adl_filename, use_mmap=True)
+            widgets = screen.widgets
+        else:
+            # write each widget as soon as it is parsed
+            widgets = screen.iterAdlWidgets(adl_filename)
     
-    writer = output_handler.Widget2Pydm()
-    writer.write_ui(screen, output_path)
+    writer = output_handler.Widget2Pydm(pretty=pretty)
+    writer.write_ui(screen, output_path, widgets=widgets, ui_names=ui_names)
+
+
+class ConversionResult(namedtuple("ConversionResult", "ui title warnings")):
+    """
+    .ui file converted in memory, see ``convertAdlText()``
+
+    ui : bytes
+        The .ui file content (UTF-8).
+    title : str
+        The screen title, the .ui file would be named ``title + ".ui"``.
+    warnings : tuple
+        Text of the warnings logged during the conversion.
+    """
+
+    __slots__ = ()
+
+    def elementTree(self):
+        """the .ui content as ``xml.etree.ElementTree.ElementTree``"""
+        return ElementTree.ElementTree(ElementTree.fromstring(self.ui))
+
+
+class _WarningCollector(logging.Handler):
+    """keep the warnings logged by the thread that created the collector"""
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.thread = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.messages.append(record.getMessage())
+
+
+def convertAdlText(adl, adl_filename="screen.adl", pretty=True, stylesheet=""):
+    """
+    convert .adl content to .ui content, in memory
+
+    Nothing is read from or written to a file (unless ``stylesheet``
+    is None), so the result does not depend on the current directory
+    or on the environment.  Conversions in
+    separate threads keep their warnings apart.  Warnings are kept
+    when the logging configuration lets them through for the
+    ``adl2pydm`` loggers (as it does by default).
+
+    Parameters
+    ----------
+    adl : str or bytes
+        The content of the .adl file.
+    adl_filename : str
+        Name of the .adl file, used for messages and for
+        the title of a screen that does not have one.
+    pretty : bool
+        Indent the .ui content, one XML element per line.
+    stylesheet : str
+        Text of the Qt stylesheet, default: none.  If None,
+        ``stylesheet.qss`` is looked up in the current directory
+        or in PYDM_DISPLAYS_PATH, as when converting a file.
+
+    Returns
+    -------
+    ConversionResult
+    """
+    if isinstance(adl, str):
+        buf = adl.splitlines(keepends=True)
+    else:
+        buf = adl
+
+    collector = _WarningCollector()
+    package_logger = logging.getLogger(__package__)
+    package_logger.addHandler(collector)
+    try:
+        screen = adl_parser.MedmMainWidget(adl_filename, structured=True)
+        screen.parseAdlBuffer(buf)
+        ui_file = io.StringIO()
+        writer = output_handler.Widget2Pydm(pretty=pretty, stylesheet=stylesheet)
+        writer.write_ui(screen, None, ui_file=ui_file)
+    finally:
+        package_logger.removeHandler(collector)
+
+    # as write_ui() names the screen
+    title = screen.title or os.path.split(os.path.splitext(adl_filename)[0])[-1]
+    return ConversionResult(
+        ui_file.getvalue().encode("utf-8"), title, tuple(collector.messages))
 
 
 def get_user_parameters():
@@ -79,7 +196,71 @@ def get_user_parameters():
             "instead of `PyDMWaveformPlot`, default=False"),
         )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--mmap", 
+        action="store_true",
+        default=False,
+        help=(
+            "Read each '.adl' file through a memory map "
+            "instead of as a list of lines"
+            " (not with --cache or --workers), default=False"),
+        )
+
+    parser.add_argument(
+        "--compact", 
+        action="store_true",
+        default=False,
+        help=(
+            "Write each '.ui' file without indentation"
+            " and line breaks, default=False"),
+        )
+
+    parser.add_argument(
+        "--cache", 
+        action="store_true",
+        default=False,
+        help=(
+            "Keep parsed '.adl' files in a cache directory"
+            f" (default: {parse_cache.defaultCacheDir()})"
+            " and reuse them while the file content is unchanged"
+            ", default=False"),
+        )
+
+    parser.add_argument(
+        "--cache-dir", 
+        action="store",
+        dest="cache_dir",
+        default=None,
+        help="directory of the parse cache (implies --cache)",
+        )
+
+    parser.add_argument(
+        "--workers", 
+        action="store",
+        type=int,
+        default=None,
+        help=(
+            "Parse the widgets of large '.adl' files"
+            " with this many processes, default: one"),
+        )
+
+    parser.add_argument(
+        "--record-sources", 
+        action="store_true",
+        default=False,
+        help=(
+            "Record the '.adl' file of each '.ui' file in a hidden file"
+            " beside it, so later runs give it the same name"
+            ", default=False"),
+        )
+
+    options = parser.parse_args()
+    if options.mmap:
+        if options.cache or options.cache_dir is not None:
+            parser.error("--mmap cannot be combined with --cache")
+        if options.workers is not None and options.workers > 1:
+            parser.error("--mmap cannot be combined with --workers")
+    return options
 
 
 def configure_logging(options):
@@ -109,15 +290,30 @@ def main():
         from .symbols import adl_widgets
         adl_widgets["cartesian plot"]["pydm_widget"] = "PyDMScatterPlot"
 
+    cache = None
+    if options.cache or options.cache_dir is not None:
+        cache = parse_cache.ParseCache(options.cache_dir)
+
+    executor = None
+    if options.workers is not None and options.workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(options.workers)
+
+    ui_names = output_handler.UiFileNames(record=options.record_sources)
     for adlfile in options.adlfiles:
         try:
-            processFile(adlfile, options.dir)
+            processFile(
+                adlfile, options.dir, 
+                use_mmap=options.mmap, cache=cache, executor=executor,
+                pretty=not options.compact, ui_names=ui_names)
         except Exception as exc:
             logger.error(
                 f"error processing {adlfile}:"
                 f" {exc}"
             )
 
+    if executor is not None:
+        executor.shutdown()
+
 
 # if __name__ == "__main__":
 #     main()
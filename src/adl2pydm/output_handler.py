@@ -6,22 +6,37 @@ Only rely on packages in the standard Python distribution. (rules out lxml)
 """
 
 from collections import namedtuple
+import functools
+import hashlib
+import itertools
 import json
 import logging
 import os
-from xml.dom import minidom
+import tempfile
+import threading
+import time
+import types
 from xml.etree import ElementTree
 
 from . import symbols
-from .adl_parser import Color, Geometry
-from .calc2rules import convertCalcToRuleExpression
+from .adl_parser import Color, loadEntryPoints, walkWidgets
+from .calc2rules import CALC_VARIABLES, RULE_CHANNEL_PATTERN
+from .calc2rules import convertCalcToRule, convertCalcToRuleExpression
 
 
 QT_STYLESHEET_FILE = "stylesheet.qss"
 # the stylesheet should be in one of the directories in PYDM_DISPLAYS_PATH
 ENV_PYDM_DISPLAYS_PATH = "PYDM_DISPLAYS_PATH"
+# seconds before cached PYDM_DISPLAYS_PATH directories and files are checked again
+DISPLAY_PATH_CHECK_INTERVAL = 1.0
 SCREEN_FILE_EXTENSION = ".ui"
+UI_SOURCE_SUFFIX = ".source"   # records the .adl file of a .ui file
+# "dynamic attribute" channels, in order of the MEDM calc variables: A, B, ...
+MEDM_CALC_CHANNELS = ("chan", "chanB", "chanC", "chanD")
 DEFAULT_NUMBER_OF_POINTS = 1200
+CUSTOM_WIDGETS_CACHE_SIZE = 64     # distinct <customwidgets> sections kept
+# entry point group for packages that provide PyDM widget writers
+PYDM_WIDGET_ENTRY_POINTS = "adl2pydm.pydm_widgets"
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +58,16 @@ def convertMacros(macros):
     return macros.replace("(", "{").replace(")", "}")
 
 
+def incrementDecimals(increment):
+    """
+    number of decimals of an increment (such as MEDM's ``dPrecision``)
+
+    ``0.01`` has 2 decimals, ``0.25`` has 2, ``1.0`` has none.
+    """
+    text = f"{abs(increment):.6f}".rstrip("0")    # as MEDM writes it
+    return len(text.partition(".")[-1])
+
+
 def replaceExtension(filename):
     """
     convert filename.adl to filename.ui
@@ -62,31 +87,100 @@ def convertDynamicAttribute_to_Rules(attr):
     MEDM  `$(P)`
     PyDM  `${P}`
     ====  ======
+
+    A calc that cannot be converted is reported
+    and no rule is returned.
     """
+    try:
+        return [_visibilityRule(attr)]
+    except ValueError as exc:
+        logger.warning(f"dynamic attribute not converted to a rule: {exc}")
+        return []
+
+
+def _visibilityRule(attr):
     rule = dict(name="visibility", property="Visible")
-    channels = {}
-    for nm, ref in dict(chan="A", chanB="B", chanC="C", chanD="D").items():
+    pvs = {}
+    for idx, nm in enumerate(MEDM_CALC_CHANNELS):
         if nm in attr:
-            pv = convertMacros(attr[nm])
-            channels[ref] = dict(channel=pv, trigger=len(pv)>0)
+            pvs[idx] = convertMacros(attr[nm])
 
     calc = attr.get("calc")
     if calc is not None and len(calc) > 0:
         logger.info(f"CALC: {calc}")
 
-    if len(channels) > 0:
+    if len(pvs) > 0:
         visibility_calc = {
             "if zero": " == 0",
             "if not zero": " != 0",
             "calc": calc
         }[attr.get("vis", "if not zero")]
-        rule["channels"] = list(channels.values())
         if calc is None:
             calc = "a" + visibility_calc
+        calc_rule = convertCalcToRule(calc)
+        channels, calc_rule = minimizeRuleChannels(calc_rule, pvs)
+        rule["channels"] = channels
+        rule["expression"] = calc_rule.expression
+    else:
+        rule["expression"] = convertCalcToRuleExpression(calc)
 
-    rule["expression"] = convertCalcToRuleExpression(calc)
+    return rule
 
-    return [rule]
+
+def minimizeRuleChannels(calc_rule, pvs):
+    """
+    Return the PyDM rule channels actually used by ``calc_rule``.
+
+    Every triggering channel makes PyDM evaluate the rule again.
+    Channels not used by the expression are dropped and a PV used
+    by more than one MEDM calc variable becomes a single channel.
+    The expression is renumbered to match.  When the channels
+    used cannot be told (such as a channel without a PV), all
+    channels are kept, in order, and the rule is not changed.
+
+    Parameters
+    ----------
+    calc_rule : calc2rules.CalcRule
+        The converted rule expression.
+    pvs : dict
+        PV of each MEDM calc channel, by index: ``{0: "$(P)alldone"}``.
+
+    Returns
+    -------
+    (list, calc2rules.CalcRule)
+        The PyDM rule channels and the renumbered rule.
+    """
+    referenced = calc_rule.channels
+    in_text = {int(i) for i in RULE_CHANNEL_PATTERN.findall(calc_rule.expression)}
+    undefined = [CALC_VARIABLES[idx] for idx in referenced if idx not in pvs]
+    if set(referenced) != in_text or len(undefined) > 0:
+        # cannot tell which channels are used: keep them all, as given
+        if len(undefined) > 0:
+            logger.warning(
+                f"rule '{calc_rule.expression}'"
+                f" uses undefined channel(s) {', '.join(undefined)}"
+            )
+        channels = [dict(channel=pv, trigger=len(pv) > 0) for pv in pvs.values()]
+        return channels, calc_rule
+
+    if len(referenced) == 0:
+        # constant expression: one channel to have it evaluated
+        referenced = [min(pvs)]
+
+    channels = []
+    mapping = {}
+    by_pv = {}
+    for idx in referenced:
+        pv = pvs[idx]
+        if pv in by_pv and len(pv) > 0:
+            mapping[idx] = by_pv[pv]
+            continue
+        mapping[idx] = by_pv[pv] = len(channels)
+        channels.append(dict(channel=pv, trigger=len(pv) > 0))
+
+    if any(k != v for k, v in mapping.items()):
+        calc_rule = calc_rule.renumbered(mapping)
+    return channels, calc_rule
 
 
 class Widget2Pydm(object):
@@ -105,61 +199,49 @@ class Widget2Pydm(object):
 
     """
     
-    def __init__(self):
-        self.custom_widgets = []
-        self.unique_widget_names = {}
-        self.pydm_widget_handlers = {
-            "arc" : self.write_block_arc,
-            "bar" : self.write_block_bar,
-            "byte" : self.write_block_byte_indicator,
-            "cartesian plot" : self.write_block_cartesian_plot,
-            "choice button" : self.write_block_choice_button,
-            "composite" : self.write_block_composite,
-            "embedded display" : self.write_block_embedded_display,
-            "image" : self.write_block_image,
-            "indicator" : self.write_block_indicator,
-            "menu" : self.write_block_menu,
-            "message button" : self.write_block_message_button,
-            "meter" : self.write_block_meter,
-            "oval" : self.write_block_oval,
-            "polygon" : self.write_block_polygon,
-            "polyline" : self.write_block_polyline,
-            "rectangle" : self.write_block_rectangle,
-            "related display" : self.write_block_related_display,
-            "shell command" : self.write_block_shell_command,
-            "strip chart" : self.write_block_strip_chart,
-            "text" : self.write_block_text,
-            "text entry" : self.write_block_text_entry,
-            "text update" : self.write_block_text_update,
-            "valuator" : self.write_block_valuator,
-            "wheel switch" : self.write_block_wheel_switch,
-            }
+    def __init__(self, pretty=True, stylesheet=None):
+        self.custom_widgets = {}        # PyDM classes used (ordered set)
+        self.unique_widget_names = {}   # suggestion: next index number
+        self.pretty = pretty    # indented .ui file?
+        self.stylesheet = stylesheet    # text, default: see PYDM_Writer
     
     def get_unique_widget_name(self, suggestion):
         """
         return a widget name that is not already in use
         
         Qt requires that all widgets have a unique name.
-        This algorithm keeps track of all widget names in use 
-        (basedon the suggested name) and, if the suggested name
-        exists, generates a new name with an index number suffixed.
+        The first widget gets the suggested name, the next ones
+        get the name with an index number suffixed (``rectangle``,
+        ``rectangle_1``, ``rectangle_2``, ...).
+
+        Only a counter is kept for each suggestion (constant time
+        and memory per widget).  A suffixed name that is (or was)
+        given as a suggestion is skipped, and a suggestion that was
+        handed out with a suffix gets a suffix of its own.
         """
-        unique = suggestion
-        
-        if unique in self.unique_widget_names:
-            knowns = self.unique_widget_names[suggestion]
-            unique = "%s_%d" % (suggestion, len(knowns))
-            if unique in self.unique_widget_names:
-                msg = "trouble getting a unique name from " + suggestion
-                msg += "\n  complicated:\n%s" % str(unique_widget_names)
-                raise ValueError(msg)
-        else:
-            unique = suggestion
-            self.unique_widget_names[suggestion] = []
+        counters = self.unique_widget_names     # suggestion: next index
+
+        def handed_out(name):
+            """was this name given with a suffix?"""
+            base, sep, index = name.rpartition("_")
+            return (
+                sep == "_"
+                and index.isdigit()
+                and str(int(index)) == index
+                and 0 < int(index) < counters.get(base, 0)
+            )
+
+        if suggestion not in counters and not handed_out(suggestion):
+            counters[suggestion] = 1
+            return suggestion
     
-        # add this one to the list
-        self.unique_widget_names[suggestion].append(unique)
-        
+        index = counters.get(suggestion, 1)
+        unique = "%s_%d" % (suggestion, index)
+        while unique in counters:
+            # already handed out as a suggestion
+            index += 1
+            unique = "%s_%d" % (suggestion, index)
+        counters[suggestion] = index + 1
         return unique
     
     def get_channel(self, contents):
@@ -177,8 +259,9 @@ class Widget2Pydm(object):
         if len(attr) > 0:
             # see: http://slaclab.github.io/pydm/widgets/widget_rules/index.html
             rules = convertDynamicAttribute_to_Rules(attr)
-            json_rules = jsonEncode(rules)
-            self.writer.writeProperty(widget, "rules", json_rules, stdset="0")
+            if len(rules) > 0:
+                json_rules = jsonEncode(rules)
+                self.writer.writeProperty(widget, "rules", json_rules, stdset="0")
         
     def write_basic_attribute(self, qw, block):
         attr = block.contents.get("basic attribute")
@@ -205,41 +288,51 @@ class Widget2Pydm(object):
             propty = self.writer.writeOpenProperty(qw, "penWidth", stdset="0")
             width = attr.get("width", 0)
             if fill == "NoBrush":
-                width = max(1, float(width))   # make sure the outline is seen
+                width = max(1, width)   # make sure the outline is seen
             self.writer.writeTaggedString(propty, "double", str(width))
 
             propty = self.writer.writeOpenProperty(qw, "penCapStyle", stdset="0")
             self.writer.writeTaggedString(propty, "enum", "Qt::FlatCap")
 
-            block.color = None
+    def write_block(self, parent, block, geometry=None):
+        """
+        write the widget (not its children) in the parent XML element
 
-    def write_block(self, parent, block):
-        nm = self.get_unique_widget_name(block.symbol.replace(" ", "_"))
+        ``geometry`` is relative to the parent widget, default: ``block.geometry``.
+        Returns the XML element of the widget.
+        The parsed ``block`` is not changed (it may be written again).
+        """
+        symbol = block.symbol
+        nm = self.get_unique_widget_name(symbol.replace(" ", "_"))
 
-        if (block.symbol == "composite" 
+        if (symbol == "composite" 
                 and len(block.widgets) == 0 
                 and "composite file" in block.contents):
-            block.symbol = "embedded display"
+            symbol = "embedded display"
 
-        widget_info = symbols.adl_widgets.get(block.symbol)
+        widget_info = symbols.adl_widgets.get(symbol)
         if widget_info is not None:
             cls = widget_info["pydm_widget"]
-            if cls not in self.custom_widgets:
-                self.custom_widgets.append(cls)
+            self.custom_widgets.setdefault(cls)
 
-        handler = self.pydm_widget_handlers.get(
-            block.symbol, 
-            self.write_block_default)
+        handler = getPydmWidgetHandler(symbol)
+        if handler is None:
+            handler = self.write_block_default
+        elif isinstance(handler, str):
+            handler = getattr(self, handler)
+        else:
+            handler = functools.partial(handler, self)
         cls = widget_info["pydm_widget"]
         # if block.symbol.find("chart") >= 0:
         #     _z = 2
         # TODO: PyDMDrawingMMM (Line, Polygon, Oval, ...) need more decisions here 
         qw = self.writer.writeOpenTag(parent, "widget", cls=cls, name=nm)
-        self.write_geometry(qw, block.geometry)
+        self.write_geometry(qw, geometry or block.geometry)
         # self.write_stylesheet(qw, block)
         handler(parent, block, nm, qw)
-        msg = "(#%d) %s -> %s: %s" % (block.line_offset, block.symbol, cls, nm)
+        msg = "(#%d) %s -> %s: %s" % (block.line_offset, symbol, cls, nm)
         logger.debug(msg)
+        return qw
 
     def write_color_element(self, xml_element, color, **kwargs):
         if color is not None:
@@ -284,43 +377,84 @@ class Widget2Pydm(object):
         font = self.writer.writeOpenTag(propty, "font")
         self.writer.writeTaggedString(font, "pointsize", str(pointsize))
 
-    def write_ui(self, screen, output_path):
-        """main entry point to write the .ui file"""
+    def write_ui(self, screen, output_path, widgets=None, ui_file=None, ui_names=None):
+        """
+        main entry point to write the .ui file
+
+        ``widgets`` is an iterable of the top-level widgets to write,
+        default: ``screen.widgets``.  To write while the .adl file
+        is parsed, use ``screen.iterAdlWidgets()``.
+        ``ui_file`` is a text file object (such as ``io.StringIO``)
+        to write, instead of a file in ``output_path``.
+        ``ui_names`` (``UiFileNames``) gives the .ui file name, unique
+        in a run, default: the screen title.
+        """
+        if widgets is None:
+            widgets = screen.widgets
+        widgets = iter(widgets)
+        # screen attributes are parsed before the first widget
+        first = next(widgets, None)
+        if first is not None:
+            widgets = itertools.chain([first], widgets)
+
         window_class = "QWidget"
         # window_class = "QMainWindow"
         title = screen.title or os.path.split(os.path.splitext(screen.given_filename)[0])[-1]
-        ui_filename = os.path.join(output_path, title + SCREEN_FILE_EXTENSION)
-        self.writer = PYDM_Writer(None)
-
-        root = self.writer.openFile(ui_filename)
-        logging.info("writing screen file: " + ui_filename)
-        self.writer.writeTaggedString(root, "class", "Dialog")
-        form = self.writer.writeOpenTag(root, "widget", cls=window_class, name="screen")
+        self.writer = PYDM_Writer(None, pretty=self.pretty, stylesheet=self.stylesheet)
+
+        if ui_file is None:
+            ui_filename = os.path.join(output_path, title + SCREEN_FILE_EXTENSION)
+            if ui_names is not None:
+                ui_filename = ui_names.claim(screen.given_filename, ui_filename)
+            root = self.writer.openFile(ui_filename)
+            logging.info("writing screen file: " + ui_filename)
+        else:
+            root = self.writer.openFile(ui_file)
+        try:
+            self.writer.writeTaggedString(root, "class", "Dialog")
+            form = self.writer.writeOpenTag(root, "widget", cls=window_class, name="screen")
         
-        self.write_geometry(form, screen.geometry)
-        self.write_stylesheet(form, screen)
+            self.write_geometry(form, screen.geometry)
+            self.write_stylesheet(form, screen)
     
-        propty = self.writer.writeOpenProperty(form, "windowTitle")
-        self.writer.writeTaggedString(propty, value=title)
+            propty = self.writer.writeOpenProperty(form, "windowTitle")
+            self.writer.writeTaggedString(propty, value=title)
     
-        for i, widget in enumerate(screen.widgets):
-            # handle "widget" if it is a known screen component
-            logger.debug(
-                f"WIDGET {screen.given_filename}"
-                f" {widget.line_offset}"
-                f" {i+1}/{len(screen.widgets)}"
-                f" {widget.symbol}"
-            )
-            self.write_block(form, widget)
+            elements = {}   # id(composite widget): its XML element
+            for i, node in enumerate(walkWidgets(widgets)):
+                # handle "widget" if it is a known screen component
+                widget = node.widget
+                logger.debug(
+                    f"WIDGET {screen.given_filename}"
+                    f" {widget.line_offset}"
+                    f" #{i+1}"
+                    f" {widget.symbol}"
+                )
+                if node.depth == 0:
+                    # previous top-level widgets are complete
+                    self.writer.flush(form)
+                    elements.clear()
+                    parent = form
+                else:
+                    parent = elements[id(node.parent)]
+                # in MEDM, composites use absolute positioning
+                # in PyDM, composites use relative positioning
+                qw = self.write_block(parent, widget, node.relativeGeometry())
+                if hasattr(widget, "widgets"):
+                    elements[id(widget)] = qw
         
-        # TODO: self.write widget <zorder/> elements here (#7)
+            # TODO: self.write widget <zorder/> elements here (#7)
     
-        self.write_customwidgets(root)
+            self.write_customwidgets(root)
     
-        # TODO: write .ui file <resources/> elements here (#9)
-        # TODO: write .ui file <connections/> elements here (#10)
+            # TODO: write .ui file <resources/> elements here (#9)
+            # TODO: write .ui file <connections/> elements here (#10)
         
-        self.writer.closeFile()
+            self.writer.closeFile()
+        except BaseException:
+            # leave any existing .ui file as it was
+            self.writer.discardFile()
+            raise
     
     def writePropertyBoolean(self, widget, tag, value, **kwargs):
         self.writer.writeProperty(widget, tag, str(value).lower(), tag="bool", **kwargs)
@@ -393,15 +527,10 @@ class Widget2Pydm(object):
         self.write_color_element(color, block.color)
         color = self.writer.writeOpenProperty(qw, "backgroundColor", stdset="0")
         self.write_color_element(color, block.background_color)
-        block.color = None
-        block.background_color = None
 
     def write_block_byte_indicator(self, parent, block, nm, qw):
-        try:
-            ebit = int(block.contents.get("ebit", 0))
-            sbit = int(block.contents.get("sbit", 0))
-        except Exception as exc:
-            logger.critical(f"sbit/ebit: {exc}")
+        ebit = block.contents.get("ebit", 0)
+        sbit = block.contents.get("sbit", 0)
         numBits = 1 + max(ebit, sbit) - min(ebit, sbit)
         if numBits < 1:
             wmsg = "number of bits = %d" % numBits
@@ -415,8 +544,6 @@ class Widget2Pydm(object):
         self.write_color_element(color, block.color)
         color = self.writer.writeOpenProperty(qw, "offColor", stdset="0")
         self.write_color_element(color, block.background_color)
-        block.color = None
-        block.background_color = None
 
         self.write_direction(qw, block)
         self.writePropertyBoolean(qw, "showLabels", False, stdset="0")
@@ -475,15 +602,6 @@ class Widget2Pydm(object):
         self.writer.writeProperty(qw, "title", block.title, stdset="0")
 
         count = block.contents.get("count", DEFAULT_NUMBER_OF_POINTS)
-        try:
-            count = int(count)
-        except ValueError:
-            logger.warning(
-                "number of plot points must be an integer, "
-                f"using {DEFAULT_NUMBER_OF_POINTS} points "
-                f"instead of '{count}'"
-            )
-            count = DEFAULT_NUMBER_OF_POINTS
 
         xlabel = block.contents.get("xlabel")
         ylabel = block.contents.get("ylabel")
@@ -538,26 +656,11 @@ class Widget2Pydm(object):
         self.write_color_element(color, block.color)
         color = self.writer.writeOpenProperty(qw, "backgroundColor", stdset="0")
         self.write_color_element(color, block.background_color)
-        block.color = None
-        block.background_color = None
-
 
     def write_block_composite(self, parent, block, nm, qw):
         # self.write_tooltip(qw, nm)
         self.write_dynamic_attribute(qw, block)
-        x0 = block.geometry.x
-        y0 = block.geometry.y
-        for widget in block.widgets:
-            # in MEDM, composites use absolute positioning
-            # in PyDM, composites use relative positioning
-            # subtract x,y of the composite from each widget
-            widget.geometry = Geometry(
-                widget.geometry.x - x0,
-                widget.geometry.y - y0,
-                widget.geometry.width,
-                widget.geometry.height,
-            )
-            self.write_block(qw, widget)
+        # write_ui() writes the widgets of the composite
 
     def write_block_embedded_display(self, parent, block, nm, qw):
         self.write_tooltip(qw, nm)
@@ -655,10 +758,7 @@ class Widget2Pydm(object):
         penColor = self.writer.writeOpenProperty(qw, "penColor", stdset="0")
         self.write_color_element(penColor, block.color)
 
-        block.color = None
-        block.background_color = None
-
-        penWidth = float(ba.get("width", 0))
+        penWidth = ba.get("width", 0)
         if penWidth > 0:
             self.writer.writeProperty(
                 qw, "penWidth", penWidth, tag="double", stdset="0")
@@ -672,43 +772,29 @@ class Widget2Pydm(object):
         self.write_dynamic_attribute(qw, block)
         # FIXME: needs to support fill = "solid"
         ba = block.contents.get("basic attribute", {})
-        try:
-            penWidth = int(ba.get("width", 1))
-        except Exception as exc:
-            logger.critical(f"penWidth: {exc}")
-            penWidth = 1
-
-        pt_list = []
-        for pt in block.points:
-            # translate global to local
-            x = pt.x - block.geometry.x - penWidth
-            y = pt.y - block.geometry.y - penWidth
-            pt_list.append("%d, %d" % (x, y))
-        self.writePropertyStringlist(qw, "points", pt_list, stdset="0")
+        penWidth = ba.get("width", 1)
+
+        # translate global to local
+        points = block.points.translated(
+            -block.geometry.x - penWidth, -block.geometry.y - penWidth)
+        self.writePropertyStringlist(qw, "points", points.strings("%d, %d"), stdset="0")
 
     def write_block_polyline(self, parent, block, nm, qw):
         self.write_tooltip(qw, nm)
         self.write_basic_attribute(qw, block)
         self.write_dynamic_attribute(qw, block)
         ba = block.contents.get("basic attribute", {})
-        try:
-            penWidth = int(ba.get("width", 1))
-        except Exception as exc:
-            logger.critical(f"penWidth: {exc}")
-            penWidth = 1
+        penWidth = ba.get("width", 1)
 
         da = block.contents.get("dynamic attribute", {})
         pv = self.get_channel(da)
         if pv is not None:
             self.write_channel(qw, pv)
 
-        pt_list = []
-        for pt in block.points:
-            # translate global to local
-            x = pt.x - block.geometry.x - penWidth
-            y = pt.y - block.geometry.y - penWidth
-            pt_list.append("%d, %d" % (x, y))
-        self.writePropertyStringlist(qw, "points", pt_list, stdset="0")
+        # translate global to local
+        points = block.points.translated(
+            -block.geometry.x - penWidth, -block.geometry.y - penWidth)
+        self.writePropertyStringlist(qw, "points", points.strings("%d, %d"), stdset="0")
 
     def write_block_rectangle(self, parent, block, nm, qw):
         self.write_basic_attribute(qw, block)
@@ -785,7 +871,7 @@ class Widget2Pydm(object):
             # The period is the time between updates (s)
             self.writer.writeProperty(
                 qw, "updateInterval", 
-                str(period), 
+                period, 
                 tag="double", 
                 stdset="0")
 
@@ -874,10 +960,11 @@ class Widget2Pydm(object):
         # self.assertEqualPropertyBool(w, "showLimitLabels", False)
 
         # TODO: https://github.com/BCDA-APS/adl2pydm/issues/37
-        precision = block.contents.get("dPrecision")
-        if precision is not None:
+        increment = block.contents.get("dPrecision")
+        if increment is not None:
+            # Qt wants the number of decimals
             self.writer.writeProperty(
-                qw, "precision", str(precision), tag="number")
+                qw, "precision", incrementDecimals(increment), tag="number")
 
     def write_block_wheel_switch(self, parent, block, nm, qw):
         pv = self.get_channel(block.contents["control"])
@@ -972,33 +1059,16 @@ class Widget2Pydm(object):
             ss.text = style
     
     def write_customwidgets(self, parent):
-        cw_set = self.writer.writeOpenTag(parent, "customwidgets")
-        
         # some custom widgets extend other custom widgets
         # include any inheritances
         # example: PyDMDrawingPie extends PyDMDrawingArc
-        while True:     # do..until
-            additions = []
-            for widget in self.custom_widgets:
-                if widget == "PyDMDrawingPie":
-                    logger.debug("breakpoint")
-                item = symbols.pydm_widgets.get(widget)
-                if item is not None:
-                    klass = item.extends
-                    if klass.startswith("PyDM") and klass not in additions+self.custom_widgets:
-                        additions.append(klass)
-            if len(additions) > 0:
-                self.custom_widgets += additions
-            else:
-                break   #recurse until no new additions
-
-        for widget in self.custom_widgets:
-            item = symbols.pydm_widgets.get(widget)
-            if item is not None:
-                cw = self.writer.writeOpenTag(cw_set, "customwidget")
-                self.writer.writeTaggedString(cw, "class", item.cls)
-                self.writer.writeTaggedString(cw, "extends", item.extends)
-                self.writer.writeTaggedString(cw, "header", item.header)
+        classes = symbols.pydmCustomWidgetClasses(self.custom_widgets)
+        items = tuple(
+            symbols.pydm_widgets[cls]
+            for cls in classes
+            if cls in symbols.pydm_widgets
+        )
+        parent.append(customWidgetsElement(items))
     
     def write_geometry(self, parent, geom):
         propty = self.writer.writeOpenProperty(parent, "geometry")
@@ -1055,13 +1125,13 @@ class Widget2Pydm(object):
             self.writer.writeProperty(
                 qw, 
                 hiLimitName, 
-                block.contents.get("hoprDefault", str(0.0)), 
+                block.contents.get("hoprDefault", 0.0), 
                 tag="double", 
                 stdset="0")
             self.writer.writeProperty(
                 qw, 
                 loLimitName, 
-                block.contents.get("loprDefault", str(0.0)), 
+                block.contents.get("loprDefault", 0.0), 
                 tag="double", 
                 stdset="0")
 
@@ -1075,6 +1145,83 @@ class Widget2Pydm(object):
         self.writer.writeTaggedString(propty, value=tip)
 
 
+# MEDM widget symbol: name of the Widget2Pydm method (or function) that writes it
+_pydm_widget_handlers = {
+    "arc" : "write_block_arc",
+    "bar" : "write_block_bar",
+    "byte" : "write_block_byte_indicator",
+    "cartesian plot" : "write_block_cartesian_plot",
+    "choice button" : "write_block_choice_button",
+    "composite" : "write_block_composite",
+    "embedded display" : "write_block_embedded_display",
+    "image" : "write_block_image",
+    "indicator" : "write_block_indicator",
+    "menu" : "write_block_menu",
+    "message button" : "write_block_message_button",
+    "meter" : "write_block_meter",
+    "oval" : "write_block_oval",
+    "polygon" : "write_block_polygon",
+    "polyline" : "write_block_polyline",
+    "rectangle" : "write_block_rectangle",
+    "related display" : "write_block_related_display",
+    "shell command" : "write_block_shell_command",
+    "strip chart" : "write_block_strip_chart",
+    "text" : "write_block_text",
+    "text entry" : "write_block_text_entry",
+    "text update" : "write_block_text_update",
+    "valuator" : "write_block_valuator",
+    "wheel switch" : "write_block_wheel_switch",
+    }
+_pydm_widget_plugins_loaded = False
+
+"""MEDM widget symbol: writer of the PyDM widget (read-only)"""
+pydm_widget_handlers = types.MappingProxyType(_pydm_widget_handlers)
+
+
+def _loadPydmWidgetPlugins():
+    global _pydm_widget_plugins_loaded
+    if not _pydm_widget_plugins_loaded:
+        _pydm_widget_plugins_loaded = True
+        for symbol, handler in loadEntryPoints(PYDM_WIDGET_ENTRY_POINTS):
+            logger.debug(f"MEDM widget '{symbol}' written by {handler}")
+            _registerPydmWidgetHandler(
+                symbol, handler, getattr(handler, "pydm_widget", None))
+
+
+def _registerPydmWidgetHandler(symbol, handler, pydm_widget):
+    if pydm_widget is not None:
+        widget_info = symbols.adl_widgets.setdefault(
+            symbol, dict(type="static", pydm_widget=pydm_widget))
+        widget_info["pydm_widget"] = pydm_widget
+    _pydm_widget_handlers[symbol] = handler
+
+
+def getPydmWidgetHandler(symbol):
+    """return the writer for the MEDM widget (or None)"""
+    _loadPydmWidgetPlugins()
+    return _pydm_widget_handlers.get(symbol)
+
+
+def registerPydmWidgetHandler(symbol, handler, pydm_widget=None):
+    """
+    register the function that writes the MEDM widget ``symbol``
+
+    The function is called as ``handler(writer, parent, block, nm, qw)``
+    with the same arguments as the ``Widget2Pydm.write_block_*()`` methods.
+    ``pydm_widget`` (PyDM class name, such as "PyDMLabel") is required
+    for a symbol not described in ``symbols.adl_widgets``.
+
+    Packages can also register functions with an entry point
+    in the ``adl2pydm.pydm_widgets`` group, named for the symbol.
+    The function may name its PyDM class in a ``pydm_widget`` attribute.
+    These are loaded when the first widget is written.
+    """
+    _loadPydmWidgetPlugins()     # explicit registration has the last word
+    if pydm_widget is None and symbol not in symbols.adl_widgets:
+        raise ValueError(f"PyDM widget class needed for MEDM widget '{symbol}'")
+    _registerPydmWidgetHandler(symbol, handler, pydm_widget)
+
+
 """
 control the stacking order of Qt widgets - important!
 
@@ -1110,52 +1257,274 @@ Example how the zorder is given in the .ui file:
 Qt_zOrder = namedtuple('Qt_zOrder', 'order vis text')
 
 
+class CachedElement(ElementTree.Element):
+    """
+    XML element that is written as text once, then reused
+
+    Do not change a cached element (nor its children) once written.
+    """
+
+    def __init__(self, *args, **kwargs):
+        ElementTree.Element.__init__(self, *args, **kwargs)
+        self.fragments = {}     # (indent, addindent, newl): text
+
+
+@functools.lru_cache(maxsize=CUSTOM_WIDGETS_CACHE_SIZE)
+def customWidgetsElement(items):
+    """
+    the (cached) ``<customwidgets>`` element
+
+    ``items`` is a tuple of ``symbols.PyDM_CustomWidget``.
+    """
+    cw_set = CachedElement("customwidgets")
+    for item in items:
+        cw = ElementTree.SubElement(cw_set, "customwidget")
+        ElementTree.SubElement(cw, "class").text = item.cls
+        ElementTree.SubElement(cw, "extends").text = item.extends
+        ElementTree.SubElement(cw, "header").text = item.header
+    return cw_set
+
+
+def _xmlText(text):
+    """text as written by ``minidom`` after an XML parser read it"""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return _xmlEscape(text)
+
+
+def _xmlEscape(text):
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _xmlStartTag(element):
+    attributes = "".join(
+        f' {k}="{_xmlEscape(str(v))}"' for k, v in element.attrib.items())
+    return f"<{element.tag}{attributes}"
+
+
+def writeXmlElement(write, element, indent="", addindent="", newl=""):
+    """
+    write an ElementTree element as ``minidom``'s ``writexml()`` does
+
+    The text is identical to ``ElementTree.tostring()`` read
+    by ``minidom.parseString()`` and written by ``toprettyxml()``
+    (or ``toxml()`` with empty ``addindent`` and ``newl``)
+    but needs neither the intermediate string nor the DOM.
+    The element is written depth-first, without recursion.
+
+    ``write`` is called with each piece of text, such as
+    ``file.write`` or ``list.append``.
+    """
+    stack = [(element, indent, None)]   # (element or text, indent, end tag)
+    while len(stack) > 0:
+        item, indent, end = stack.pop()
+        if end is not None:
+            write(end)
+            continue
+        if isinstance(item, str):
+            write(_xmlText(indent + item + newl))
+            continue
+        if type(item) is CachedElement:
+            key = (indent, addindent, newl)
+            text = item.fragments.get(key)
+            if text is None:
+                plain = ElementTree.Element(item.tag, item.attrib)
+                plain.text = item.text
+                plain.extend(item)
+                parts = []
+                writeXmlElement(parts.append, plain, indent, addindent, newl)
+                text = item.fragments[key] = "".join(parts)
+            write(text)
+            continue
+        write(indent + _xmlStartTag(item))
+        text = item.text or ""
+        if len(item) == 0:
+            if len(text) == 0:
+                write("/>" + newl)
+            else:
+                write(f">{_xmlText(text)}</{item.tag}>{newl}")
+            continue
+        write(">" + newl)
+        inner = indent + addindent
+        stack.append((None, None, f"{indent}</{item.tag}>{newl}"))
+        for child in reversed(item):
+            if child.tail:
+                stack.append((child.tail, inner, None))
+            stack.append((child, inner, None))
+        if len(text) > 0:
+            stack.append((text, inner, None))
+
+
 class PYDM_Writer(object):
     """
     write the screen description to a PyDM .ui file
+
+    The XML is built with ``ElementTree``.  Each ``flush()`` writes
+    (and releases) the completed content so far, the rest is
+    written by ``closeFile()``.  The text is identical to
+    ``minidom``'s ``toprettyxml()`` (or ``toxml()`` if not ``pretty``).
+
+    ``stylesheet`` is the text of the Qt stylesheet (``""``: none).
+    By default, ``stylesheet.qss`` is looked up (with the ``resolver``)
+    in the current directory or in PYDM_DISPLAYS_PATH.
     """
 
-    def __init__(self, adlParser):
+    def __init__(self, adlParser, pretty=True, resolver=None, stylesheet=None):
         self.adlParser = adlParser
+        self.resolver = resolver or sharedDisplayPathResolver()
         self.filename = None
         self.path = None
         self.file_suffix = SCREEN_FILE_EXTENSION
-        self.stylesheet = None
+        self.stylesheet = stylesheet
         self.root = None
         self.outFile = None
         self.widget_stacking_info = []        # stacking order
+        self.pretty = pretty
+        self._stream = None     # the open output file (or buffer)
+        self._open = []         # (element, indent) with start tag written
+        self.unchanged = False  # the .ui file had the same content?
     
     def openFile(self, outFile):
-        """actually, begin to create the .ui file content IN MEMORY"""
-        if os.environ.get(ENV_PYDM_DISPLAYS_PATH) is None:
-            msg = "Environment variable %s is not defined." % "PYDM_DISPLAYS_PATH"
-            logger.info(msg)
+        """
+        begin to create the .ui file content
 
-        sfile = findFile(QT_STYLESHEET_FILE)
-        if sfile is None:
-            msg = "file not found: " + QT_STYLESHEET_FILE
-            logger.info(msg)
-        else:
-            with open(sfile, "r") as fp:
-                self.stylesheet = fp.read()
-                msg = "Using stylesheet file in .ui files: " + sfile
-                msg += "\n  unset %d to not use any stylesheet" % ENV_PYDM_DISPLAYS_PATH
-                logger.info(msg)
+        ``outFile`` is the name of the .ui file or a
+        text file object (such as ``io.StringIO``).
+        """
+        if self.stylesheet is None:
+            self.findStylesheet()
         
         # adl2ui opened outFile here AND started to write XML-like content
-        # that is not necessary now
-        if os.path.exists(outFile):
+        # the file is opened when the content is first written
+        if isinstance(outFile, str) and os.path.exists(outFile):
             msg = "output file already exists: " + outFile
             logger.info(msg)
         self.outFile = outFile
+        self._stream = None
+        self._open = []
         
         # Qt .ui files are XML, use XMl tools to create the content
         # create the XML file root element
         self.root = ElementTree.Element("ui", attrib=dict(version="4.0"))
-        # write the XML to the file in the close() method
         
         return self.root
 
+    def findStylesheet(self):
+        """read the stylesheet file, if found"""
+        if os.environ.get(ENV_PYDM_DISPLAYS_PATH) is None:
+            msg = "Environment variable %s is not defined." % "PYDM_DISPLAYS_PATH"
+            logger.info(msg)
+
+        sfile = self.resolver.findFile(QT_STYLESHEET_FILE)
+        if sfile is None:
+            msg = "file not found: " + QT_STYLESHEET_FILE
+            logger.info(msg)
+        else:
+            self.stylesheet = self.resolver.readFile(sfile)
+            msg = "Using stylesheet file in .ui files: " + sfile
+            msg += "\n  unset %s to not use any stylesheet" % ENV_PYDM_DISPLAYS_PATH
+            logger.info(msg)
+
+    def _layout(self):
+        """indentation and newline"""
+        if self.pretty:
+            return " "*2, "\n"
+        return "", ""
+
+    def _write(self, text):
+        if self._stream is None:
+            if isinstance(self.outFile, str):
+                self._stream = _AtomicFile(self.outFile)
+            else:
+                self._stream = self.outFile
+            self._stream.write('<?xml version="1.0" ?>' + self._layout()[1])
+        self._stream.write(text)
+
+    def discardFile(self):
+        """stop writing, leave any existing .ui file as it was"""
+        if isinstance(self._stream, _AtomicFile):
+            self._stream.discard()
+        self._stream = None
+        self._open = []
+
+    def _writeChildren(self, parent, indent, stop=None):
+        """write (and release) the children of an open element, up to ``stop``"""
+        addindent, newl = self._layout()
+        parts = []
+        n = 0
+        for child in parent:
+            if child is stop:
+                break
+            writeXmlElement(parts.append, child, indent + addindent, addindent, newl)
+            if child.tail:
+                parts.append(_xmlText(indent + addindent + child.tail + newl))
+            n += 1
+        del parent[:n]
+        self._write("".join(parts))
+
+    def _closeOpen(self, depth):
+        """write the rest of the open elements, deeper than ``depth``"""
+        newl = self._layout()[1]
+        while len(self._open) > depth:
+            element, indent = self._open.pop()
+            self._writeChildren(element, indent)
+            self._write(f"{indent}</{element.tag}>{newl}")
+            if len(self._open) > 0:
+                # earlier siblings were released when element was opened
+                parent = self._open[-1][0]
+                del parent[0]
+                if element.tail:
+                    self._write(_xmlText(indent + element.tail + newl))
+
+    def flush(self, element):
+        """
+        write the completed children of ``element``, then release them
+
+        ``element`` is the root or the last child (and so on) of the
+        root.  It stays open: children added later are written by
+        the next ``flush()`` or by ``closeFile()``.  Do not change
+        written elements, nor add children to their ancestors,
+        other than ``element`` and its ancestors.
+        """
+        if len(element) == 0:
+            return      # nothing to write yet
+        addindent, newl = self._layout()
+
+        path = [self.root]  # elements to open, from the root to element
+        while path[-1] is not element:
+            if len(path[-1]) == 0:
+                raise ValueError(f"<{element.tag}> is not open for writing")
+            path.append(path[-1][-1])
+
+        for depth, node in enumerate(path):
+            if depth < len(self._open):
+                if self._open[depth][0] is node:
+                    continue
+                # later siblings were added: these open elements are complete
+                self._closeOpen(depth)
+            indent = ""
+            if depth > 0:
+                # complete siblings before the new open element
+                parent, indent = self._open[-1]
+                self._writeChildren(parent, indent, stop=node)
+                indent += addindent
+            text = indent + _xmlStartTag(node) + ">" + newl
+            if node.text:
+                text += _xmlText(indent + addindent + node.text + newl)
+            self._write(text)
+            self._open.append((node, indent))
+
+        self._closeOpen(len(path))  # open children are complete
+        self._writeChildren(element, self._open[-1][1])
+
     def closeFile(self):
         """finally, write .ui file (XML content)"""
         
@@ -1168,12 +1537,16 @@ class PYDM_Writer(object):
             # TODO: what about "vis" field?
             z.text = str(widget.text)
 
-        # ElementTree needs help to pretty print
-        # (easier in lxml but that's an additional package to add)
-        text = ElementTree.tostring(self.root)
-        xmlstr = minidom.parseString(text).toprettyxml(indent=" "*2)
-        with open(self.outFile, "w") as f:
-            f.write(xmlstr)
+        addindent, newl = self._layout()
+        if len(self._open) == 0:
+            parts = []
+            writeXmlElement(parts.append, self.root, "", addindent, newl)
+            self._write("".join(parts))
+        self._closeOpen(0)
+
+        if isinstance(self.outFile, str):
+            self.unchanged = not self._stream.commit()
+        self._stream = None
 
     def writeProperty(self, parent, name, value, tag="string", **kwargs):
         prop = self.writeOpenTag(parent, "property", name=name)
@@ -1213,30 +1586,269 @@ class PYDM_Writer(object):
     # def writeMessage(self, mess): ...        # nothing to do
 
 
-def findFile(fname):
-    """look for file in PYDM_DISPLAYS_PATH"""
-    if fname is None or len(fname) == 0:
+class UiFileNames(object):
+    """
+    names of the .ui files written in one run (such as one command)
+
+    Screens with the same title (or .adl files of the same name, from
+    different directories) would write the same .ui file.  In a run,
+    the first .adl file gets the name, another .adl file gets a name
+    suffixed with a digest of its (real) path, the same name for the
+    same .adl file each time.  Files are compared by real path
+    (symbolic links resolved).
+
+    With ``record=True``, the .adl file that writes a .ui file is
+    also recorded in a hidden file beside it (``.name.ui.source``),
+    so later runs and other processes give it the same name.
+    """
+
+    def __init__(self, record=False):
+        self.record = record
+        self._claims = {}       # .ui file: .adl file written there
+        self._lock = threading.Lock()
+
+    def claim(self, adl_filename, ui_filename):
+        """Return the name of the .ui file to write for the .adl file."""
+        source = os.path.realpath(adl_filename or "")
+        target = os.path.realpath(ui_filename)
+        with self._lock:
+            owner = self._claims.get(target)
+            if owner is None:
+                owner = source
+                if self.record:
+                    owner = uiFileSource(ui_filename, claim=source)
+                self._claims[target] = owner
+        if owner == source:
+            return ui_filename
+
+        base, ext = os.path.splitext(ui_filename)
+        digest = hashlib.sha1(source.encode()).hexdigest()[:8]
+        unique = f"{base}-{digest}{ext}"
+        with self._lock:
+            self._claims.setdefault(os.path.realpath(unique), source)
+        logger.warning(
+            f"{adl_filename}: {ui_filename} is written from {owner},"
+            f" writing {unique} instead"
+        )
+        return unique
+
+
+def uiFileSource(ui_filename, claim=None):
+    """
+    Return the .adl file recorded for the .ui file (None if none).
+
+    See ``UiFileNames(record=True)``.
+
+    If none is recorded, ``claim`` (an .adl file) is recorded,
+    unless another process records its .adl file first.
+    The record is created atomically, as a whole.
+    """
+    directory, name = os.path.split(ui_filename)
+    record = os.path.join(directory, f".{name}{UI_SOURCE_SUFFIX}")
+    try:
+        with open(record, "r", encoding="utf-8") as fp:
+            return fp.read()
+    except FileNotFoundError:
+        if claim is None:
+            return None
+
+    fd, temp_filename = tempfile.mkstemp(
+        prefix=f".{name}.", suffix=".tmp", dir=directory or None)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            fp.write(claim)
+        try:
+            os.link(temp_filename, record)  # fails if recorded meanwhile
+        except FileExistsError:
+            raise
+        except OSError:
+            # no hard links on this file system
+            with open(record, "x", encoding="utf-8") as fp:
+                fp.write(claim)
+        return claim
+    except FileExistsError:
+        with open(record, "r", encoding="utf-8") as fp:
+            return fp.read()
+    finally:
+        os.remove(temp_filename)
+
+
+class _AtomicFile(object):
+    """
+    write a file by replacing it with a temporary file, when changed
+
+    The content is written (UTF-8) to a temporary file in the same
+    directory.  ``commit()`` compares its digest with the existing
+    file: if the same, the existing file is kept untouched (and so
+    its modification time), otherwise it is replaced (atomically).
+    """
+
+    _serial = itertools.count()
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = 0
+        self.digest = hashlib.sha256()
+        directory, name = os.path.split(filename)
+        while True:
+            self.temp_filename = os.path.join(
+                directory, f".{name}.{os.getpid()}-{next(self._serial)}.tmp")
+            try:
+                fd = os.open(self.temp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                break
+            except FileExistsError:
+                continue
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.size += len(data)
+        self.digest.update(data)
+        self._file.write(data)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.temp_filename):
+            os.remove(self.temp_filename)
+
+    def unchanged(self):
+        """Is the existing file the same as the one written?"""
+        try:
+            if os.path.getsize(self.filename) != self.size:
+                return False
+            digest = hashlib.sha256()
+            with open(self.filename, "rb") as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b""):
+                    digest.update(chunk)
+        except OSError:
+            return False
+        return digest.digest() == self.digest.digest()
+
+    def commit(self):
+        """Return True if the file was replaced (False: unchanged)."""
+        self._file.close()
+        if self.unchanged():
+            os.remove(self.temp_filename)
+            logger.info("unchanged screen file: " + self.filename)
+            return False
+        os.replace(self.temp_filename, self.filename)
+        return True
+
+
+class DisplayPathResolver(object):
+    """
+    find (and read) files in the PYDM_DISPLAYS_PATH directories
+
+    Each directory is listed once (``os.scandir``), not searched
+    with a ``stat`` for every file name.  The text of files read
+    is kept.  Listings and texts are cached until the modification
+    time of the directory (or file) changes, which is checked no
+    more often than every ``check_interval`` seconds.
+
+    One resolver is shared by the whole process,
+    see ``sharedDisplayPathResolver()``.
+    """
+
+    def __init__(self, check_interval=DISPLAY_PATH_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._listings = {}     # directory: [checked, mtime_ns, file names]
+        self._texts = {}        # file: [checked, mtime_ns, size, text]
+
+    def clear(self):
+        """forget all cached directories and files"""
+        self._listings.clear()
+        self._texts.clear()
+
+    def searchPath(self):
+        """directories of PYDM_DISPLAYS_PATH (default: current directory)"""
+        path = os.environ.get(ENV_PYDM_DISPLAYS_PATH)
+        if path is None:
+            return [os.getcwd()]      # safe choice that becomes redundant
+        return path.split(os.pathsep)
+
+    def fileNames(self, directory):
+        """names of the files in the directory (empty if not found)"""
+        key = os.path.abspath(directory)
+        now = time.monotonic()
+        entry = self._listings.get(key)
+        if entry is not None and now - entry[0] < self.check_interval:
+            return entry[2]
+
+        try:
+            mtime = os.stat(key).st_mtime_ns
+        except OSError:
+            mtime = None
+        if entry is not None and entry[1] == mtime:
+            entry[0] = now
+            return entry[2]
+
+        names = frozenset()
+        if mtime is not None:
+            try:
+                with os.scandir(key) as entries:
+                    names = frozenset(e.name for e in entries if e.is_file())
+            except OSError as exc:
+                logger.debug(f"cannot list directory {key}: {exc}")
+        self._listings[key] = [now, mtime, names]
+        return names
+
+    def findFile(self, fname):
+        """look for file in current directory, then in PYDM_DISPLAYS_PATH"""
+        if fname is None or len(fname) == 0:
+            return None
+
+        if os.path.dirname(fname) != "":
+            # not in a directory listing
+            if os.path.exists(fname):
+                return fname
+            for path in self.searchPath():
+                path_fname = os.path.join(path, fname)
+                if os.path.exists(path_fname):
+                    return path_fname
+            return None
+
+        if fname in self.fileNames(os.curdir):
+            # found it in current directory
+            return fname
+
+        for path in self.searchPath():
+            if fname in self.fileNames(path):
+                # found it in the DISPLAYS path
+                return os.path.join(path, fname)
+
         return None
-    
-    if os.name =="nt":
-        delimiter = ";"
-    else:
-        delimiter = ":"
 
-    path = os.environ.get(ENV_PYDM_DISPLAYS_PATH)
-    if path is None:
-        paths = [os.getcwd()]      # safe choice that becomes redundant
-    else:
-        paths = path.split(delimiter)
+    def readFile(self, filename):
+        """text of the file (as found by ``findFile()``), None if not readable"""
+        key = os.path.abspath(filename)
+        now = time.monotonic()
+        entry = self._texts.get(key)
+        if entry is not None and now - entry[0] < self.check_interval:
+            return entry[3]
+
+        try:
+            stat = os.stat(key)
+            if entry is not None and entry[1:3] == [stat.st_mtime_ns, stat.st_size]:
+                entry[0] = now
+                return entry[3]
+            with open(key, "r") as fp:
+                text = fp.read()
+        except OSError as exc:
+            logger.debug(f"cannot read file {key}: {exc}")
+            self._texts.pop(key, None)
+            return None
+        self._texts[key] = [now, stat.st_mtime_ns, stat.st_size, text]
+        return text
+
+
+_shared_display_path_resolver = DisplayPathResolver()
 
-    if os.path.exists(fname):
-        # found it in current directory
-        return fname
-    
-    for path in paths:
-        path_fname = os.path.join(path, fname)
-        if os.path.exists(path_fname):
-            # found it in the DISPLAYS path
-            return path_fname
 
-    return None
+def sharedDisplayPathResolver():
+    """the (process-wide) shared ``DisplayPathResolver``"""
+    return _shared_display_path_resolver
+
+
+def findFile(fname):
+    """look for file in PYDM_DISPLAYS_PATH"""
+    return sharedDisplayPathResolver().findFile(fname)
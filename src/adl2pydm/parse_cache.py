@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+on-disk cache of parsed MEDM screens
+
+Each parsed screen (``MedmMainWidget``) is pickled into the cache
+directory, in a file named for the hash of the .adl file content
+and the parser version.  An unchanged .adl file is loaded from the
+cache instead of being parsed again.
+
+The size of the cache is bounded.  The least recently used
+screens are removed first.
+
+Only use a cache directory that is not writable by others
+(the cached screens are unpickled when loaded).
+
+Only rely on packages in the standard Python distribution.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+
+from . import __version__
+from . import adl_parser
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = "ADL2PYDM_CACHE_DIR"
+CACHE_FILE_EXTENSION = ".pickle"
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024      # bytes
+
+
+def defaultCacheDir():
+    """
+    directory of the parse cache, unless given otherwise
+
+    ``$ADL2PYDM_CACHE_DIR`` or ``adl2pydm`` in the user's cache directory
+    """
+    path = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+        path = os.path.join(os.path.expanduser(base), "adl2pydm")
+    return path
+
+
+class ParseCache(object):
+    """
+    size-bounded (LRU) on-disk cache of parsed MEDM screens
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cached screens (created if needed),
+        default: ``defaultCacheDir()``
+    max_size : int
+        Remove the least recently used screens when
+        the cached screens use more bytes than this.
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir or defaultCacheDir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, data):
+        """cache key for the content (bytes) of a .adl file"""
+        version = f"{__version__} {adl_parser.PARSER_VERSION} {pickle.HIGHEST_PROTOCOL}\n"
+        digest = hashlib.sha256(version.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def path(self, key):
+        """name of the file with the cached screen"""
+        return os.path.join(self.cache_dir, key + CACHE_FILE_EXTENSION)
+
+    def load(self, key):
+        """return the cached screen (or None)"""
+        fname = self.path(key)
+        try:
+            with open(fname, "rb") as fp:
+                screen = pickle.load(fp)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"removing unreadable cache file {fname}: {exc}")
+            self.remove(key)
+            return None
+        try:
+            os.utime(fname)     # most recently used
+        except OSError:
+            pass
+        return screen
+
+    def store(self, key, screen):
+        """write the screen to the cache, then limit the size of the cache"""
+        fd, tmpname = tempfile.mkstemp(
+            suffix=".tmp", prefix=key[:16], dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(screen, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, self.path(key))
+        except Exception:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        self.evict()
+
+    def remove(self, key):
+        """remove the screen from the cache (if cached)"""
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """list of (mtime, size, path) of the cached screens, least recently used first"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_FILE_EXTENSION) and entry.is_file():
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        """remove least recently used screens until the cache fits in max_size"""
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            logger.debug(f"evicting {path} from the parse cache")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """remove all screens from the cache"""
+        for mtime, size, path in self.entries():
+            os.remove(path)
+
+    def parseAdlFile(self, fname, executor=None):
+        """
+        return the parsed screen of the .adl file, from the cache if possible
+
+        The screen is parsed (and cached) if not found in the cache,
+        with structured contents (no raw text), as the writer needs.
+        With an ``executor``, the widget blocks are parsed in parallel
+        (see ``MedmMainWidget.parseAdlBufferInParallel()``).
+        """
+        if not os.path.exists(fname):
+            msg = "Could not find file: " + fname
+            raise ValueError(msg)
+        with open(fname, "rb") as fp:
+            data = fp.read()
+        key = self.key(data)
+
+        screen = self.load(key)
+        if screen is not None:
+            self.hits += 1
+            screen.given_filename = fname
+            # share the color table with the other screens
+            screen.color_table = adl_parser.sharedColorTable(
+                ["%02x%02x%02x" % color for color in screen.color_table])
+            return screen
+
+        self.misses += 1
+        screen = adl_parser.MedmMainWidget(fname, structured=True)
+        if executor is not None:
+            # the lines as read by MedmMainWidget.getAdlLines()
+            text = data.decode(adl_parser.ADL_FILE_ENCODING)
+            lines = io.StringIO(text, newline=None).readlines()
+            screen.parseAdlBufferInParallel(lines, executor)
+        else:
+            screen.parseAdlBuffer(data)
+        try:
+            self.store(key, screen)
+        except Exception as exc:
+            logger.warning(f"could not cache {fname}: {exc}")
+        return screen
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+"""
+offline benchmark of the PyDM rules of converted screens
+
+The rules (written by ``Widget2Pydm.processDynamicAttributeAsRules``)
+are read from a converted ``.ui`` file or made from a parsed MEDM
+screen.  Each rule expression is compiled and evaluated as PyDM does,
+while a synthetic stream of channel updates is replayed through it.
+The report shows the evaluations per second and the most expensive
+widgets.
+
+No Qt, no PyDM, and no live IOC are needed.
+
+Only rely on packages in this project or from the standard Python distribution.
+"""
+
+import argparse
+from collections import namedtuple
+import logging
+import math
+import os
+import random
+import time
+from xml.etree import ElementTree
+
+from . import adl_parser
+from . import output_handler
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUMBER_OF_UPDATES = 10000   # channel updates per rule
+DEFAULT_TOP_WIDGETS = 10
+DEFAULT_VALUE_RANGE = (-10, 10)     # synthetic channel values
+
+
+WidgetRule = namedtuple("WidgetRule", "widget name expression channels")
+WidgetRule.__doc__ = """
+one PyDM rule of a widget
+
+``channels`` is the list of rule channels: ``dict(channel=pv, trigger=bool)``
+"""
+
+RuleStats = namedtuple(
+    "RuleStats", "widget name expression updates evaluations errors seconds")
+RuleStats.__doc__ = """
+result of replaying channel updates through one rule
+
+``seconds`` is the time spent evaluating the expression.
+"""
+
+
+def ruleEnvironment():
+    """
+    names available to a rule expression, as PyDM provides them
+
+    PyDM provides ``np`` (numpy) and the names of the math module.
+    ``np`` is only provided here when numpy is installed.
+    """
+    env = {k: v for k, v in math.__dict__.items() if not k.startswith("_")}
+    try:
+        import numpy
+        env["np"] = numpy
+    except ImportError:
+        pass
+    return env
+
+
+def readUiRules(ui_filename):
+    """Return the list of WidgetRule from a converted ``.ui`` file."""
+    root = ElementTree.parse(ui_filename).getroot()
+    rules = []
+    for widget in root.iter("widget"):
+        for prop in widget.findall("property"):
+            if prop.attrib.get("name") != "rules":
+                continue
+            text = prop.findtext("string")
+            for rule in output_handler.jsonDecode(text):
+                rules.append(
+                    WidgetRule(
+                        widget.attrib.get("name"),
+                        rule.get("name"),
+                        rule.get("expression"),
+                        rule.get("channels", []),
+                    )
+                )
+    return rules
+
+
+def screenRules(screen):
+    """
+    Return the list of WidgetRule of a parsed screen (``MedmMainWidget``).
+
+    Widgets are named by MEDM symbol and .adl line: ``rectangle (line 96)``
+    """
+    rules = []
+    for node in adl_parser.walkWidgets(screen.widgets):
+        widget = node.widget
+        attr = widget.contents.get("dynamic attribute", {})
+        if len(attr) == 0:
+            continue
+        name = f"{widget.symbol} (line {widget.line_offset})"
+        for rule in output_handler.convertDynamicAttribute_to_Rules(attr):
+            rules.append(
+                WidgetRule(
+                    name,
+                    rule.get("name"),
+                    rule.get("expression"),
+                    rule.get("channels", []),
+                )
+            )
+    return rules
+
+
+def simulateRule(rule, updates=DEFAULT_NUMBER_OF_UPDATES, rng=None, env=None,
+                 value_range=DEFAULT_VALUE_RANGE):
+    """
+    Replay ``updates`` synthetic PV updates through the ``rule``.
+
+    As PyDM does, each rule channel gets the new value of its PV
+    and each triggering channel evaluates the expression, once
+    every channel has a value.  Channels without a PV never
+    connect, so such a rule is never evaluated.
+
+    A rule that does not compile is never evaluated (PyDM logs
+    and skips it), it counts as one error.
+
+    Returns
+    -------
+    RuleStats
+    """
+    rng = rng or random.Random()
+    env = dict(env or ruleEnvironment())
+    try:
+        code = compile(rule.expression or "", "<string>", "eval")
+    except (SyntaxError, ValueError) as exc:
+        logger.warning(f"{rule.widget}: rule '{rule.expression}' not compiled: {exc}")
+        return RuleStats(rule.widget, rule.name, rule.expression, updates, 0, 1, 0)
+
+    pvs = {}    # PV : indices of the rule channels
+    for idx, channel in enumerate(rule.channels):
+        pvs.setdefault(channel.get("channel", ""), []).append(idx)
+    connected = [pv for pv in pvs if len(pv) > 0]
+    active = len(connected) > 0 and len(connected) == len(pvs)
+
+    values = [None] * len(rule.channels)
+    env["ch"] = values
+    unset = len(values)     # channels without a value yet
+    evaluations = 0
+    errors = 0
+    seconds = 0
+    for _i in range(updates if active else 0):
+        pv = rng.choice(connected)
+        value = rng.randint(*value_range)
+        for idx in pvs[pv]:
+            if values[idx] is None:
+                unset -= 1
+            values[idx] = value
+            if unset > 0 or not rule.channels[idx].get("trigger"):
+                continue
+            t0 = time.perf_counter()
+            try:
+                eval(code, env)
+            except Exception:
+                errors += 1     # PyDM logs these
+            seconds += time.perf_counter() - t0
+            evaluations += 1
+
+    return RuleStats(
+        rule.widget, rule.name, rule.expression,
+        updates, evaluations, errors, seconds)
+
+
+def benchmarkRules(rules, updates=DEFAULT_NUMBER_OF_UPDATES, seed=None):
+    """Return list of RuleStats, one for each of the ``rules``."""
+    rng = random.Random(seed)
+    env = ruleEnvironment()
+    return [simulateRule(rule, updates, rng=rng, env=env) for rule in rules]
+
+
+def report(stats, top=DEFAULT_TOP_WIDGETS):
+    """Return text report of the benchmark results (list of RuleStats)."""
+    evaluations = sum(s.evaluations for s in stats)
+    seconds = sum(s.seconds for s in stats)
+    rate = evaluations / seconds if seconds > 0 else 0
+    lines = [
+        f"rules: {len(stats)}",
+        f"channel updates: {sum(s.updates for s in stats)}",
+        f"evaluations: {evaluations}",
+        f"errors: {sum(s.errors for s in stats)}",
+        f"evaluation time: {seconds:.6f} s",
+        f"evaluations per second: {rate:.0f}",
+    ]
+    ranked = sorted(stats, key=lambda s: s.seconds, reverse=True)[:top]
+    if len(ranked) > 0:
+        lines.append("")
+        lines.append(f"most expensive widgets (top {len(ranked)}):")
+        lines.append(f"{'seconds':>10}  {'evals':>7}  {'us/eval':>8}  widget: expression")
+        for s in ranked:
+            cost = 1e6 * s.seconds / s.evaluations if s.evaluations else 0
+            lines.append(
+                f"{s.seconds:10.6f}  {s.evaluations:7d}  {cost:8.3f}"
+                f"  {s.widget}: {s.expression}"
+            )
+    return "\n".join(lines)
+
+
+def fileRules(filename):
+    """Return the list of WidgetRule from a ``.ui`` or ``.adl`` file."""
+    if os.path.splitext(filename)[-1] == ".adl":
+        screen = adl_parser.MedmMainWidget(filename, structured=True)
+        screen.parseAdlFile(filename)
+        return screenRules(screen)
+    return readUiRules(filename)
+
+
+def get_user_parameters():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(prog="adl2pydm-rules", description=doc)
+
+    parser.add_argument(
+        'files',
+        action='store',
+        nargs=argparse.ONE_OR_MORE,
+        help="converted PyDM '.ui' (or MEDM '.adl') file(s)",
+        )
+
+    parser.add_argument(
+        "--updates",
+        action="store",
+        type=int,
+        default=DEFAULT_NUMBER_OF_UPDATES,
+        help=f"channel updates per rule, default: {DEFAULT_NUMBER_OF_UPDATES}",
+        )
+
+    parser.add_argument(
+        "--top",
+        action="store",
+        type=int,
+        default=DEFAULT_TOP_WIDGETS,
+        help=f"number of widgets to report, default: {DEFAULT_TOP_WIDGETS}",
+        )
+
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        default=None,
+        help="seed of the synthetic channel updates, default: random",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    options = get_user_parameters()
+    logging.basicConfig(level=logging.WARNING)
+
+    rules = []
+    for filename in options.files:
+        rules += fileRules(filename)
+    stats = benchmarkRules(rules, options.updates, seed=options.seed)
+    print(report(stats, top=options.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -84,6 +84,52 @@ adl_widgets = {
     }
 
 
+"""
+typed MEDM attributes, decoded once by the parser
+
+example:
+
+    "block symbol" : dict(key=type)
+
+The block symbol is a widget (for its own assignments) or the
+symbol of a block within the widget.  The type is ``int``,
+``float``, or a tuple of the allowed (enumerated) values.
+The parser reports (and drops) values that do not decode.
+
+The colors (``clr``, ``bclr``) are decoded by the parser into
+``Color`` from the color table.  The number of points (``count``)
+of a cartesian plot may be a PV name in MEDM, PyDM needs a number
+(the writer uses its default).
+"""
+
+_adl_direction = ("up", "down", "left", "right")
+_adl_text_align = ("horiz. left", "horiz. centered", "horiz. right", "justify")
+
+adl_attribute_types = {
+    "arc" : dict(begin=int, path=int),
+    "bar" : dict(direction=_adl_direction),
+    "basic attribute" : dict(
+        fill=("solid", "outline"),
+        style=("solid", "dash"),
+        width=int,
+        ),
+    "byte" : dict(direction=_adl_direction, ebit=int, sbit=int),
+    "cartesian plot" : dict(count=int),
+    "choice button" : dict(stacking=("row", "column", "row column")),
+    "dynamic attribute" : dict(vis=("static", "if not zero", "if zero", "calc")),
+    "indicator" : dict(direction=_adl_direction),
+    "limits" : dict(hoprDefault=float, loprDefault=float, precDefault=int),
+    "strip chart" : dict(period=float),
+    "text" : dict(align=_adl_text_align),
+    "text entry" : dict(align=_adl_text_align),
+    "text update" : dict(align=_adl_text_align),
+    "valuator" : dict(direction=_adl_direction, dPrecision=float),
+    "x_axis" : dict(maxRange=float, minRange=float),
+    "y1_axis" : dict(maxRange=float, minRange=float),
+    "y2_axis" : dict(maxRange=float, minRange=float),
+    }
+
+
 """
 describes the PyDM connection to Qt
 
@@ -130,3 +176,56 @@ pydm_widgets = dict(
     PyDMSymbol = PyDM_CustomWidget("PyDMSymbol", "QWidget", "pydm.widgets.symbol"),
     PyDMWaveformTable = PyDM_CustomWidget("PyDMWaveformTable", "QTableWidget", "pydm.widgets.waveformtable"),
 )
+
+
+"""
+ancestor PyDM classes of each PyDM class (inheritance closure)
+
+example:
+
+    "PyDMDrawingPie" : ("PyDMDrawingArc",)
+
+Nearest ancestor first.  Only PyDM classes are listed, Qt classes
+need no custom widget.  Computed once (at import) for the classes
+in ``pydm_widgets``, a class added later is computed when first needed.
+"""
+
+pydm_widget_ancestors = {}
+
+
+def pydmWidgetAncestors(cls):
+    """ancestor PyDM classes of ``cls``, nearest first"""
+    ancestors = pydm_widget_ancestors.get(cls)
+    if ancestors is None:
+        ancestors = []
+        item = pydm_widgets.get(cls)
+        while item is not None:
+            klass = item.extends
+            if not klass.startswith("PyDM") or klass in ancestors or klass == cls:
+                break
+            ancestors.append(klass)
+            item = pydm_widgets.get(klass)
+        ancestors = pydm_widget_ancestors[cls] = tuple(ancestors)
+    return ancestors
+
+
+def pydmCustomWidgetClasses(classes):
+    """
+    the PyDM classes and all their ancestor PyDM classes
+
+    In order: the classes, then their parent classes,
+    then the grandparents, ... each class once.
+    """
+    classes = list(dict.fromkeys(classes))
+    closure = dict.fromkeys(classes)
+    ancestors = [pydmWidgetAncestors(cls) for cls in classes]
+    for depth in range(max(map(len, ancestors), default=0)):
+        for chain in ancestors:
+            if len(chain) > depth:
+                closure.setdefault(chain[depth])
+    return list(closure)
+
+
+for _cls in pydm_widgets:
+    pydmWidgetAncestors(_cls)
+del _cls
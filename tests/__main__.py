@@ -17,6 +17,8 @@ def suite(*args, **kw):
     from tests import test_calc2rules
     from tests import test_cli
     from tests import test_output_handler
+    from tests import test_parse_cache
+    from tests import test_rule_benchmark
     from tests import test_simple
     from tests import test_symbols
     from tests import test_testDisplay
@@ -28,6 +30,8 @@ def suite(*args, **kw):
         test_cli,
         test_calc2rules,
         test_output_handler,
+        test_parse_cache,
+        test_rule_benchmark,
         test_testDisplay,
         ]
 
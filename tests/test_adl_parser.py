@@ -3,8 +3,10 @@
 simple unit tests for this package
 """
 
+import concurrent.futures
 import logging
 import os
+import pickle
 import sys
 import unittest
 
@@ -112,6 +114,477 @@ class Test_Files(unittest.TestCase):
         self.assertTrue(os.path.exists(self.path))
         self.assertTrue(os.path.exists(self.medm_path))
 
+    def test_block_tree(self):
+        buf = """
+        file {
+            name="example.adl"
+        }
+        composite {
+            object {
+                x=1
+                y=2
+            }
+            children {
+                polyline {
+                    points {
+                        (1,2)
+                        (3,4)
+                    }
+                }
+                polyline {
+                }
+            }
+        }
+        """.strip().splitlines(keepends=True)
+        root = adl_parser.parseBlockTree(buf)
+        self.assertEqual(len(root.blocks), 2)
+        self.assertEqual(root.getNamedBlock("file").assignments["name"], "example.adl")
+        self.assertIsNone(root.getNamedBlock("display"))
+
+        composite = root.getNamedBlock("composite")
+        self.assertEqual((composite.start, composite.end, composite.level), (3, 18, 0))
+        self.assertEqual(composite.getNamedBlock("object").assignments, dict(x="1", y="2"))
+
+        children = composite.getNamedBlock("children")
+        self.assertEqual(len(children.blocks), 2)
+        self.assertEqual(len(children.getNamedBlocks("polyline")), 2)
+        polyline = children.blocks[0]
+        self.assertEqual(polyline.level, 2)
+        points = polyline.getNamedBlock("points")
+        self.assertEqual(points.values, ["(1,2)", "(3,4)"])
+        self.assertEqual(points.getText().split(), ["(1,2)", "(3,4)"])
+
+    def test_block_tree_bytes(self):
+        for fname in ("ADBase-R3-3-1.adl", "sampleWheel.adl"):
+            full_name = os.path.join(self.medm_path, fname)
+            with open(full_name, "r") as fp:
+                buf = fp.readlines()
+            with open(full_name, "rb") as fp:
+                data = fp.read()
+
+            def walk(a, b):
+                self.assertEqual(a.symbol, b.symbol)
+                self.assertEqual((a.start, a.end, a.level), (b.start, b.end, b.level))
+                self.assertEqual(a.assignments, b.assignments)
+                self.assertEqual(a.values, b.values)
+                self.assertEqual(a.getText(), b.getText())
+                self.assertEqual(len(a.blocks), len(b.blocks))
+                for aa, bb in zip(a.blocks, b.blocks):
+                    walk(aa, bb)
+
+            root = adl_parser.parseBlockTree(buf)
+            for block in adl_parser.parseBlockTreeBytes(data).blocks:
+                walk(root.blocks.pop(0), block)
+            self.assertEqual(len(root.blocks), 0)
+
+    def test_mmap_input(self):
+        for fname in self.test_files:
+            full_name = os.path.join(self.medm_path, fname)
+            expected = self.parseFile(fname)
+            screen = adl_parser.MedmMainWidget(full_name)
+            screen.parseAdlFile(use_mmap=True)
+            self.assertEqual(screen.color_table, expected.color_table)
+            self.assertEqual(screen.geometry, expected.geometry)
+            self.assertEqual(len(screen.widgets), len(expected.widgets))
+            for w, e in zip(screen.widgets, expected.widgets):
+                self.assertEqual(w.symbol, e.symbol)
+                self.assertEqual(w.line_offset, e.line_offset)
+                self.assertEqual(w.geometry, e.geometry)
+                self.assertEqual(w.contents, e.contents)
+
+    def test_iter_block_tree(self):
+        full_name = os.path.join(self.medm_path, "ADBase-R3-3-1.adl")
+        with open(full_name, "r") as fp:
+            root = adl_parser.parseBlockTree(fp.readlines())
+        with open(full_name, "r") as fp:
+            blocks = list(adl_parser.iterBlockTree(fp))
+        self.assertEqual(len(blocks), len(root.blocks))
+        for a, b in zip(blocks, root.blocks):
+            self.assertEqual(a.symbol, b.symbol)
+            self.assertEqual((a.start, a.end), (b.start, b.end))
+            self.assertEqual(a.getText(), b.getText())
+            # each top-level block keeps only its own lines
+            self.assertEqual(len(a.buf), a.end - a.start + 1)
+
+    def test_iter_adl_widgets(self):
+        for fname in self.test_files:
+            expected = self.parseFile(fname)
+            screen = adl_parser.MedmMainWidget(os.path.join(self.medm_path, fname))
+            widgets = list(screen.iterAdlWidgets())
+            self.assertEqual(len(screen.widgets), 0)
+            self.assertEqual(screen.geometry, expected.geometry)
+            self.assertEqual(screen.color, expected.color)
+            self.assertEqual(screen.background_color, expected.background_color)
+            self.assertEqual(len(widgets), len(expected.widgets))
+            for w, e in zip(widgets, expected.widgets):
+                self.assertEqual(w.symbol, e.symbol)
+                self.assertEqual(w.line_offset, e.line_offset)
+                self.assertEqual(w.contents, e.contents)
+
+    def test_iter_adl_widgets_late_header(self):
+        screen = adl_parser.MedmMainWidget(os.path.join(self.medm_path, "xxx-R5-8-4.adl"))
+        buf = screen.getAdlLines()
+        ranges = adl_parser.locateTopLevelBlocks(buf)
+        blocks = {symbol: buf[start:end+1] for symbol, start, end in ranges}
+        widgets = [
+            buf[start:end+1]
+            for symbol, start, end in ranges
+            if symbol not in ("display", "color map")
+        ]
+        # display and color map blocks after the first widget
+        lines = sum(widgets[:2] + [blocks["display"], blocks["color map"]] + widgets[2:], [])
+
+        expected = adl_parser.MedmMainWidget(screen.given_filename)
+        expected.parseAdlBuffer(lines)
+        self.assertEqual(expected.title, screen.title)
+        streamed = adl_parser.MedmMainWidget(screen.given_filename)
+        found = []
+        for widget in streamed.iterAdlWidgets(lines):
+            # the screen is complete when the first widget is yielded
+            self.assertEqual(streamed.geometry, expected.geometry)
+            self.assertEqual(streamed.title, expected.title)
+            self.assertEqual(streamed.color_table, expected.color_table)
+            found.append(widget)
+        self.assertEqual(streamed.color, expected.color)
+        self.assertEqual(streamed.background_color, expected.background_color)
+        self.assertEqual(len(found), len(expected.widgets))
+        for w, e in zip(found, expected.widgets):
+            self.assertEqual(w.symbol, e.symbol)
+            self.assertEqual(w.line_offset, e.line_offset)
+            self.assertEqual(w.color, e.color)
+            self.assertEqual(w.contents, e.contents)
+
+    def test_compact_widgets(self):
+        screen = self.parseFile("ADBase-R3-3-1.adl")
+
+        def walk(widgets):
+            for w in widgets:
+                yield w
+                yield from walk(getattr(w, "widgets", []))
+
+        widgets = list(walk(screen.widgets))
+        self.assertGreater(len(widgets), 0)
+        keys = {}
+        for w in widgets:
+            self.assertFalse(hasattr(w, "__dict__"), w.__class__.__name__)
+            for k in w.contents.keys():
+                # same key in every widget is the same (interned) object
+                self.assertIs(keys.setdefault(k, k), k)
+
+        # the screen keeps a __dict__ for the display assignments
+        self.assertEqual(screen.cmap, "")
+
+    def test_lazy_parsing(self):
+        def walk(widgets):
+            for w in widgets:
+                yield w
+                yield from walk(getattr(w, "widgets", []))
+
+        for fname in self.test_files:
+            full_name = os.path.join(self.medm_path, fname)
+            expected = list(walk(self.parseFile(fname).widgets))
+            for use_mmap in (False, True):
+                screen = adl_parser.MedmMainWidget(full_name, lazy=True)
+                screen.parseAdlFile(use_mmap=use_mmap)
+                widgets = list(walk(screen.widgets))
+                self.assertEqual(len(widgets), len(expected))
+                for w, e in zip(widgets, expected):
+                    self.assertIsNotNone(w._pending)
+                    self.assertEqual(w.geometry, e.geometry)
+                    self.assertEqual(w.line_offset, e.line_offset)
+                    self.assertIsNotNone(w._pending)
+                    self.assertEqual(w.contents, e.contents)
+                    self.assertIsNone(w._pending)
+                    self.assertEqual(w.title, e.title)
+                    self.assertEqual(w.color, e.color)
+                    self.assertEqual(hasattr(w, "points"), hasattr(e, "points"))
+                    if hasattr(e, "points"):
+                        self.assertEqual(w.points, e.points)
+
+        expected = self.parseFile("xxx-R5-8-4.adl").widgets
+        screen = adl_parser.MedmMainWidget(
+            os.path.join(self.medm_path, "xxx-R5-8-4.adl"), lazy=True)
+        widgets = list(screen.iterAdlWidgets())
+        self.assertEqual(len(widgets), len(expected))
+        for w, e in zip(widgets, expected):
+            if e.symbol == "related display":
+                self.assertEqual(w.displays, e.displays)
+
+    def test_shared_colors(self):
+        screens = [self.parseFile(fname) for fname in self.test_files]
+        clut = screens[0].color_table
+        self.assertIsInstance(clut, tuple)
+        for screen in screens[1:]:
+            if screen.color_table == clut:
+                self.assertIs(screen.color_table, clut)
+        for color in clut:
+            self.assertIs(color, adl_parser.sharedColor(*color))
+
+        self.assertIs(
+            pickle.loads(pickle.dumps(clut[3])),
+            adl_parser.sharedColor(*clut[3]))
+        self.assertIs(
+            adl_parser.sharedColorTable(["FFFFFF", "000000"]),
+            adl_parser.sharedColorTable(["ffffff", "000000"]))
+
+        # short values are interned
+        widgets = [w for s in screens for w in s.widgets if "format" in w.contents]
+        self.assertGreater(len(widgets), 1)
+        for w in widgets[1:]:
+            if w.contents["format"] == widgets[0].contents["format"]:
+                self.assertIs(w.contents["format"], widgets[0].contents["format"])
+
+    def test_parallel_parsing(self):
+        def walk(widgets):
+            for w in widgets:
+                yield w
+                yield from walk(getattr(w, "widgets", []))
+
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            for fname in ("xxx-R5-8-4.adl", "ADBase-R3-3-1.adl", "sampleWheel.adl"):
+                expected = self.parseFile(fname)
+                screen = adl_parser.MedmMainWidget(os.path.join(self.medm_path, fname))
+                screen.parseAdlBufferInParallel(
+                    screen.getAdlLines(), executor, chunk_lines=50)
+                self.assertEqual(screen.geometry, expected.geometry)
+                self.assertEqual(screen.color_table, expected.color_table)
+                widgets = list(walk(screen.widgets))
+                self.assertEqual(len(widgets), len(list(walk(expected.widgets))))
+                for w, e in zip(widgets, walk(expected.widgets)):
+                    self.assertEqual(w.symbol, e.symbol)
+                    self.assertEqual(w.line_offset, e.line_offset)
+                    self.assertEqual(w.geometry, e.geometry)
+                    self.assertEqual(w.color, e.color)
+                    self.assertEqual(w.contents, e.contents)
+                    self.assertIs(w.main, screen)
+
+    def test_walk_widgets(self):
+        screen = self.parseFile("ADBase-R3-3-1.adl")
+        nodes = list(screen.iterWidgets())
+        self.assertEqual(nodes[0].depth, 0)
+        self.assertIs(nodes[0].parent, screen)
+        self.assertEqual(nodes[0].relativeGeometry(), nodes[0].geometry)
+        composites = [n for n in nodes if n.widget.symbol == "composite"]
+        self.assertGreater(len(composites), 0)
+        composite = composites[0].widget
+        children = [n for n in nodes if n.parent is composite]
+        self.assertEqual([n.widget for n in children], composite.widgets)
+        for n in children:
+            self.assertEqual(n.depth, composites[0].depth + 1)
+            self.assertEqual(n.geometry, n.widget.geometry)
+            rel = n.relativeGeometry()
+            self.assertEqual(rel.x, n.geometry.x - composite.geometry.x)
+            self.assertEqual(rel.width, n.geometry.width)
+
+        # select and prune
+        texts = list(screen.iterWidgets(select=["text", adl_parser.MedmTextUpdateWidget]))
+        self.assertEqual(
+            len(texts), 
+            len([n for n in nodes if n.widget.symbol in ("text", "text update")]))
+        top = list(screen.iterWidgets(prune=lambda node: True))
+        self.assertEqual([n.widget for n in top], screen.widgets)
+
+        # constant stack: deeper than the recursion limit
+        depth = sys.getrecursionlimit() * 2
+        root = adl_parser.MedmMainWidget()
+        parent = root
+        for i in range(depth):
+            composite = adl_parser.MedmCompositeWidget(i, root, "composite")
+            composite.geometry = adl_parser.Geometry(i, i, 10, 10)
+            parent.widgets.append(composite)
+            parent = composite
+        nodes = list(root.iterWidgets())
+        self.assertEqual(len(nodes), depth)
+        self.assertEqual(nodes[-1].depth, depth - 1)
+        self.assertEqual(nodes[-1].relativeGeometry(), (1, 1, 10, 10))
+
+    def test_point_list(self):
+        points = adl_parser.PointList.fromText("(1,2)\n(3,-4)\n(5,6)")
+        self.assertEqual(len(points), 3)
+        self.assertEqualPoint(points[1], 3, -4)
+        self.assertEqualPoint(points[-1], 5, 6)
+        self.assertEqual(list(points.xs), [1, 3, 5])
+        self.assertEqual(points[1:], [(3, -4), (5, 6)])
+        self.assertEqual(points[::2], adl_parser.PointList([1, 2, 5, 6]))
+        with self.assertRaises(IndexError):
+            points[3]
+
+        moved = points.translated(-1, 10)
+        self.assertEqual(moved, [(0, 12), (2, 6), (4, 16)])
+        self.assertEqual(points[0], (1, 2))     # unchanged
+        self.assertEqual(moved.strings(), ["0, 12", "2, 6", "4, 16"])
+        self.assertEqual(adl_parser.PointList().strings(), [])
+
+        with self.assertRaises(ValueError):
+            adl_parser.PointList([1, 2, 3])
+
+    def test_structured_contents(self):
+        raw_text = ("children", "limits")
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            for fname in ("userArrayCalc.adl", "wheel_switch.adl", "scanDetPlot-R2-11-1.adl"):
+                full_name = os.path.join(self.medm_path, fname)
+                expected = self.parseFile(fname)
+                screens = []
+                for kw in (dict(), dict(lazy=True), dict(executor=executor)):
+                    lazy = kw.pop("lazy", False)
+                    screen = adl_parser.MedmMainWidget(full_name, lazy=lazy, structured=True)
+                    screen.parseAdlFile(**kw)
+                    screens.append(screen)
+                if fname == "userArrayCalc.adl":
+                    self.assertTrue(any(
+                        "children" in node.widget.contents
+                        for node in expected.iterWidgets()))
+                for screen in screens:
+                    nodes = list(screen.iterWidgets())
+                    self.assertEqual(len(nodes), len(list(expected.iterWidgets())))
+                    for node, e in zip(nodes, expected.iterWidgets()):
+                        contents = {
+                            k: v
+                            for k, v in e.widget.contents.items()
+                            if not (k in raw_text and isinstance(v, str))
+                        }
+                        self.assertEqual(node.widget.contents, contents)
+
+        root = adl_parser.parseBlockTree("""
+        a {
+            x=1
+            b {
+                (1,2)
+                (3,4)
+            }
+        }
+        """.strip().splitlines(keepends=True))
+        self.assertEqual(
+            adl_parser.blockData(root.blocks[0]),
+            dict(x="1", b=["(1,2)", "(3,4)"]))
+
+    def test_select_blocks(self):
+        full_name = os.path.join(self.medm_path, "xxx-R5-8-4.adl")
+        screen = self.parseFile("xxx-R5-8-4.adl")
+        expected = [
+            node.widget
+            for node in screen.iterWidgets()
+            if node.widget.symbol == "related display"
+        ]
+        with open(full_name, "rb") as fp:
+            data = fp.read()
+        for buf in (screen.getAdlLines(full_name), data):
+            found = adl_parser.selectAdlBlocks(
+                buf, widgets=["related display"], blocks=["display["], headers=[])
+            self.assertEqual(found.headers, {})
+            self.assertEqual(len(found.widgets), len(expected))
+            for (line, block), w in zip(found.widgets, expected):
+                self.assertEqual(line, w.line_offset)
+                self.assertIsNone(block.getNamedBlock("object"))
+                displays = [
+                    dict(b.assignments)
+                    for b in block.blocks
+                    if b.symbol.startswith("display[")
+                ]
+                self.assertEqual(displays, w.displays)
+
+        # widgets within composites
+        screen = self.parseFile("userArrayCalc.adl")
+        expected = [
+            node.widget.symbol
+            for node in screen.iterWidgets()
+            if node.widget.symbol in ("text", "polyline")
+        ]
+        buf = screen.getAdlLines()
+        found = adl_parser.selectAdlBlocks(buf, widgets=("text", "polyline"), blocks=())
+        self.assertEqual([block.symbol for line, block in found.widgets], expected)
+        self.assertEqual(sorted(found.headers), ["color map", "display", "file"])
+        for line, block in found.widgets:
+            self.assertEqual(buf[line-1].strip(), block.symbol + " {")
+            self.assertEqual(block.blocks, [])
+
+        # only the screen blocks, from an open file
+        with open(full_name, "r") as fp:
+            found = adl_parser.selectAdlBlocks(fp, widgets=())
+        self.assertEqual(found.widgets, [])
+        display = found.headers["display"].getNamedBlock("object")
+        self.assertEqual(display.assignments["width"], "440")
+
+    def test_incremental_parsing(self):
+        full_name = os.path.join(self.medm_path, "motorx_all-R6-10-1.adl")
+        with open(full_name, "rb") as fp:
+            data = fp.read()
+
+        def assertSameWidgets(screen, expected):
+            nodes = list(screen.iterWidgets())
+            self.assertEqual(len(nodes), len(list(expected.iterWidgets())))
+            for node, e in zip(nodes, expected.iterWidgets()):
+                self.assertEqual(node.widget.symbol, e.widget.symbol)
+                self.assertEqual(node.widget.line_offset, e.widget.line_offset)
+                self.assertEqual(node.widget.geometry, e.widget.geometry)
+                self.assertEqual(node.widget.contents, e.widget.contents)
+                self.assertIs(node.widget.main, screen)
+
+        screen = adl_parser.MedmMainWidget(full_name)
+        self.assertEqual(screen.parseAdlBufferIncrementally(data), 175)
+        fingerprints = screen.block_fingerprints
+        self.assertEqual(len(fingerprints), 3 + 175)
+        self.assertEqual(fingerprints[3].symbol, "rectangle")
+        self.assertEqual(data[fingerprints[3].start:].split(b"\n")[0], b"rectangle {")
+        assertSameWidgets(screen, self.parseFile("motorx_all-R6-10-1.adl"))
+
+        # edit one widget, move the ones after it
+        widgets = list(screen.widgets)
+        edited = fingerprints[10]
+        block = data[edited.start:edited.end].replace(b"x=", b"x=1", 1)
+        data = data[:edited.start] + b"\n" + block + data[edited.end:]
+        self.assertEqual(screen.parseAdlBufferIncrementally(data), 1)
+        expected = adl_parser.MedmMainWidget(full_name)
+        expected.parseAdlBuffer(data)
+        assertSameWidgets(screen, expected)
+        for i, widget in enumerate(screen.widgets):
+            if i == 10 - 3:
+                self.assertIsNot(widget, widgets[i])
+            else:
+                self.assertIs(widget, widgets[i])
+
+        # a changed color map changes all widgets
+        data = data.replace(b"ncolors=65", b"ncolors=65 ", 1)
+        self.assertEqual(screen.parseAdlBufferIncrementally(data), 175)
+
+    def test_typed_attributes(self):
+        fname = os.path.join(self.medm_path, "byte-monitor.adl")
+        screen = adl_parser.MedmMainWidget(fname)
+        buf = screen.getAdlLines()
+        self.assertEqual(buf[101].strip(), "sbit=3")
+        buf[101] = "\tsbit=three\n\tdirection=\"sideways\"\n\tebit=7\n"
+        with self.assertLogs(adl_parser.logger, level="WARNING") as log:
+            screen.parseAdlBuffer("".join(buf).splitlines(keepends=True))
+        self.assertEqual(len(log.output), 2)
+        output = "\n".join(log.output)
+        self.assertIn(f"{fname}:90: byte widget: ignoring byte sbit=\"three\"", output)
+        self.assertIn("direction=\"sideways\"", output)
+
+        w = screen.widgets[0]
+        self.assertNotIn("sbit", w.contents)
+        self.assertNotIn("direction", w.contents)
+        self.assertEqual(w.contents["ebit"], 7)
+
+    def test_register_widget_handler(self):
+        self.assertEqual(len(adl_parser.medm_widget_handlers), 24)
+        with self.assertRaises(TypeError):
+            adl_parser.medm_widget_handlers["text"] = None
+
+        class SiteTextWidget(adl_parser.MedmTextWidget): pass
+
+        original = adl_parser.getMedmWidgetHandler("text")
+        self.assertEqual(original, adl_parser.MedmTextWidget)
+        adl_parser.registerMedmWidgetHandler("text", SiteTextWidget)
+        try:
+            screen = self.parseFile("ADBase-R3-3-1.adl")
+        finally:
+            adl_parser.registerMedmWidgetHandler("text", original)
+        self.assertEqual(adl_parser.getMedmWidgetHandler("text"), original)
+
+        w = self.pickWidget(screen, 10, 9, "text", 181)
+        self.assertIsInstance(w, SiteTextWidget)
+        self.assertEqualTitle(w, "Area Detector Control - $(P)$(R)")
+
     def test_adl_parser(self):
         for fname in self.test_files:
             screen = adl_parser.MedmMainWidget()
@@ -186,7 +659,7 @@ class Test_Files(unittest.TestCase):
         self.assertIsInstance(attr, dict)
         self.assertEqual(len(attr), 2)
         self.assertEqualDictKeyValue(attr, "fill", "outline")
-        self.assertEqualDictKeyValue(attr, "width", "5")
+        self.assertEqualDictKeyValue(attr, "width", 5)
 
         self.assertIn("dynamic attribute", w.contents)
         attr = w.contents["dynamic attribute"]
@@ -226,8 +699,8 @@ class Test_Files(unittest.TestCase):
         self.assertIsInstance(w.contents, dict)
         self.assertEqual(len(w.contents), 4)
         self.assertEqualDictKeyValue(w.contents, "direction", "down")
-        self.assertEqualDictKeyValue(w.contents, "ebit", "15")
-        self.assertEqualDictKeyValue(w.contents, "sbit", "0")
+        self.assertEqualDictKeyValue(w.contents, "ebit", 15)
+        self.assertEqualDictKeyValue(w.contents, "sbit", 0)
         self.assertIn("monitor", w.contents)
         monitor = w.contents["monitor"]
         self.assertEqual(len(monitor), 1)
@@ -241,21 +714,21 @@ class Test_Files(unittest.TestCase):
         self.assertEqual(len(w.contents), 2)
         self.assertNotIn("direction", w.contents)
         self.assertNotIn("ebit", w.contents)
-        self.assertEqualDictKeyValue(w.contents, "sbit", "3")
+        self.assertEqualDictKeyValue(w.contents, "sbit", 3)
 
         w = self.pickWidget(screen, 4, 1, "byte", 104)
-        self.assertEqualDictKeyValue(w.contents, "ebit", "3")
-        self.assertEqualDictKeyValue(w.contents, "sbit", "0")
+        self.assertEqualDictKeyValue(w.contents, "ebit", 3)
+        self.assertEqualDictKeyValue(w.contents, "sbit", 0)
 
         w = self.pickWidget(screen, 4, 2, "byte", 119)
         self.assertEqualDictKeyValue(w.contents, "direction", "down")
         self.assertNotIn("ebit", w.contents)
-        self.assertEqualDictKeyValue(w.contents, "sbit", "3")
+        self.assertEqualDictKeyValue(w.contents, "sbit", 3)
 
         w = self.pickWidget(screen, 4, 3, "byte", 134)
         self.assertEqualDictKeyValue(w.contents, "direction", "down")
-        self.assertEqualDictKeyValue(w.contents, "ebit", "3")
-        self.assertEqualDictKeyValue(w.contents, "sbit", "0")
+        self.assertEqualDictKeyValue(w.contents, "ebit", 3)
+        self.assertEqualDictKeyValue(w.contents, "sbit", 0)
 
     def test_parse_medm_widget_cartesian_plot(self):
         screen = self.parseFile("beamHistory_full-R3-5.adl")
@@ -268,7 +741,7 @@ class Test_Files(unittest.TestCase):
 
         self.assertIsInstance(w.contents, dict)
         self.assertEqual(len(w.contents), 13)
-        self.assertEqualDictKeyValue(w.contents, "count", "1")
+        self.assertEqualDictKeyValue(w.contents, "count", 1)
         self.assertEqualDictKeyValue(w.contents, "erase", "")
         self.assertEqualDictKeyValue(w.contents, "eraseMode", "if not zero")
         self.assertEqualDictKeyValue(w.contents, "erase_oldest", "plot last n pts")
@@ -282,8 +755,8 @@ class Test_Files(unittest.TestCase):
         axis = w.contents[symbol]
         self.assertEqual(len(axis), 4)
         self.assertEqualDictKeyValue(axis, "axisStyle", "linear")
-        self.assertEqualDictKeyValue(axis, "maxRange", "1.000000")
-        self.assertEqualDictKeyValue(axis, "minRange", "0.000000")
+        self.assertEqualDictKeyValue(axis, "maxRange", 1.0)
+        self.assertEqualDictKeyValue(axis, "minRange", 0.0)
         self.assertEqualDictKeyValue(axis, "rangeStyle", "auto-scale")
 
         symbol = "y1_axis"
@@ -291,8 +764,8 @@ class Test_Files(unittest.TestCase):
         axis = w.contents[symbol]
         self.assertEqual(len(axis), 4)
         self.assertEqualDictKeyValue(axis, "axisStyle", "linear")
-        self.assertEqualDictKeyValue(axis, "maxRange", "1.000000")
-        self.assertEqualDictKeyValue(axis, "minRange", "0.000000")
+        self.assertEqualDictKeyValue(axis, "maxRange", 1.0)
+        self.assertEqualDictKeyValue(axis, "minRange", 0.0)
         self.assertEqualDictKeyValue(axis, "rangeStyle", "auto-scale")
 
         symbol = "y2_axis"
@@ -300,8 +773,8 @@ class Test_Files(unittest.TestCase):
         axis = w.contents[symbol]
         self.assertEqual(len(axis), 4)
         self.assertEqualDictKeyValue(axis, "axisStyle", "linear")
-        self.assertEqualDictKeyValue(axis, "maxRange", "1.000000")
-        self.assertEqualDictKeyValue(axis, "minRange", "0.000000")
+        self.assertEqualDictKeyValue(axis, "maxRange", 1.0)
+        self.assertEqualDictKeyValue(axis, "minRange", 0.0)
         self.assertEqualDictKeyValue(axis, "rangeStyle", "from channel")
 
         self.assertIn("traces", w.contents)
@@ -502,7 +975,7 @@ class Test_Files(unittest.TestCase):
         attr = w.contents["basic attribute"]
         self.assertIsInstance(attr, dict)
         self.assertEqual(len(attr), 1)
-        self.assertEqualDictKeyValue(attr, "width", "2")
+        self.assertEqualDictKeyValue(attr, "width", 2)
 
         self.assertHasAttribute(w, "points")
         self.assertEqual(len(w.points), 2)
@@ -577,7 +1050,7 @@ class Test_Files(unittest.TestCase):
         self.assertHasAttribute(w, "contents")
         self.assertIsInstance(w.contents, dict)
         self.assertEqual(len(w.contents), 3)
-        self.assertEqualDictKeyValue(w.contents, "period", "1.000000")
+        self.assertEqualDictKeyValue(w.contents, "period", 1.0)
         self.assertEqualDictKeyValue(w.contents, "units", "minute")
         pens = w.contents.get("pens")
         self.assertIsNotNone(pens)
@@ -649,7 +1122,7 @@ class Test_Files(unittest.TestCase):
         self.assertEqualGeometry(w, 52, 247, 100, 20)
         self.assertIsInstance(w.contents, dict)
         self.assertEqual(len(w.contents), 3)
-        self.assertEqualDictKeyValue(w.contents, "dPrecision", "0.010000")
+        self.assertEqualDictKeyValue(w.contents, "dPrecision", 0.01)
         self.assertIn("control", w.contents)
         control = w.contents["control"]
         self.assertEqual(len(control), 1)
@@ -667,9 +1140,9 @@ class Test_Files(unittest.TestCase):
         self.assertEqualDictKeyValue(w.contents, "hoprSrc", "default")
         self.assertEqualDictKeyValue(w.contents, "loprSrc", "default")
         self.assertEqualDictKeyValue(w.contents, "precSrc", "default")
-        self.assertEqualDictKeyValue(w.contents, "hoprDefault", "10")
-        self.assertEqualDictKeyValue(w.contents, "loprDefault", "-10")
-        self.assertEqualDictKeyValue(w.contents, "precDefault", "3")
+        self.assertEqualDictKeyValue(w.contents, "hoprDefault", 10.0)
+        self.assertEqualDictKeyValue(w.contents, "loprDefault", -10.0)
+        self.assertEqualDictKeyValue(w.contents, "precDefault", 3)
         control = w.contents["control"]
         self.assertEqual(len(control), 1)
         self.assertEqualDictKeyValue(control, "chan", "sky:userCalc2.A")
@@ -43,6 +43,63 @@ class TestSuite(unittest.TestCase):
             equal = rule == testcase[-1]
             self.assertEqual(rule, testcase[-1], testcase[0])
 
+    def test_calc_errors(self):
+        with self.assertRaises(ValueError):
+            calc2rules.convertCalcToRuleExpression("A+M")
+        # MEDM: values of channels A-D, E-L are (mostly) about channel A
+        for calc in ("E>F", "a+l", "H>1"):
+            with self.assertRaises(ValueError):
+                calc2rules.convertCalcToRule(calc)
+        with self.assertRaisesRegex(ValueError, "HOPR of channel A"):
+            calc2rules.convertCalcToRule("A>H")
+
+    def test_calc_channels(self):
+        rule = calc2rules.convertCalcToRule("C>1 && A")
+        self.assertEqual(rule.expression, "ch[2]>1 and ch[0]")
+        self.assertEqual(rule.channels, (0, 2))
+        self.assertEqual(rule.unreferencedChannels(4), (1, 3))
+
+        # simplified away
+        rule = calc2rules.convertCalcToRule("A||B||1")
+        self.assertEqual(rule.expression, "True")
+        self.assertEqual(rule.unreferencedChannels(2), (0, 1))
+
+    def test_rule_expression_tree(self):
+        # same tree with every supported Python version
+        tree = calc2rules.parseRuleExpression("ch[1]>-0.5")
+        self.assertEqual(calc2rules.referencedChannels(tree), (1,))
+        subscript = tree.body.left
+        self.assertIsInstance(subscript.slice, calc2rules.ast.Constant)
+        self.assertEqual(subscript.slice.value, 1)
+        self.assertEqual(calc2rules.formatRuleExpression(tree), "ch[1]>-0.5")
+
+    def test_no_huge_constants(self):
+        # not folded: would take (nearly) forever
+        rule = calc2rules.convertCalcToRule("9**9**9>A")
+        self.assertEqual(rule.expression, "9**9**9>ch[0]")
+        rule = calc2rules.convertCalcToRule("(1<<99999999999)+0*2>A")
+        self.assertEqual(rule.expression, "(1<<99999999999)+0>ch[0]")
+        self.assertEqual(rule.channels, (0,))
+
+    def test_calc_warnings(self):
+        # logged each time, not only when converted (not cached)
+        for i in range(2):
+            with self.assertLogs(calc2rules.logger, "WARNING") as log:
+                rule = calc2rules.convertCalcToRule("A?B:1")
+            self.assertEqual(len(rule.warnings), 1)
+            self.assertEqual(log.output, ["WARNING:adl2pydm.calc2rules:" + rule.warnings[0]])
+        self.assertIn("not a valid rule expression", rule.warnings[0])
+        self.assertEqual(calc2rules.convertCalcToRule("A#1").warnings, ())
+
+    def test_calc_cache(self):
+        convert = calc2rules.convertCalcToRuleExpression
+        calc2rules.translateCalc.cache_clear()
+        for i in range(3):
+            self.assertEqual(convert("A#1"), "ch[0]!=1")
+        info = calc2rules.translateCalc.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+        self.assertEqual(info.maxsize, calc2rules.CALC_CACHE_SIZE)
+
 
 def suite(*args, **kw):
     test_suite = unittest.TestSuite()
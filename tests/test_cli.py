@@ -76,6 +76,93 @@ class Test_Main(unittest.TestCase):
             uiname = os.path.splitext(fname)[0] + output_handler.SCREEN_FILE_EXTENSION
             self.assertTrue(os.path.exists(os.path.join(self.tempdir, uiname)))
 
+    def test_convert_in_memory(self):
+        for fname in self.test_files:
+            full_name = os.path.join(self.medm_path, fname)
+            if not os.path.exists(full_name):
+                continue
+            cli.processFile(full_name, self.tempdir)
+            with open(full_name, "rb") as f:
+                adl = f.read()
+
+            result = cli.convertAdlText(adl, fname)
+            uiname = os.path.join(self.tempdir, result.title + output_handler.SCREEN_FILE_EXTENSION)
+            with open(uiname, "rb") as f:
+                self.assertEqual(result.ui, f.read(), fname)
+            text = cli.convertAdlText(adl.decode(), fname)
+            self.assertEqual(text.ui, result.ui, fname)
+
+        root = result.elementTree().getroot()
+        self.assertEqual(root.tag, "ui")
+        self.assertEqual(root.find("widget").attrib["name"], "screen")
+
+        # a calc warned about each time
+        calc_adl = """
+display {
+	object {
+		x=0
+		y=0
+		width=100
+		height=100
+	}
+}
+rectangle {
+	object {
+		x=10
+		y=10
+		width=20
+		height=20
+	}
+	"basic attribute" {
+		clr=14
+	}
+	"dynamic attribute" {
+		vis="calc"
+		calc="A?B:1"
+		chan="$(P)a"
+	}
+}
+"""
+
+        # warnings are returned, not only logged
+        package_logger = logging.getLogger("adl2pydm")
+        level, propagate = package_logger.level, package_logger.propagate
+        package_logger.setLevel(logging.WARNING)
+        package_logger.propagate = False
+        try:
+            full_name = os.path.join(self.medm_path, "userArrayCalcPlot.adl")
+            with open(full_name, "r") as f:
+                result = cli.convertAdlText(f.read())
+            first = cli.convertAdlText(calc_adl)
+            second = cli.convertAdlText(calc_adl)
+        finally:
+            package_logger.setLevel(level)
+            package_logger.propagate = propagate
+        self.assertEqual(result.title, "screen")
+        self.assertGreater(len(result.warnings), 0)
+        self.assertIn("ignoring cartesian plot count=", result.warnings[0])
+        self.assertNotIn(
+            cli._WarningCollector, map(type, package_logger.handlers))
+
+        # the same warnings each time
+        self.assertEqual(second.warnings, first.warnings)
+        self.assertTrue(
+            any("not a valid rule expression" in w for w in second.warnings))
+
+        # no file is looked up (such as the stylesheet)
+        resolver = output_handler.sharedDisplayPathResolver()
+
+        def findFile(fname):
+            raise AssertionError(f"looked up {fname}")
+
+        resolver.findFile = findFile
+        try:
+            self.assertEqual(cli.convertAdlText(adl, fname).ui, text.ui)
+            with self.assertRaises(AssertionError):
+                cli.convertAdlText(adl, fname, stylesheet=None)
+        finally:
+            del resolver.findFile
+
 
 def suite(*args, **kw):
     test_suite = unittest.TestSuite()
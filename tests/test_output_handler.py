@@ -3,12 +3,14 @@
 simple unit tests for this package
 """
 
+import io
 import logging
 import os
 import shutil
 import sys
 import tempfile
 import unittest
+from xml.dom import minidom
 from xml.etree import ElementTree
 
 # turn off logging output
@@ -19,7 +21,7 @@ _path = os.path.join(_test_path, '..', 'src')
 if _path not in sys.path:
     sys.path.insert(0, _path)
 
-from adl2pydm import cli, output_handler
+from adl2pydm import adl_parser, calc2rules, cli, output_handler, symbols
 
 
 class TestOutputHandler(unittest.TestCase):
@@ -470,6 +472,33 @@ class TestOutputHandler(unittest.TestCase):
         # self.print_xml_children(widget)
         self.assertEqual(len(widget), 6)
 
+    def test_write_widget_composite_nested(self):
+        # MEDM geometry is absolute, PyDM geometry is relative to the parent
+        uiname = self.convertAdlFile("userArrayCalc.adl")
+        full_uiname = os.path.join(self.tempdir, uiname)
+        root = ElementTree.parse(full_uiname).getroot()
+        screen = self.getSubElement(root, "widget")
+
+        def geometry(widget):
+            rect = self.getSubElement(self.getNamedProperty(widget, "geometry"), "rect")
+            return [int(e.text) for e in rect]
+
+        outer = self.getNamedWidget(screen, "composite_1")
+        self.assertEqual(geometry(outer), [70, 333, 70, 20])
+        middle = self.getNamedWidget(outer, "composite_2")
+        self.assertEqual(geometry(middle), [0, 0, 40, 20])
+        inner = self.getNamedWidget(middle, "composite_3")
+        self.assertEqual(geometry(inner), [0, 0, 40, 20])
+        self.assertEqual(geometry(self.getNamedWidget(inner, "text_18")), [0, 10, 40, 10])
+
+        # points are relative to their own widget
+        composite = self.getNamedWidget(screen, "composite")
+        widget = self.getNamedWidget(composite, "polyline_10")
+        self.assertEqual(geometry(widget), [9, 5, 6, 2])
+        prop = self.getNamedProperty(widget, "points")
+        strings = self.getSubElement(prop, "stringlist").findall("string")
+        self.assertEqual([e.text for e in strings], ["-1, -1", "3, -1"])
+
     def test_write_widget_embedded_display(self):
         # Actually. MEDM writes as a composite
         # but we redirect (in the output_handler module) 
@@ -1157,7 +1186,8 @@ class TestOutputHandler(unittest.TestCase):
         self.assertEqualChannel(widget, "ca://sky:m1")
         self.assertEqualPropertyString(widget, "orientation", "Qt::Horizontal")
         # precision must be an integer for the slider widget
-        self.assertEqualPropertyNumber(widget, "precision", 1)
+        # dPrecision=1.000000: no decimals
+        self.assertEqualPropertyNumber(widget, "precision", 0, dtype=int)
         for propName in """showLimitLabels 
                            showValueLabel 
                            userDefinedLimits
@@ -1204,7 +1234,8 @@ class TestOutputHandler(unittest.TestCase):
 
         self.assertEqualChannel(widget, "ca://sky:userCalc2.A")
         self.assertEqualPropertyString(widget, "orientation", "Qt::Horizontal")
-        self.assertEqualPropertyNumber(widget, "precision", 0.1)
+        # dPrecision=0.100000: 1 decimal
+        self.assertEqualPropertyNumber(widget, "precision", 1, dtype=int)
         # self.print_xml_children(widget)
         self.assertEqualPropertyBool(widget, "userDefinedLimits", True)
         self.assertEqualPropertyDouble(widget, "userMaximum", 10)
@@ -1300,6 +1331,50 @@ class TestOutputHandler(unittest.TestCase):
         self.assertIn("PyDMDrawingPie", customs)
         self.assertIn("PyDMDrawingArc", customs)
 
+    def test_customwidgets_cached(self):
+        items = tuple(
+            symbols.pydm_widgets[k]
+            for k in ("PyDMDrawingPie", "PyDMDrawingArc"))
+        element = output_handler.customWidgetsElement(items)
+        self.assertIs(output_handler.customWidgetsElement(items), element)
+        self.assertIsInstance(element, output_handler.CachedElement)
+
+        parts = []
+        output_handler.writeXmlElement(parts.append, element, "", "  ", "\n")
+        text = "".join(parts)
+        self.assertEqual(
+            text,
+            minidom.parseString(ElementTree.tostring(element)).documentElement.toprettyxml(indent="  "))
+        self.assertEqual(list(element.fragments.values()), [text])
+        self.assertEqual(text.count("<customwidget>"), 2)
+
+    def test_register_widget_handler(self):
+        self.assertIsInstance(output_handler.pydm_widget_handlers["text"], str)
+        with self.assertRaises(TypeError):
+            output_handler.pydm_widget_handlers["text"] = None
+
+        def write_block_text(writer, parent, block, nm, qw):
+            writer.write_tooltip(qw, "site text: " + block.title)
+
+        original = output_handler.getPydmWidgetHandler("text")
+        output_handler.registerPydmWidgetHandler("text", write_block_text)
+        try:
+            uiname = self.convertAdlFile("ADBase-R3-3-1.adl")
+        finally:
+            output_handler.registerPydmWidgetHandler("text", original)
+        self.assertEqual(output_handler.getPydmWidgetHandler("text"), original)
+
+        root = ElementTree.parse(os.path.join(self.tempdir, uiname)).getroot()
+        screen = self.getSubElement(root, "widget")
+        widget = self.getNamedWidget(screen, "text")
+        self.assertEqualClassName(widget, "PyDMLabel", "text")
+        self.assertEqualToolTip(widget, "site text: Area Detector Control - $(P)$(R)")
+        self.assertIsNoneProperty(widget, "text")
+
+        with self.assertRaises(ValueError):
+            # unknown symbol needs a PyDM widget class
+            output_handler.registerPydmWidgetHandler("unknown", write_block_text)
+
     # ----------------------------------------------------------
 
     def test_write_all_example_files_process(self):
@@ -1394,6 +1469,266 @@ class Test_PYDM_Writer_Support(unittest.TestCase):
             )
         self.assertEqual(len(buf), len(expected))
 
+    def test_display_path_resolver(self):
+        paths = [os.path.join(self.tempdir, nm) for nm in "ab"]
+        for path in paths:
+            os.mkdir(path)
+        sfile = os.path.join(paths[1], output_handler.QT_STYLESHEET_FILE)
+        with open(sfile, "w") as f:
+            f.write("QLabel {}")
+
+        saved = os.environ.get(output_handler.ENV_PYDM_DISPLAYS_PATH)
+        os.environ[output_handler.ENV_PYDM_DISPLAYS_PATH] = os.pathsep.join(paths)
+        try:
+            resolver = output_handler.DisplayPathResolver(check_interval=1000)
+            found = resolver.findFile(output_handler.QT_STYLESHEET_FILE)
+            self.assertEqual(found, sfile)
+            self.assertEqual(resolver.readFile(found), "QLabel {}")
+            self.assertIsNone(resolver.findFile("missing.qss"))
+
+            writer = output_handler.PYDM_Writer(None, resolver=resolver)
+            writer.openFile(io.StringIO())
+            self.assertEqual(writer.stylesheet, "QLabel {}")
+
+            # cached: not listed nor read again
+            os.remove(sfile)
+            self.assertEqual(resolver.findFile(output_handler.QT_STYLESHEET_FILE), sfile)
+            self.assertEqual(resolver.readFile(sfile), "QLabel {}")
+
+            # checked again, changed modification time
+            resolver.check_interval = 0
+            self.assertIsNone(resolver.findFile(output_handler.QT_STYLESHEET_FILE))
+            with open(sfile, "w") as f:
+                f.write("QFrame {}")
+            os.utime(paths[1], ns=(1, 1))
+            os.utime(sfile, ns=(2, 2))
+            self.assertEqual(resolver.findFile(output_handler.QT_STYLESHEET_FILE), sfile)
+            self.assertEqual(resolver.readFile(sfile), "QFrame {}")
+        finally:
+            if saved is None:
+                del os.environ[output_handler.ENV_PYDM_DISPLAYS_PATH]
+            else:
+                os.environ[output_handler.ENV_PYDM_DISPLAYS_PATH] = saved
+
+    def test_unique_widget_names(self):
+        writer = output_handler.Widget2Pydm()
+        names = [writer.get_unique_widget_name("rectangle") for i in range(100000)]
+        self.assertEqual(names[:3], ["rectangle", "rectangle_1", "rectangle_2"])
+        self.assertEqual(len(set(names)), len(names))
+        # one counter per suggestion, not a list of names
+        self.assertEqual(writer.unique_widget_names, dict(rectangle=100000))
+
+        # names chosen explicitly, before or after
+        writer = output_handler.Widget2Pydm()
+        suggestions = "text_2 text text text text_1 text text_1 text_1_1 text_1".split()
+        names = [writer.get_unique_widget_name(s) for s in suggestions]
+        self.assertEqual(
+            names,
+            "text_2 text text_1 text_3 text_1_1 text_4 text_1_2 text_1_1_1 text_1_3".split(),
+        )
+
+    def test_ui_file_writes(self):
+        medm_path = os.path.join(os.path.dirname(__file__), "medm")
+        adl_file = os.path.abspath(os.path.join(medm_path, "rectangle.adl"))
+        uiname = os.path.join(self.tempdir, "rectangle.ui")
+        cli.processFile(adl_file, self.tempdir)
+        self.assertEqual(os.listdir(self.tempdir), ["rectangle.ui"])
+        os.utime(uiname, ns=(1, 1))
+
+        # same content: not written again
+        writer = output_handler.Widget2Pydm()
+        screen = cli.adl_parser.MedmMainWidget(adl_file)
+        screen.parseAdlFile()
+        writer.write_ui(screen, self.tempdir)
+        self.assertTrue(writer.writer.unchanged)
+        self.assertEqual(os.stat(uiname).st_mtime_ns, 1)
+
+        # changed content: replaced
+        writer = output_handler.Widget2Pydm(pretty=False)
+        writer.write_ui(screen, self.tempdir)
+        self.assertFalse(writer.writer.unchanged)
+        self.assertNotEqual(os.stat(uiname).st_mtime_ns, 1)
+        with open(uiname, "rb") as f:
+            compact = f.read()
+
+        # error while writing: existing file kept, no temporary file left
+        screen.widgets.append(object())
+        with self.assertRaises(AttributeError):
+            writer.write_ui(screen, self.tempdir)
+        self.assertEqual(os.listdir(self.tempdir), ["rectangle.ui"])
+        with open(uiname, "rb") as f:
+            self.assertEqual(f.read(), compact)
+
+        # another .adl file with the same name, in the same run:
+        # another .ui file, each time
+        other = os.path.join(self.tempdir, "other")
+        os.mkdir(other)
+        shutil.copy(adl_file, other)
+        other_adl = os.path.join(other, "rectangle.adl")
+        ui_names = output_handler.UiFileNames()
+        for fname in (adl_file, other_adl, other_adl, adl_file):
+            cli.processFile(fname, self.tempdir, ui_names=ui_names)
+        names = sorted(n for n in os.listdir(self.tempdir) if n.endswith(".ui"))
+        self.assertEqual(len(names), 2)
+        self.assertRegex(names[0], r"^rectangle-[0-9a-f]{8}\.ui$")
+
+        # the same .adl file, by another path (symbolic link)
+        link = os.path.join(self.tempdir, "link")
+        os.symlink(os.path.dirname(adl_file), link)
+        linked = os.path.join(link, "rectangle.adl")
+        self.assertEqual(ui_names.claim(linked, uiname), uiname)
+
+        # not recorded: a later run gives the plain name to any .adl file
+        self.assertEqual(output_handler.UiFileNames().claim(other_adl, uiname), uiname)
+        self.assertIsNone(output_handler.uiFileSource(uiname))
+
+    def test_ui_file_source_record(self):
+        medm_path = os.path.join(os.path.dirname(__file__), "medm")
+        adl_file = os.path.realpath(os.path.join(medm_path, "rectangle.adl"))
+        other_adl = os.path.join(self.tempdir, "rectangle.adl")
+        shutil.copy(adl_file, other_adl)
+        uiname = os.path.join(self.tempdir, "rectangle.ui")
+        record = os.path.join(self.tempdir, ".rectangle.ui.source")
+
+        claim = output_handler.UiFileNames(record=True).claim
+        self.assertEqual(claim(adl_file, uiname), uiname)
+        self.assertEqual(output_handler.uiFileSource(uiname), adl_file)
+
+        # later runs (or other processes) keep the recorded names
+        claim = output_handler.UiFileNames(record=True).claim
+        self.assertNotEqual(claim(other_adl, uiname), uiname)
+        self.assertEqual(claim(adl_file, uiname), uiname)
+
+        # as recorded by another process
+        os.remove(record)
+        with open(record, "w") as f:
+            f.write(os.path.realpath(other_adl))
+        claim = output_handler.UiFileNames(record=True).claim
+        self.assertEqual(claim(other_adl, uiname), uiname)
+        self.assertNotEqual(claim(adl_file, uiname), uiname)
+
+    def test_streamed_xml(self):
+        def write(pretty):
+            buf = io.StringIO()
+            writer = output_handler.PYDM_Writer(None, pretty=pretty)
+            root = writer.openFile(buf)
+            writer.writeTaggedString(root, "class", "Dialog")
+            form = writer.writeOpenTag(root, "widget", cls="QWidget", name="screen")
+            for i in range(3):
+                qw = writer.writeOpenTag(form, "widget", cls="PyDMLabel", name=f"text_{i}")
+                writer.writeProperty(qw, "text", 'a < b & "c"', notr="true")
+                writer.writeTaggedString(qw, "empty", "")
+                writer.flush(form)
+                self.assertEqual(len(form), 0)  # released
+            writer.writeTaggedString(form, "last")
+            writer.writeOpenTag(root, "customwidgets")
+            writer.closeFile()
+            return buf.getvalue()
+
+        # same XML, without streaming
+        root = ElementTree.Element("ui", attrib=dict(version="4.0"))
+        ElementTree.SubElement(root, "class").text = "Dialog"
+        form = ElementTree.SubElement(root, "widget", {"class": "QWidget", "name": "screen"})
+        for i in range(3):
+            qw = ElementTree.SubElement(form, "widget", {"class": "PyDMLabel", "name": f"text_{i}"})
+            prop = ElementTree.SubElement(qw, "property", name="text", notr="true")
+            ElementTree.SubElement(prop, "string").text = 'a < b & "c"'
+            ElementTree.SubElement(qw, "empty").text = ""
+        ElementTree.SubElement(form, "last")
+        ElementTree.SubElement(root, "customwidgets")
+        dom = minidom.parseString(ElementTree.tostring(root))
+
+        self.assertEqual(write(True), dom.toprettyxml(indent=" "*2))
+        self.assertEqual(write(False), dom.toxml())
+        self.assertIn('  <widget class="QWidget" name="screen">\n', write(True))
+        self.assertIn("<empty/>", write(False))
+
+    def test_write_reused_widgets(self):
+        # widgets kept by incremental parsing are written again
+        medm_path = os.path.join(os.path.dirname(__file__), "medm")
+        full_name = os.path.join(medm_path, "motorx_all-R6-10-1.adl")
+        with open(full_name, "rb") as fp:
+            data = fp.read()
+
+        def convert(screen):
+            buf = io.StringIO()
+            output_handler.Widget2Pydm().write_ui(screen, None, ui_file=buf)
+            return buf.getvalue()
+
+        expected = adl_parser.MedmMainWidget(full_name)
+        expected.parseAdlBuffer(data)
+        expected = convert(expected)
+
+        screen = adl_parser.MedmMainWidget(full_name)
+        screen.parseAdlBufferIncrementally(data)
+        self.assertEqual(convert(screen), expected)
+        self.assertEqual(screen.parseAdlBufferIncrementally(data + b"\n"), 0)
+        self.assertEqual(convert(screen), expected)
+
+    def test_increment_decimals(self):
+        decimals = output_handler.incrementDecimals
+        self.assertEqual(decimals(1.0), 0)
+        self.assertEqual(decimals(10), 0)
+        self.assertEqual(decimals(0.1), 1)
+        self.assertEqual(decimals(0.25), 2)
+        self.assertEqual(decimals(0.01), 2)
+
+    def test_rule_channels(self):
+        convert = output_handler.convertDynamicAttribute_to_Rules
+        attr = dict(chan="$(P)a", chanB="$(P)b", chanC="$(P)c", vis="if zero")
+        rule = convert(attr)[0]
+        self.assertEqual(rule["expression"], "ch[0]==0")
+        self.assertEqual(rule["channels"], [dict(channel="${P}a", trigger=True)])
+
+        attr.update(vis="calc", calc="C>B")
+        rule = convert(attr)[0]
+        self.assertEqual(rule["expression"], "ch[1]>ch[0]")
+        self.assertEqual(
+            [ch["channel"] for ch in rule["channels"]], ["${P}b", "${P}c"])
+
+        # same PV, one channel
+        attr.update(chanC="$(P)b", calc="B=1 && C=1")
+        rule = convert(attr)[0]
+        self.assertEqual(rule["expression"], "ch[0]==1 and ch[0]==1")
+        self.assertEqual(rule["channels"], [dict(channel="${P}b", trigger=True)])
+
+        # constant expression, evaluated once channel A connects
+        attr.update(calc="1 || B")
+        rule = convert(attr)[0]
+        self.assertEqual(rule["expression"], "True")
+        self.assertEqual(rule["channels"], [dict(channel="${P}a", trigger=True)])
+
+    def test_rule_channels_kept(self):
+        convert = output_handler.convertDynamicAttribute_to_Rules
+        minimize = output_handler.minimizeRuleChannels
+        pvs = {0: "X", 1: "Y"}
+
+        # referenced channels not known: all kept, rule not changed
+        calc_rule = calc2rules.CalcRule("ch[0]>1 and ch[1]<2", ())
+        channels, rule = minimize(calc_rule, pvs)
+        self.assertEqual([ch["channel"] for ch in channels], ["X", "Y"])
+        self.assertIs(rule, calc_rule)
+
+        # channel A has no PV
+        with self.assertLogs(output_handler.logger, "WARNING"):
+            rule = convert(dict(chanB="Y", vis="if zero"))[0]
+        self.assertEqual(rule["expression"], "ch[0]==0")
+        self.assertEqual(rule["channels"], [dict(channel="Y", trigger=True)])
+
+        with self.assertLogs(output_handler.logger, "WARNING"):
+            rule = convert(dict(chan="X", chanC="Z", vis="calc", calc="B>0"))[0]
+        self.assertEqual(rule["expression"], "ch[1]>0")
+        self.assertEqual(
+            [ch["channel"] for ch in rule["channels"]], ["X", "Z"])
+
+    def test_rule_not_converted(self):
+        convert = output_handler.convertDynamicAttribute_to_Rules
+        # MEDM's H is the HOPR of channel A, not available to a PyDM rule
+        attr = dict(chan="$(P)a", vis="calc", calc="A>H")
+        with self.assertLogs(output_handler.logger, "WARNING") as log:
+            self.assertEqual(convert(attr), [])
+        self.assertIn("HOPR of channel A", log.output[0])
+
 
 def suite(*args, **kw):
     test_suite = unittest.TestSuite()
@@ -0,0 +1,179 @@
+
+"""
+unit tests of the parse cache
+"""
+
+import concurrent.futures
+import contextlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# turn off logging output
+logging.basicConfig(level=logging.CRITICAL)
+
+_test_path = os.path.dirname(__file__)
+_path = os.path.join(_test_path, '..', 'src')
+if _path not in sys.path:
+    sys.path.insert(0, _path)
+
+from adl2pydm import adl_parser, cli, output_handler, parse_cache
+
+
+class Test_ParseCache(unittest.TestCase):
+
+    test_files = [
+        "xxx-R5-8-4.adl",                  # related display
+        "scanDetPlot-R2-11-1.adl",         # cartesian plot, strip
+        "ADBase-R3-3-1.adl",               # composite
+        ]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, "cache")
+        self.medm_path = os.path.join(os.path.dirname(__file__), "medm")
+
+    def tearDown(self):
+        if os.path.exists(self.tempdir):
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def walk(self, widgets):
+        for w in widgets:
+            yield w
+            yield from self.walk(getattr(w, "widgets", []))
+
+    def test_hit_and_miss(self):
+        cache = parse_cache.ParseCache(self.cache_dir)
+        for fname in self.test_files:
+            full_name = os.path.join(self.medm_path, fname)
+            expected = adl_parser.MedmMainWidget(full_name, structured=True)
+            expected.parseAdlFile()
+
+            first = cache.parseAdlFile(full_name)
+            second = cache.parseAdlFile(full_name)
+            self.assertIsNot(first, second)
+            self.assertTrue(second.structured)
+            self.assertEqual(second.given_filename, full_name)
+            self.assertEqual(second.color_table, expected.color_table)
+            self.assertEqual(second.geometry, expected.geometry)
+            widgets = list(self.walk(second.widgets))
+            self.assertEqual(len(widgets), len(list(self.walk(expected.widgets))))
+            for w, e in zip(widgets, self.walk(expected.widgets)):
+                self.assertEqual(w.symbol, e.symbol)
+                self.assertEqual(w.line_offset, e.line_offset)
+                self.assertEqual(w.geometry, e.geometry)
+                self.assertEqual(w.color, e.color)
+                self.assertEqual(w.contents, e.contents)
+                self.assertIs(w.main, second)
+        self.assertEqual(cache.misses, len(self.test_files))
+        self.assertEqual(cache.hits, len(self.test_files))
+        self.assertEqual(len(cache.entries()), len(self.test_files))
+
+    def test_changed_content(self):
+        fname = os.path.join(self.tempdir, "screen.adl")
+        shutil.copy(os.path.join(self.medm_path, "xxx-R6-0.adl"), fname)
+        cache = parse_cache.ParseCache(self.cache_dir)
+        cache.parseAdlFile(fname)
+        with open(fname, "a") as fp:
+            fp.write("\n")
+        cache.parseAdlFile(fname)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache.entries()), 2)
+
+        # unreadable entries are parsed again
+        for mtime, size, path in cache.entries():
+            with open(path, "wb") as fp:
+                fp.write(b"not a pickle")
+        screen = cache.parseAdlFile(fname)
+        self.assertEqual(cache.misses, 3)
+        self.assertGreater(len(screen.widgets), 0)
+
+    def test_eviction(self):
+        cache = parse_cache.ParseCache(self.cache_dir)
+        for fname in self.test_files:
+            cache.parseAdlFile(os.path.join(self.medm_path, fname))
+        sizes = [size for mtime, size, path in cache.entries()]
+
+        # only the least recently used is removed
+        lru = cache.entries()[0][2]
+        os.utime(lru, (0, 0))
+        cache.max_size = sum(sizes) - 1
+        cache.evict()
+        self.assertEqual(len(cache.entries()), len(self.test_files) - 1)
+        self.assertFalse(os.path.exists(lru))
+
+        cache.max_size = 0
+        cache.evict()
+        self.assertEqual(len(cache.entries()), 0)
+
+    def test_processFile(self):
+        cache = parse_cache.ParseCache(self.cache_dir)
+        fname = os.path.join(self.medm_path, "ADBase-R3-3-1.adl")
+        uiname = os.path.join(
+            self.tempdir,
+            "ADBase-R3-3-1" + output_handler.SCREEN_FILE_EXTENSION)
+        contents = []
+        for i in range(2):
+            cli.processFile(fname, self.tempdir, cache=cache)
+            with open(uiname, "r") as fp:
+                contents.append(fp.read())
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(contents[0], contents[1])
+
+    def test_processFile_options(self):
+        fname = os.path.join(self.medm_path, "ADBase-R3-3-1.adl")
+        uiname = os.path.join(
+            self.tempdir,
+            "ADBase-R3-3-1" + output_handler.SCREEN_FILE_EXTENSION)
+        cli.processFile(fname, self.tempdir)
+        with open(uiname, "r") as fp:
+            expected = fp.read()
+
+        # a cache miss is parsed by the executor
+        cache = parse_cache.ParseCache(self.cache_dir)
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            cli.processFile(fname, self.tempdir, cache=cache, executor=executor)
+        self.assertEqual(cache.misses, 1)
+        with open(uiname, "r") as fp:
+            self.assertEqual(fp.read(), expected)
+
+        with self.assertRaises(ValueError):
+            cli.processFile(fname, self.tempdir, use_mmap=True, cache=cache)
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            with self.assertRaises(ValueError):
+                cli.processFile(fname, self.tempdir, use_mmap=True, executor=executor)
+            screen = adl_parser.MedmMainWidget(fname)
+            with self.assertRaises(ValueError):
+                screen.parseAdlFile(use_mmap=True, executor=executor)
+        self.assertEqual(cache.misses + cache.hits, 1)
+
+        argv = sys.argv
+        try:
+            for options in (["--cache"], ["--cache-dir", self.cache_dir], ["--workers", "2"]):
+                sys.argv = [argv[0], "--mmap"] + options + [fname]
+                with self.assertRaises(SystemExit):
+                    with contextlib.redirect_stderr(io.StringIO()):
+                        cli.get_user_parameters()
+            sys.argv = [argv[0], "--mmap", "--workers", "1", fname]
+            self.assertTrue(cli.get_user_parameters().mmap)
+        finally:
+            sys.argv = argv
+
+
+def suite(*args, **kw):
+    test_suite = unittest.TestSuite()
+    test_list = [
+        Test_ParseCache,
+        ]
+    for test_case in test_list:
+        test_suite.addTest(unittest.makeSuite(test_case))
+    return test_suite
+
+
+if __name__ == "__main__":
+    runner=unittest.TextTestRunner()
+    runner.run(suite())
@@ -0,0 +1,121 @@
+
+"""
+unit tests of the offline rule benchmark
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# turn off logging output
+logging.basicConfig(level=logging.CRITICAL)
+
+_test_path = os.path.dirname(__file__)
+_path = os.path.join(_test_path, '..', 'src')
+if _path not in sys.path:
+    sys.path.insert(0, _path)
+
+from adl2pydm import adl_parser, calc2rules, cli, rule_benchmark
+
+
+class Test_RuleBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.medm_path = os.path.join(os.path.dirname(__file__), "medm")
+
+    def tearDown(self):
+        if os.path.exists(self.tempdir):
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_ui_rules(self):
+        adl_file = os.path.join(self.medm_path, "rectangle.adl")
+        cli.processFile(adl_file, self.tempdir)
+        ui_file = os.path.join(self.tempdir, "rectangle.ui")
+        rules = rule_benchmark.readUiRules(ui_file)
+        self.assertEqual(len(rules), 2)
+        self.assertEqual(rules[0].widget, "rectangle_3")
+        self.assertEqual(rules[0].expression, "ch[0]==0")
+        self.assertEqual(len(rules[1].channels), 2)
+
+        # same rules from the parsed screen
+        screen = adl_parser.MedmMainWidget(adl_file)
+        screen.parseAdlFile()
+        from_screen = rule_benchmark.screenRules(screen)
+        self.assertEqual(
+            [(r.expression, r.channels) for r in from_screen],
+            [(r.expression, r.channels) for r in rules],
+        )
+        self.assertTrue(from_screen[0].widget.startswith("rectangle (line "))
+
+        stats = rule_benchmark.benchmarkRules(rules, updates=100, seed=1)
+        self.assertEqual(len(stats), 2)
+        for s in stats:
+            self.assertEqual(s.updates, 100)
+            self.assertEqual(s.errors, 0)
+            self.assertGreater(s.evaluations, 90)
+        again = rule_benchmark.benchmarkRules(rules, updates=100, seed=1)
+        self.assertEqual(
+            [s.evaluations for s in again], [s.evaluations for s in stats])
+
+        text = rule_benchmark.report(stats, top=1)
+        self.assertIn("evaluations per second:", text)
+        self.assertIn("most expensive widgets (top 1):", text)
+
+    def test_simulate_rule(self):
+        WidgetRule = rule_benchmark.WidgetRule
+        simulate = rule_benchmark.simulateRule
+
+        # only the triggering channel evaluates the rule
+        rule = WidgetRule(
+            "w", "visibility", "ch[0]>ch[1]",
+            [dict(channel="a", trigger=True), dict(channel="b", trigger=False)])
+        s = simulate(rule, updates=1000)
+        self.assertLess(s.evaluations, 1000)
+        self.assertGreater(s.evaluations, 0)
+
+        # a PV used by two triggering channels evaluates the rule twice
+        rule = WidgetRule(
+            "w", "visibility", "ch[0]==ch[1]",
+            [dict(channel="a", trigger=True), dict(channel="a", trigger=True)])
+        s = simulate(rule, updates=100)
+        self.assertEqual(s.evaluations, 199)
+
+        # never connects
+        rule = WidgetRule(
+            "w", "visibility", "ch[0]", [dict(channel="", trigger=False)])
+        self.assertEqual(simulate(rule, updates=100).evaluations, 0)
+
+        # errors are counted, as PyDM logs them
+        rule = WidgetRule(
+            "w", "visibility", "1/(ch[0]-ch[0])", [dict(channel="a", trigger=True)])
+        s = simulate(rule, updates=10)
+        self.assertEqual((s.evaluations, s.errors), (10, 10))
+
+        # a rule that does not compile is skipped, as PyDM does
+        expression = calc2rules.convertCalcToRuleExpression("A?B:1")
+        bad = WidgetRule(
+            "w", "visibility", expression, [dict(channel="a", trigger=True)])
+        good = WidgetRule(
+            "w", "visibility", "ch[0]", [dict(channel="a", trigger=True)])
+        stats = rule_benchmark.benchmarkRules([bad, good], updates=10)
+        self.assertEqual([s.errors for s in stats], [1, 0])
+        self.assertEqual([s.evaluations for s in stats], [0, 10])
+
+
+def suite(*args, **kw):
+    test_suite = unittest.TestSuite()
+    test_list = [
+        Test_RuleBenchmark,
+        ]
+    for test_case in test_list:
+        test_suite.addTest(unittest.makeSuite(test_case))
+    return test_suite
+
+
+if __name__ == "__main__":
+    runner=unittest.TextTestRunner()
+    runner.run(suite())
@@ -51,6 +51,25 @@ class Test_Module(unittest.TestCase):
         self.assertEqual(w.extends, "QLabel")
         self.assertEqual(w.header, "pydm.widgets.label")
 
+    def test_pydm_widget_ancestors(self):
+        self.assertEqual(
+            set(symbols.pydm_widget_ancestors), set(symbols.pydm_widgets))
+        self.assertEqual(
+            symbols.pydm_widget_ancestors["PyDMDrawingPie"],
+            ("PyDMDrawingArc",))
+        self.assertEqual(symbols.pydm_widget_ancestors["PyDMDrawingArc"], ())
+        self.assertEqual(symbols.pydm_widget_ancestors["PyDMLabel"], ())
+        self.assertEqual(symbols.pydmWidgetAncestors("QLabel"), ())
+
+        self.assertEqual(
+            symbols.pydmCustomWidgetClasses(
+                ["PyDMDrawingPie", "PyDMLabel", "PyDMDrawingChord"]),
+            ["PyDMDrawingPie", "PyDMLabel", "PyDMDrawingChord", "PyDMDrawingArc"])
+        self.assertEqual(
+            symbols.pydmCustomWidgetClasses(["PyDMDrawingArc", "PyDMDrawingPie"]),
+            ["PyDMDrawingArc", "PyDMDrawingPie"])
+        self.assertEqual(symbols.pydmCustomWidgetClasses([]), [])
+
 
 
 def suite(*args, **kw):